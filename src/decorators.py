@@ -2,12 +2,13 @@
 Декораторы
 """
 
-import time
 from functools import wraps
 from typing import Any, Callable
 
 import prompt
 
+_CONFIRM_POLICY: bool | None = None #None - спрашивать пользователя, True/False - готовый ответ
+
 #Декоратор для автоматической обработки исключений
 def handle_db_errors(func: Callable[..., Any]) -> Callable[..., Any]:
     @wraps(func)
@@ -32,16 +33,25 @@ def handle_db_errors(func: Callable[..., Any]) -> Callable[..., Any]:
 
     return wrapper
 
+#Ответ на подтверждения без вопроса (пакетный режим: --yes или отказ по умолчанию)
+def set_confirm_policy(answer: bool | None) -> None:
+    global _CONFIRM_POLICY
+    _CONFIRM_POLICY = answer
+
 #Фабрика декораторов
 def confirm_action(action_name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
     def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
         @wraps(func)
         def wrapper(*args: Any, **kwargs: Any) -> Any:
-            answer = prompt.string(
-                f'Вы уверены, что хотите выполнить "{action_name}"? [y/n]: '
-            ).strip().lower()
+            if _CONFIRM_POLICY is None:
+                answer = prompt.string(
+                    f'Вы уверены, что хотите выполнить "{action_name}"? [y/n]: '
+                ).strip().lower()
+                confirmed = answer == "y"
+            else:
+                confirmed = _CONFIRM_POLICY
 
-            if answer != "y":
+            if not confirmed:
                 print("Операция отменена.")
                 return None
 
@@ -50,28 +60,3 @@ def confirm_action(action_name: str) -> Callable[[Callable[..., Any]], Callable[
         return wrapper
 
     return decorator
-
-#Замер времени выполнения функции
-def log_time(func: Callable[..., Any]) -> Callable[..., Any]:
-    @wraps(func)
-    def wrapper(*args: Any, **kwargs: Any) -> Any:
-        start = time.monotonic()
-        result = func(*args, **kwargs)
-        end = time.monotonic()
-        print(f"Функция {func.__name__} выполнилась за {end - start:.3f} секунд.")
-        return result
-
-    return wrapper
-
-#Функция с замыканием для кэширования
-def create_cacher() -> Callable[[Any, Callable[[], Any]], Any]:
-    cache: dict[Any, Any] = {}
-
-    def cache_result(key: Any, value_func: Callable[[], Any]) -> Any:
-        if key in cache:
-            return cache[key]
-        value = value_func()
-        cache[key] = value
-        return value
-
-    return cache_result
\ No newline at end of file
@@ -0,0 +1,294 @@
+"""
+Агрегаты select: count, sum, avg, min, max с group by. Строки проходятся один раз,
+на каждую группу хранится только счетчик, сумма, минимум и максимум
+"""
+
+from collections import Counter
+from typing import Any, Iterable
+
+from .columnar import MISSING, BoolColumn, ColumnarTable, IntColumn, StrColumn, bits_mask, masked_chunks
+from .index import TableIndexes
+from .schema import DbValueError, Schema
+
+FUNCTIONS = ("count", "sum", "avg", "min", "max")
+_NUMERIC = {"int", "bool"} #sum и avg - только по числам (bool считается как 0/1)
+
+
+class Aggregate:
+    """Агрегат из списка select: функция и столбец (None - count(*))"""
+
+    __slots__ = ("func", "column")
+
+    def __init__(self, func: str, column: str | None):
+        self.func = func
+        self.column = column
+
+    def __str__(self) -> str:
+        return f"{self.func}({self.column or '*'})"
+
+
+#Агрегат func(column) из списка select по схеме таблицы (column None - count(*))
+def make_aggregate(func: str, column: str | None, schema: Schema) -> Aggregate:
+    func = func.lower()
+    text = f"{func}({column or '*'})"
+    if func not in FUNCTIONS:
+        raise DbValueError(func)
+    if column is None:
+        if func != "count":
+            raise DbValueError(text)
+        return Aggregate(func, None)
+    col = schema.column(column)
+    if func in ("sum", "avg") and col.type not in _NUMERIC:
+        raise DbValueError(text)
+    return Aggregate(func, col.name)
+
+
+#Запрос только из count(*)
+def count_only(aggregates: list[Aggregate]) -> bool:
+    return all(agg.column is None for agg in aggregates)
+
+
+class _Stats:
+    """Состояние одного столбца в группе: число значений, сумма, минимум и максимум"""
+
+    __slots__ = ("count", "total", "min", "max")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0
+        self.min: Any = None
+        self.max: Any = None
+
+    def add(self, value: Any) -> None:
+        if not self.count:
+            self.min = self.max = value
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+        self.count += 1
+        if type(value) is not str:
+            self.total += value
+
+    #Итоги части значений, посчитанные сразу по массиву
+    def merge(self, count: int, total: int, low: Any, high: Any) -> None:
+        if not count:
+            return
+        if not self.count or low < self.min:
+            self.min = low
+        if not self.count or high > self.max:
+            self.max = high
+        self.count += count
+        self.total += total
+
+    def result(self, func: str) -> Any:
+        if func == "count":
+            return self.count
+        if not self.count:
+            return None
+        if func == "sum":
+            return self.total
+        if func == "avg":
+            return self.total / self.count
+        return self.min if func == "min" else self.max
+
+
+class _Group:
+    """Одна группа: число строк и состояние каждого агрегируемого столбца"""
+
+    __slots__ = ("rows", "stats")
+
+    def __init__(self, columns: list[str]):
+        self.rows = 0
+        self.stats = {name: _Stats() for name in columns}
+
+    def result(self, agg: Aggregate) -> Any:
+        if agg.column is None:
+            return self.rows
+        return self.stats[agg.column].result(agg.func)
+
+
+#Агрегаты по строкам таблицы: positions - позиции отобранных строк (None - все живые строки).
+#Без group by - одна строка результата, с group by - по строке на группу, ключ группы первым
+def aggregate(
+    table: ColumnarTable,
+    aggregates: list[Aggregate],
+    group_by: str | None = None,
+    positions: Iterable[int] | None = None,
+) -> list[tuple[Any, ...]]:
+    if positions is None and group_by is None:
+        groups = {None: _whole_table(table, _columns(aggregates))}
+    else:
+        groups = collect_groups(table, aggregates, group_by, table.live.positions() if positions is None else positions)
+    return group_rows(groups, aggregates, group_by)
+
+
+def _columns(aggregates: list[Aggregate]) -> list[str]:
+    return list(dict.fromkeys(agg.column for agg in aggregates if agg.column is not None))
+
+
+#Группы по отобранным строкам без итоговых значений: их можно слить с группами других частей таблицы
+def collect_groups(
+    table: ColumnarTable,
+    aggregates: list[Aggregate],
+    group_by: str | None,
+    positions: Iterable[int],
+) -> dict[Any, _Group]:
+    return _scan(table, _columns(aggregates), group_by, positions)
+
+
+#Слияние групп, посчитанных по частям таблицы (параллельный проход по сегментам)
+def merge_groups(parts: Iterable[dict[Any, _Group]]) -> dict[Any, _Group]:
+    groups: dict[Any, _Group] = {}
+    for part in parts:
+        for key, group in part.items():
+            target = groups.get(key)
+            if target is None:
+                groups[key] = group
+                continue
+            target.rows += group.rows
+            for name, stats in group.stats.items():
+                target.stats[name].merge(stats.count, stats.total, stats.min, stats.max)
+    return groups
+
+
+#Строки результата по группам: без group by - одна строка (и при пустой выборке)
+def group_rows(groups: dict[Any, _Group], aggregates: list[Aggregate], group_by: str | None) -> list[tuple[Any, ...]]:
+    if group_by is None and not groups:
+        groups = {None: _Group(_columns(aggregates))}
+    prefix = (lambda key: (key,)) if group_by is not None else (lambda key: ())
+    return [
+        prefix(key) + tuple(groups[key].result(agg) for agg in aggregates)
+        for key in sorted(groups, key=_group_order)
+    ]
+
+
+#Группы по возрастанию ключа; строки без значения - в конце
+def _group_order(key: Any) -> tuple:
+    return key is None, type(key).__name__, key if key is not None else 0
+
+
+#Один проход по отобранным строкам
+def _scan(
+    table: ColumnarTable,
+    columns: list[str],
+    group_by: str | None,
+    positions: Iterable[int],
+) -> dict[Any, _Group]:
+    getters = [(name, _getter(table.columns[name])) for name in columns]
+    key_of, decode = _group_key(table, group_by)
+    groups: dict[Any, _Group] = {}
+    for pos in positions:
+        key = key_of(pos)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = _Group(columns)
+        group.rows += 1
+        stats = group.stats
+        for name, get in getters:
+            value = get(pos)
+            if value is not MISSING:
+                stats[name].add(value)
+    return {decode(key): group for key, group in groups.items()}
+
+
+#Значение столбца по позиции. Если значение есть во всех строках, проверка наличия не нужна
+def _getter(column: Any) -> Any:
+    if isinstance(column, IntColumn) and bits_mask(column.present).bit_count() == len(column.present):
+        return column.values.__getitem__
+    return column.get
+
+
+#Ключ группы по позиции строки и его перевод в значение. Строковый столбец группируется
+#по кодам словаря, значения декодируются один раз на группу
+def _group_key(table: ColumnarTable, group_by: str | None) -> tuple[Any, Any]:
+    if group_by is None:
+        return (lambda pos: None), (lambda key: None)
+    column = table.columns.get(group_by)
+    if column is None or any(group_by in extra for extra in table.extras.values()):
+        def value_of(pos: int) -> Any:
+            value = table.get_value(pos, group_by)
+            return None if value is MISSING else value
+
+        return value_of, (lambda key: key)
+    if isinstance(column, StrColumn):
+        dictionary = column.dictionary
+        return column.codes.__getitem__, (lambda code: dictionary[code] if code >= 0 else None)
+    return _getter(column), (lambda key: None if key is MISSING else key)
+
+
+#Без условия и группировки: столбцы обрабатываются целиком - сумма, минимум и максимум по массиву,
+#bool - подсчетом бит, строки - по кодам словаря
+def _whole_table(table: ColumnarTable, columns: list[str]) -> _Group:
+    group = _Group(columns)
+    group.rows = len(table)
+    size = len(table.live)
+    live = bits_mask(table.live)
+    for name in columns:
+        column = table.columns[name]
+        stats = group.stats[name]
+        if isinstance(column, IntColumn):
+            _int_stats(stats, column, live & bits_mask(column.present), size)
+        elif isinstance(column, BoolColumn):
+            present = live & bits_mask(column.present)
+            count = present.bit_count()
+            trues = (bits_mask(column.values) & present).bit_count()
+            stats.merge(count, trues, trues == count, trues > 0)
+        else:
+            _str_stats(stats, column, live, size)
+    return group
+
+
+def _int_stats(stats: _Stats, column: IntColumn, mask: int, size: int) -> None:
+    for chunk in masked_chunks(column.values, mask, size):
+        stats.merge(len(chunk), sum(chunk), min(chunk), max(chunk))
+
+
+def _str_stats(stats: _Stats, column: StrColumn, live: int, size: int) -> None:
+    counts: Counter[int] = Counter()
+    for chunk in masked_chunks(column.codes, live, size):
+        counts.update(chunk)
+    counts.pop(-1, None)
+    if counts:
+        values = [column.dictionary[code] for code in counts]
+        stats.merge(sum(counts.values()), 0, min(values), max(values))
+
+
+#Ответ по индексам без прохода по строкам (запрос без where). None - индексов не хватает
+def aggregate_from_index(
+    table: ColumnarTable,
+    aggregates: list[Aggregate],
+    group_by: str | None,
+    indexes: TableIndexes | None,
+) -> list[tuple[Any, ...]] | None:
+    secondary = indexes.secondary if indexes is not None else {}
+    if group_by is not None:
+        #count(*) по группам - размеры списков ID в индексе столбца группировки
+        if not count_only(aggregates) or group_by not in secondary:
+            return None
+        groups = {value: len(ids) for (_, value), ids in secondary[group_by].entries.items()}
+        without_value = len(table) - sum(groups.values())
+        if without_value > 0:
+            groups[None] = without_value
+        return [(key, *(groups[key] for _ in aggregates)) for key in sorted(groups, key=_group_order)]
+
+    row: list[Any] = []
+    for agg in aggregates:
+        if agg.column is None:
+            row.append(len(table))
+            continue
+        if agg.func not in ("count", "min", "max") or agg.column not in secondary:
+            return None
+        col_type = table.schema.by_name[agg.column].type
+        entries = {
+            value: len(ids)
+            for (type_name, value), ids in secondary[agg.column].entries.items()
+            if type_name == col_type
+        }
+        if agg.func == "count":
+            row.append(sum(entries.values()))
+        elif entries:
+            row.append(min(entries) if agg.func == "min" else max(entries))
+        else:
+            row.append(None)
+    return [tuple(row)]
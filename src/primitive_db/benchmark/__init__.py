@@ -0,0 +1,28 @@
+"""
+Воспроизводимые замеры производительности CRUD на синтетических таблицах
+"""
+
+from .report import (
+    DEFAULT_THRESHOLD,
+    compare_results,
+    format_comparison,
+    format_result,
+    load_results,
+    percentile,
+    save_results,
+)
+from .suite import DEFAULT_OPS, DEFAULT_REPEAT, DEFAULT_SIZES, run_suite
+
+__all__ = [
+    "DEFAULT_OPS",
+    "DEFAULT_REPEAT",
+    "DEFAULT_SIZES",
+    "DEFAULT_THRESHOLD",
+    "compare_results",
+    "format_comparison",
+    "format_result",
+    "load_results",
+    "percentile",
+    "run_suite",
+    "save_results",
+]
@@ -0,0 +1,83 @@
+"""
+Результаты замеров: вывод, сохранение в JSON и сравнение двух прогонов с пометкой регрессий
+"""
+
+import json
+import os
+from typing import Any
+
+DEFAULT_THRESHOLD = 0.10 #изменение больше 10% считается регрессией или улучшением
+
+
+#Значение перцентиля по отсортированному списку (ближайший ранг)
+def percentile(values: list[Any], percent: float) -> Any:
+    rank = max(0, min(len(values) - 1, round(percent / 100 * len(values)) - 1))
+    return values[rank]
+
+
+def save_results(filepath: str, data: dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    with open(filepath, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def load_results(filepath: str) -> dict[str, Any]:
+    with open(filepath, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _memory_text(value: int | None) -> str:
+    if value is None:
+        return "-"
+    if value < 1024 * 1024:
+        return f"{value / 1024:.1f} КБ"
+    return f"{value / 1024 / 1024:.1f} МБ"
+
+
+def format_result(result: dict[str, Any]) -> str:
+    return (
+        f"{result['size']:>9} {result['case']:<17} {result['throughput']:>14,.0f} {result['unit']:<6}"
+        f" p50 {result['p50_ms']:9.3f} мс  p95 {result['p95_ms']:9.3f} мс  p99 {result['p99_ms']:9.3f} мс"
+        f"  память {_memory_text(result['peak_memory_bytes'])}"
+    )
+
+
+#Метрики для сравнения: имя, больше - лучше?
+_COMPARED = [("throughput", True), ("p50_ms", False), ("peak_memory_bytes", False)]
+
+
+#Сравнение прогонов по (размер, замер): status - regression, improvement, ok или new (нет в базовом)
+def compare_results(
+    baseline: dict[str, Any],
+    current: dict[str, Any],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> list[dict[str, Any]]:
+    base = {(r["size"], r["case"]): r for r in baseline["results"]}
+    rows: list[dict[str, Any]] = []
+    for result in current["results"]:
+        old = base.get((result["size"], result["case"]))
+        row: dict[str, Any] = {"size": result["size"], "case": result["case"], "status": "new", "changes": {}}
+        if old is not None:
+            row["status"] = "ok"
+            for metric, higher_is_better in _COMPARED:
+                before, after = old.get(metric), result.get(metric)
+                if not before or after is None:
+                    continue
+                change = (after - before) / before
+                row["changes"][metric] = change
+                worse = -change if higher_is_better else change
+                if worse > threshold:
+                    row["status"] = "regression"
+                elif worse < -threshold and row["status"] != "regression":
+                    row["status"] = "improvement"
+        rows.append(row)
+    return rows
+
+
+def format_comparison(rows: list[dict[str, Any]]) -> list[str]:
+    labels = {"regression": "РЕГРЕССИЯ", "improvement": "улучшение", "ok": "", "new": "новый замер"}
+    lines = []
+    for row in rows:
+        changes = "  ".join(f"{metric} {change:+.1%}" for metric, change in row["changes"].items())
+        lines.append(f"{row['size']:>9} {row['case']:<17} {changes:<60} {labels[row['status']]}".rstrip())
+    return lines
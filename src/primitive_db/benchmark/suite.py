@@ -0,0 +1,243 @@
+"""
+Замеры горячих путей CRUD: сохранение и загрузка файла таблицы, insert, select (полный проход,
+фильтр, поиск по ID), update и delete на синтетических таблицах заданных размеров
+"""
+
+import contextlib
+import gc
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+from ..columnar import ColumnarTable
+from ..core import delete, insert, select, update
+from ..query import Comparison
+from ..schema import get_schema
+from ..utils import load_table_data, save_table_data
+from .report import percentile
+from .workload import BENCH_TABLE, generate_rows, make_metadata, random_record, random_values
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_OPS = 1000 #операций на точечный замер (insert, поиск по ID, update, delete)
+DEFAULT_REPEAT = 3 #повторов для замеров файла таблицы
+SCAN_BUDGET_ROWS = 1_000_000 #сколько строк всего пройти в замере полного прохода
+
+#Замеряем саму операцию, без вопроса перед удалением
+_delete = delete.__wrapped__
+
+
+class BenchContext:
+    """Состояние замеров одного размера: метаданные, строки или таблица в памяти, случайные значения"""
+
+    def __init__(self, size: int, seed: int, ops: int, repeat: int):
+        self.size = size
+        self.ops = ops
+        self.repeat = repeat
+        self.metadata = make_metadata()
+        self.schema = get_schema(self.metadata, BENCH_TABLE)
+        self.rng = random.Random(seed + size)
+        self.rows: list[dict[str, Any]] | None = generate_rows(size, seed)
+        self.table: ColumnarTable | None = None
+        self.next_id = size + 1
+        self.version = 0
+
+    #Новая версия таблицы для select: кэш результатов не должен подменять проход
+    def fresh_version(self) -> tuple[int, int]:
+        self.version += 1
+        return 0, self.version
+
+    #Строки в таблицу в памяти; список строк больше не нужен
+    def build_table(self) -> None:
+        self.table = ColumnarTable.from_rows(self.schema, self.rows or [])
+        self.rows = None
+
+    #ID для точечных операций: у каждого прохода свои, чтобы delete не искал уже удаленные строки
+    def sample_ids(self, count: int) -> list[int]:
+        return self.rng.sample(range(1, self.size + 1), min(self.size, count))
+
+
+#Замер: функция выполняет операции и возвращает время каждой (нс) и число обработанных строк
+Case = Callable[[BenchContext, list[int]], tuple[list[int], int]]
+
+
+def _timed(func: Callable[[], Any]) -> tuple[int, Any]:
+    start = time.perf_counter_ns()
+    result = func()
+    return time.perf_counter_ns() - start, result
+
+
+def _case_save(ctx: BenchContext, _ids: list[int]) -> tuple[list[int], int]:
+    latencies = [_timed(lambda: save_table_data(BENCH_TABLE, ctx.rows))[0] for _ in range(ctx.repeat)]
+    return latencies, ctx.size * ctx.repeat
+
+
+def _case_load(ctx: BenchContext, _ids: list[int]) -> tuple[list[int], int]:
+    latencies = [_timed(lambda: load_table_data(BENCH_TABLE))[0] for _ in range(ctx.repeat)]
+    return latencies, ctx.size * ctx.repeat
+
+
+def _case_insert(ctx: BenchContext, ids: list[int]) -> tuple[list[int], int]:
+    latencies = []
+    for _ in ids:
+        values = random_values(ctx.rng)
+        new_id, ctx.next_id = ctx.next_id, ctx.next_id + 1
+        latencies.append(_timed(lambda: insert(ctx.metadata, BENCH_TABLE, values, ctx.table, new_id))[0])
+    return latencies, len(ids)
+
+
+def _scan_ops(ctx: BenchContext) -> int:
+    return max(ctx.repeat, min(ctx.ops, SCAN_BUDGET_ROWS // ctx.size))
+
+
+def _case_select_full_scan(ctx: BenchContext, _ids: list[int]) -> tuple[list[int], int]:
+    latencies = []
+    rows = 0
+    for _ in range(_scan_ops(ctx)):
+        version = ctx.fresh_version()
+        elapsed, result = _timed(
+            lambda: [row.to_dict() for row in select(BENCH_TABLE, ctx.table, version)]
+        )
+        latencies.append(elapsed)
+        rows += len(result)
+    return latencies, rows
+
+
+def _case_select_filtered(ctx: BenchContext, _ids: list[int]) -> tuple[list[int], int]:
+    latencies = []
+    for _ in range(_scan_ops(ctx)):
+        where = Comparison("age", "=", random_record(ctx.rng)["age"])
+        version = ctx.fresh_version()
+        latencies.append(_timed(lambda: list(select(BENCH_TABLE, ctx.table, version, where)))[0])
+    return latencies, len(latencies) * len(ctx.table)
+
+
+def _case_select_by_id(ctx: BenchContext, ids: list[int]) -> tuple[list[int], int]:
+    latencies = []
+    for row_id in ids:
+        where = Comparison("ID", "=", row_id)
+        version = ctx.fresh_version()
+        latencies.append(_timed(lambda: list(select(BENCH_TABLE, ctx.table, version, where)))[0])
+    return latencies, len(ids)
+
+
+def _case_update(ctx: BenchContext, ids: list[int]) -> tuple[list[int], int]:
+    latencies = []
+    for row_id in ids:
+        set_clause = {"age": random_record(ctx.rng)["age"]}
+        where = Comparison("ID", "=", row_id)
+        latencies.append(_timed(lambda: update(ctx.table, set_clause, where))[0])
+    return latencies, len(ids)
+
+
+def _case_delete(ctx: BenchContext, ids: list[int]) -> tuple[list[int], int]:
+    latencies = []
+    for row_id in ids:
+        where = Comparison("ID", "=", row_id)
+        latencies.append(_timed(lambda: _delete(ctx.table, where))[0])
+    return latencies, len(ids)
+
+
+#Порядок важен: файловые замеры идут по списку строк, остальные - по таблице в памяти, delete последним
+CASES: list[tuple[str, str, Case]] = [
+    ("save_table_data", "rows/s", _case_save),
+    ("load_table_data", "rows/s", _case_load),
+    ("insert", "ops/s", _case_insert),
+    ("select_full_scan", "rows/s", _case_select_full_scan),
+    ("select_filtered", "rows/s", _case_select_filtered),
+    ("select_by_id", "ops/s", _case_select_by_id),
+    ("update", "ops/s", _case_update),
+    ("delete", "ops/s", _case_delete),
+]
+
+
+#Время операций без сборщика мусора (как в timeit): иначе в замер попадают обходы всей кучи
+def _timed_pass(case: Case, ctx: BenchContext, ids: list[int]) -> tuple[list[int], int]:
+    gc.collect()
+    gc.disable()
+    try:
+        return case(ctx, ids)
+    finally:
+        gc.enable()
+
+
+#Пиковая память одной операции замера (байты, по tracemalloc). Отдельный проход:
+#трассировка замедляет код и исказила бы время
+def _peak_memory(case: Case, ctx: BenchContext, ids: list[int]) -> int:
+    ops, repeat = ctx.ops, ctx.repeat
+    ctx.ops = ctx.repeat = 1
+    tracemalloc.start()
+    try:
+        case(ctx, ids[:1])
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        ctx.ops, ctx.repeat = ops, repeat
+
+
+def _run_case(name: str, unit: str, case: Case, ctx: BenchContext, memory: bool) -> dict[str, Any]:
+    ids = ctx.sample_ids(ctx.ops * 2)
+    latencies, rows = _timed_pass(case, ctx, ids[: ctx.ops])
+    peak = _peak_memory(case, ctx, ids[ctx.ops :] or ids[: ctx.ops]) if memory else None
+
+    latencies.sort()
+    seconds = sum(latencies) / 1e9
+    return {
+        "size": ctx.size,
+        "case": name,
+        "ops": len(latencies),
+        "rows": rows,
+        "seconds": seconds,
+        "throughput": rows / seconds if seconds else 0.0,
+        "unit": unit,
+        "mean_ms": seconds * 1000 / len(latencies),
+        "p50_ms": percentile(latencies, 50) / 1e6,
+        "p95_ms": percentile(latencies, 95) / 1e6,
+        "p99_ms": percentile(latencies, 99) / 1e6,
+        "peak_memory_bytes": peak,
+    }
+
+
+#Все замеры для каждого размера. Файлы пишутся во временную папку, рабочая папка не затрагивается.
+#on_result получает каждый результат сразу (для вывода по ходу)
+def run_suite(
+    sizes: list[int] | None = None,
+    ops: int = DEFAULT_OPS,
+    repeat: int = DEFAULT_REPEAT,
+    seed: int = 42,
+    memory: bool = True,
+    on_result: Callable[[dict[str, Any]], None] | None = None,
+) -> dict[str, Any]:
+    sizes = sizes or DEFAULT_SIZES
+    results: list[dict[str, Any]] = []
+
+    with tempfile.TemporaryDirectory(prefix="primitive_db_bench_") as workdir, contextlib.chdir(workdir):
+        for size in sizes:
+            ctx = BenchContext(size, seed, ops, repeat)
+            for name, unit, case in CASES:
+                if name == "insert":
+                    ctx.build_table()
+                result = _run_case(name, unit, case, ctx, memory)
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+            del ctx
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sizes": sizes,
+            "ops": ops,
+            "repeat": repeat,
+            "seed": seed,
+            "memory": memory,
+        },
+        "results": results,
+    }
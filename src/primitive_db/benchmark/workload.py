@@ -0,0 +1,38 @@
+"""
+Синтетические данные для замеров: таблица со столбцами всех типов create_table, одинаковая при одном seed
+"""
+
+import random
+from typing import Any
+
+from ..core import create_table
+
+BENCH_TABLE = "bench"
+BENCH_COLUMNS = ["name:str", "age:int", "active:bool"]
+
+_NAME_POOL = 1000 #сколько разных имен: строки повторяются, как в настоящих данных
+_MAX_AGE = 100
+
+
+def make_metadata() -> dict[str, Any]:
+    return create_table({}, BENCH_TABLE, list(BENCH_COLUMNS))
+
+
+def random_record(rng: random.Random) -> dict[str, Any]:
+    return {
+        "name": f"user{rng.randrange(_NAME_POOL)}",
+        "age": rng.randrange(_MAX_AGE),
+        "active": rng.random() < 0.5,
+    }
+
+
+#Значения для insert в виде литералов команды (строки в кавычках, true/false)
+def random_values(rng: random.Random) -> list[str]:
+    record = random_record(rng)
+    return [f'"{record["name"]}"', str(record["age"]), "true" if record["active"] else "false"]
+
+
+#Строки таблицы с ID 1..size
+def generate_rows(size: int, seed: int) -> list[dict[str, Any]]:
+    rng = random.Random(seed)
+    return [{"ID": row_id, **random_record(rng)} for row_id in range(1, size + 1)]
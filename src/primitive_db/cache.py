@@ -0,0 +1,87 @@
+"""
+Кэш результатов запросов с вытеснением LRU и сбросом по версии таблицы
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable
+
+DEFAULT_MAX_ENTRIES = 256 #сколько результатов держать в кэше
+DEFAULT_MAX_ROWS = 10_000 #результаты крупнее не кэшируются, чтобы не держать большие списки
+
+
+class QueryCache:
+    """Результаты select по ключу (таблица, запрос); версия таблицы сбрасывает ее записи"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_rows: int = DEFAULT_MAX_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries: OrderedDict[tuple[str, Any], list[Any]] = OrderedDict()
+        self._versions: dict[str, Any] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_compute(
+        self,
+        table_name: str,
+        version: Any,
+        key: Any,
+        compute: Callable[[], list[Any]],
+    ) -> list[Any]:
+        if self._versions.get(table_name) != version:
+            self.invalidate(table_name)
+            self._versions[table_name] = version
+
+        entry_key = (table_name, key)
+        rows = self._entries.get(entry_key)
+        if rows is not None:
+            self._entries.move_to_end(entry_key)
+            self.hits += 1
+            return rows
+
+        self.misses += 1
+        rows = compute()
+        if len(rows) <= self.max_rows:
+            self._entries[entry_key] = rows
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return rows
+
+    #Готовый результат без вычисления (None, если его нет или версия таблицы устарела)
+    def peek(self, table_name: str, version: Any, key: Any) -> list[Any] | None:
+        if self._versions.get(table_name) != version:
+            return None
+        rows = self._entries.get((table_name, key))
+        if rows is not None:
+            self._entries.move_to_end((table_name, key))
+            self.hits += 1
+        return rows
+
+    #Есть ли актуальный результат (без изменения счетчиков и порядка вытеснения)
+    def contains(self, table_name: str, version: Any, key: Any) -> bool:
+        return self._versions.get(table_name) == version and (table_name, key) in self._entries
+
+    #Сбросить записи одной таблицы или весь кэш
+    def invalidate(self, table_name: str | None = None) -> None:
+        if table_name is None:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._versions.clear()
+            return
+
+        stale = [k for k in self._entries if k[0] == table_name]
+        for k in stale:
+            del self._entries[k]
+        self.invalidations += len(stale)
+        self._versions.pop(table_name, None)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
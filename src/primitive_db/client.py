@@ -0,0 +1,118 @@
+"""
+Клиент сетевого режима и нагрузочный тест (bench) против запущенного сервера
+"""
+
+import asyncio
+import time
+
+from .benchmark import percentile
+from .server import END_OF_RESPONSE
+
+
+class Connection:
+    """Подключение к серверу: команда уходит строкой, ответ читается до строки "." """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host: str, port: int) -> "Connection":
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def request(self, command: str) -> str:
+        self.writer.write(command.encode("utf-8") + b"\n")
+        await self.writer.drain()
+
+        lines: list[str] = []
+        while True:
+            raw = await self.reader.readline()
+            if not raw:
+                raise ConnectionError("сервер закрыл соединение")
+            line = raw.decode("utf-8").rstrip("\n")
+            if line == END_OF_RESPONSE:
+                return "\n".join(lines)
+            lines.append(line[1:] if line.startswith("..") else line)
+
+    async def close(self) -> None:
+        self.writer.write(b"exit\n")
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def _client(host: str, port: int, commands: list[str] | None) -> None:
+    connection = await Connection.open(host, port)
+    try:
+        if commands is not None:
+            for command in commands:
+                print(await connection.request(command))
+            return
+
+        while True:
+            command = (await asyncio.to_thread(input, f"{host}:{port}> ")).strip()
+            if command == "exit":
+                return
+            if command:
+                print(await connection.request(command))
+    finally:
+        await connection.close()
+
+
+#Команды с сервера: заданные списком или интерактивно до exit
+def run_client(host: str, port: int, commands: list[str] | None = None) -> None:
+    try:
+        asyncio.run(_client(host, port, commands))
+    except (EOFError, KeyboardInterrupt):
+        print()
+    except OSError as e:
+        print(f"Ошибка: не удалось подключиться к {host}:{port}: {e.strerror or e}")
+
+
+async def _bench(host: str, port: int, commands: list[str], clients: int, requests: int) -> dict:
+    latencies: list[float] = []
+
+    async def worker(number: int) -> None:
+        connection = await Connection.open(host, port)
+        try:
+            for i in range(requests):
+                command = commands[(number + i) % len(commands)]
+                start = time.perf_counter()
+                await connection.request(command)
+                latencies.append(time.perf_counter() - start)
+        finally:
+            await connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "seconds": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+#Нагрузочный тест: clients подключений, каждое отправляет requests команд по кругу из списка
+def run_bench(host: str, port: int, commands: list[str], clients: int = 8, requests: int = 1000) -> dict | None:
+    try:
+        result = asyncio.run(_bench(host, port, commands, clients, requests))
+    except OSError as e:
+        print(f"Ошибка: не удалось подключиться к {host}:{port}: {e.strerror or e}")
+        return None
+
+    print(
+        f"Подключений: {result['clients']}, запросов: {result['requests']}, "
+        f"время: {result['seconds']:.2f} с, {result['throughput']:.0f} запросов/с"
+    )
+    print(
+        f"Задержка: p50 {result['p50_ms']:.2f} мс, "
+        f"p95 {result['p95_ms']:.2f} мс, p99 {result['p99_ms']:.2f} мс"
+    )
+    return result
@@ -0,0 +1,941 @@
+"""
+Колоночное представление таблицы в памяти: int - array('q'), bool - битовые поля, str - словарное кодирование.
+Столбцы из двоичного файла читаются прямо из mmap и копируются в память только перед дозаписью
+"""
+
+import heapq
+import json
+import operator
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, chain
+from typing import Any, Callable, Iterable, Iterator
+
+from .schema import Schema
+
+MISSING: Any = object() #значение отсутствует (в старых данных у строки может не быть столбца)
+
+COMPACT_MIN_DEAD = 1024 #сжатие после удалений: не раньше, чем наберется столько удаленных строк
+COMPACT_RATIO = 0.5 #... и только если они составляют такую долю таблицы
+
+CHUNK_SIZE = 65_536 #по сколько значений обрабатывать за раз в проходах по всему столбцу
+SEGMENT_ROWS = 2 * CHUNK_SIZE #позиций строк в сегменте (файл сегмента, часть параллельного прохода); кратно 8
+
+
+#Пора ли сжимать: мусора (удаленных строк, старых версий) набралось много и в абсолютном числе, и по доле
+def needs_compaction(garbage: int, total: int, ratio: float = COMPACT_RATIO) -> bool:
+    return garbage >= COMPACT_MIN_DEAD and garbage >= ratio * total
+
+
+#Массив из секции файла: без копирования, если порядок байт совпадает
+def _typed(buf: memoryview, typecode: str, swap: bool) -> Any:
+    if not swap:
+        return buf.cast(typecode)
+    values = _owned(typecode, buf)
+    values.byteswap()
+    return values
+
+
+def _owned(typecode: str, buf: Any) -> array:
+    values = array(typecode)
+    values.frombytes(memoryview(buf).cast("B"))
+    return values
+
+
+class Bitset:
+    """Битовое поле на bytearray (или на memoryview двоичного файла до первой дозаписи)"""
+
+    __slots__ = ("_bits", "_len")
+
+    def __init__(self) -> None:
+        self._bits: bytearray | memoryview = bytearray()
+        self._len = 0
+
+    @classmethod
+    def from_buffer(cls, buf: memoryview, length: int) -> "Bitset":
+        bits = cls()
+        bits._bits = buf
+        bits._len = length
+        return bits
+
+    #Биты позиций start..end (start кратно 8: часть начинается с целого байта). Срез mmap не копируется,
+    #срез своих битов - копия: на bytearray нельзя держать memoryview, иначе он не сможет расти
+    def segment(self, start: int, end: int) -> "Bitset":
+        return Bitset.from_buffer(self._bits[start >> 3 : (end + 7) >> 3], end - start)
+
+    #Поле из нескольких подряд: все части, кроме последней, должны быть кратны 8 битам
+    @classmethod
+    def concat(cls, parts: Iterable["Bitset"]) -> "Bitset":
+        bits = cls()
+        for part in parts:
+            if bits._len & 7:
+                bits.extend([part[pos] for pos in range(len(part))])
+                continue
+            bits._bits += part.buffer
+            bits._len += len(part)
+        return bits
+
+    #Своя копия битов: нужна перед дозаписью
+    def own(self) -> None:
+        if type(self._bits) is not bytearray:
+            self._bits = bytearray(self._bits)
+
+    @property
+    def buffer(self) -> bytearray | memoryview:
+        return self._bits
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, pos: int) -> bool:
+        return bool(self._bits[pos >> 3] >> (pos & 7) & 1)
+
+    def __setitem__(self, pos: int, flag: bool) -> None:
+        if flag:
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        else:
+            self._bits[pos >> 3] &= ~(1 << (pos & 7)) & 0xFF
+
+    def append(self, flag: bool) -> None:
+        if self._len & 7 == 0:
+            self._bits.append(0)
+        self._len += 1
+        if flag:
+            self[self._len - 1] = True
+
+    def count(self) -> int:
+        return int.from_bytes(self._bits, "little").bit_count()
+
+    #Пачка значений: неполный байт добиваем по одному, дальше - по 8 бит за раз
+    def extend(self, flags: list[bool]) -> None:
+        pos = 0
+        while self._len & 7 and pos < len(flags):
+            self.append(flags[pos])
+            pos += 1
+        full = (len(flags) - pos) >> 3 << 3
+        for chunk in range(pos, pos + full, 8):
+            byte = 0
+            for bit, flag in enumerate(flags[chunk : chunk + 8]):
+                if flag:
+                    byte |= 1 << bit
+            self._bits.append(byte)
+        self._len += full
+        for flag in flags[pos + full :]:
+            self.append(flag)
+
+    def extend_ones(self, count: int) -> None:
+        while self._len & 7 and count:
+            self.append(True)
+            count -= 1
+        self._bits.extend(b"\xff" * (count >> 3))
+        self._len += count >> 3 << 3
+        for _ in range(count & 7):
+            self.append(True)
+
+    def positions(self) -> Iterator[int]:
+        for byte_pos, byte in enumerate(self._bits):
+            while byte:
+                low = byte & -byte
+                yield (byte_pos << 3) + low.bit_length() - 1
+                byte ^= low
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+
+#Битовое поле как одно целое: маски строк (живые, со значением) складываются побитовыми операциями
+def bits_mask(bits: Bitset) -> int:
+    return int.from_bytes(bits.buffer, "little")
+
+
+def _mask_positions(mask: int, size: int) -> Iterator[int]:
+    return Bitset.from_buffer(memoryview(mask.to_bytes((size + 7) // 8, "little")), size).positions()
+
+
+#Значения массива в отмеченных маской позициях, кусками: кусок без пропусков - срез массива целиком,
+#так что встроенные sum/min/max/Counter обрабатывают его без цикла на Python
+def masked_chunks(values: Any, mask: int, size: int) -> Iterator[Any]:
+    for start in range(0, size, CHUNK_SIZE):
+        end = min(size, start + CHUNK_SIZE)
+        bits = (mask >> start) & ((1 << (end - start)) - 1)
+        part = values[start:end]
+        if bits.bit_count() == end - start:
+            yield part
+        elif bits:
+            yield list(map(part.__getitem__, _mask_positions(bits, end - start)))
+
+
+class IntColumn:
+    """Целые числа в array('q') и маска наличия значения"""
+
+    __slots__ = ("values", "present")
+
+    def __init__(self) -> None:
+        self.values = array("q")
+        self.present = Bitset()
+
+    @staticmethod
+    def accepts(value: Any) -> bool:
+        return type(value) is int and -(2**63) <= value < 2**63
+
+    def append(self, value: Any) -> None:
+        if value is MISSING:
+            self.values.append(0)
+            self.present.append(False)
+        else:
+            self.values.append(value)
+            self.present.append(True)
+
+    @staticmethod
+    def accepts_all(values: list[Any]) -> bool:
+        return all(type(v) is int for v in values) and (
+            not values or (-(2**63) <= min(values) and max(values) < 2**63)
+        )
+
+    def extend(self, values: list[Any]) -> None:
+        self.values.extend(values)
+        self.present.extend_ones(len(values))
+
+    def get(self, pos: int) -> Any:
+        return self.values[pos] if self.present[pos] else MISSING
+
+    def set(self, pos: int, value: Any) -> None:
+        if value is MISSING:
+            self.values[pos] = 0
+            self.present[pos] = False
+        else:
+            self.values[pos] = value
+            self.present[pos] = True
+
+    def find(self, value: Any) -> Iterator[int]:
+        present = self.present
+        for pos, item in enumerate(self.values):
+            if item == value and present[pos]:
+                yield pos
+
+    def match(self, test: Callable[[Any], bool]) -> Iterator[int]:
+        present = self.present
+        for pos, item in enumerate(self.values):
+            if test(item) and present[pos]:
+                yield pos
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.itemsize * len(self.values) + self.present.nbytes
+
+    @classmethod
+    def from_buffers(cls, sections: dict[str, memoryview], name: str, length: int, swap: bool) -> "IntColumn":
+        column = cls()
+        column.values = _typed(sections[f"{name}.values"], "q", swap)
+        column.present = Bitset.from_buffer(sections[f"{name}.present"], length)
+        return column
+
+    def buffers(self, name: str) -> dict[str, Any]:
+        return {f"{name}.values": self.values, f"{name}.present": self.present.buffer}
+
+    def segment(self, start: int, end: int) -> "IntColumn":
+        column = IntColumn()
+        column.values = self.values[start:end]
+        column.present = self.present.segment(start, end)
+        return column
+
+    def own(self) -> None:
+        if type(self.values) is not array:
+            self.values = _owned("q", self.values)
+        self.present.own()
+
+
+class BoolColumn:
+    """Логические значения: два битовых поля (значение и наличие)"""
+
+    __slots__ = ("values", "present")
+
+    def __init__(self) -> None:
+        self.values = Bitset()
+        self.present = Bitset()
+
+    @staticmethod
+    def accepts(value: Any) -> bool:
+        return type(value) is bool
+
+    def append(self, value: Any) -> None:
+        self.values.append(value is True)
+        self.present.append(value is not MISSING)
+
+    @staticmethod
+    def accepts_all(values: list[Any]) -> bool:
+        return all(type(v) is bool for v in values)
+
+    def extend(self, values: list[Any]) -> None:
+        self.values.extend(values)
+        self.present.extend_ones(len(values))
+
+    def get(self, pos: int) -> Any:
+        return self.values[pos] if self.present[pos] else MISSING
+
+    def set(self, pos: int, value: Any) -> None:
+        self.values[pos] = value is True
+        self.present[pos] = value is not MISSING
+
+    def find(self, value: Any) -> Iterator[int]:
+        present = self.present
+        for pos in self.values.positions() if value else range(len(self.values)):
+            if present[pos] and self.values[pos] is value:
+                yield pos
+
+    #Для bool условие зависит только от значения: проверяем его дважды, а не на каждой строке
+    def match(self, test: Callable[[Any], bool]) -> Iterator[int]:
+        if test(True) and test(False):
+            yield from self.present.positions()
+        elif test(True) or test(False):
+            yield from self.find(test(True))
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + self.present.nbytes
+
+    @classmethod
+    def from_buffers(cls, sections: dict[str, memoryview], name: str, length: int, swap: bool) -> "BoolColumn":
+        column = cls()
+        column.values = Bitset.from_buffer(sections[f"{name}.values"], length)
+        column.present = Bitset.from_buffer(sections[f"{name}.present"], length)
+        return column
+
+    def buffers(self, name: str) -> dict[str, Any]:
+        return {f"{name}.values": self.values.buffer, f"{name}.present": self.present.buffer}
+
+    def segment(self, start: int, end: int) -> "BoolColumn":
+        column = BoolColumn()
+        column.values = self.values.segment(start, end)
+        column.present = self.present.segment(start, end)
+        return column
+
+    def own(self) -> None:
+        self.values.own()
+        self.present.own()
+
+
+class StrHeap:
+    """Словарь строк двоичного файла: смещения и куча байт, строка декодируется при обращении"""
+
+    __slots__ = ("offsets", "heap")
+
+    def __init__(self, offsets: Any, heap: memoryview):
+        self.offsets = offsets
+        self.heap = heap
+
+    def __len__(self) -> int:
+        return max(len(self.offsets) - 1, 0)
+
+    def __getitem__(self, code: int) -> str:
+        return str(self.heap[self.offsets[code] : self.offsets[code + 1]], "utf-8", "surrogatepass")
+
+    def __iter__(self) -> Iterator[str]:
+        for code in range(len(self)):
+            yield self[code]
+
+
+class StrColumn:
+    """Строки со словарным кодированием: коды в array('i'), -1 - значения нет"""
+
+    __slots__ = ("codes", "dictionary", "lookup", "heap_bytes")
+
+    def __init__(self) -> None:
+        self.codes = array("i")
+        self.dictionary: list[str] | StrHeap = []
+        self.lookup: dict[str, int] | None = {} #None - словарь еще в файле
+        self.heap_bytes = 0
+
+    @staticmethod
+    def accepts(value: Any) -> bool:
+        return type(value) is str
+
+    def _encode(self, value: Any) -> int:
+        if value is MISSING:
+            return -1
+        code = self.lookup.get(value)
+        if code is None:
+            code = len(self.dictionary)
+            self.dictionary.append(value)
+            self.lookup[value] = code
+            self.heap_bytes += sys.getsizeof(value)
+        return code
+
+    def append(self, value: Any) -> None:
+        self.codes.append(self._encode(value))
+
+    @staticmethod
+    def accepts_all(values: list[Any]) -> bool:
+        return all(type(v) is str for v in values)
+
+    def extend(self, values: list[Any]) -> None:
+        lookup = self.lookup
+        self.codes.extend([lookup[v] if v in lookup else self._encode(v) for v in values])
+
+    def get(self, pos: int) -> Any:
+        code = self.codes[pos]
+        return self.dictionary[code] if code >= 0 else MISSING
+
+    def set(self, pos: int, value: Any) -> None:
+        self._own_dictionary()
+        self.codes[pos] = self._encode(value)
+
+    def find(self, value: Any) -> Iterator[int]:
+        self._own_dictionary()
+        code = self.lookup.get(value)
+        if code is None:
+            return
+        for pos, item in enumerate(self.codes):
+            if item == code:
+                yield pos
+
+    #Условие проверяется один раз на каждое различное значение, дальше сравниваются коды.
+    #У части таблицы словарь общий со всей таблицей - там проверяются только встречающиеся коды
+    def match(self, test: Callable[[Any], bool]) -> Iterator[int]:
+        dictionary = self.dictionary
+        if len(dictionary) > len(self.codes):
+            codes = {code for code in set(self.codes) if code >= 0 and test(dictionary[code])}
+        else:
+            codes = {code for code, value in enumerate(dictionary) if test(value)}
+        if not codes:
+            return
+        for pos, item in enumerate(self.codes):
+            if item in codes:
+                yield pos
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.itemsize * len(self.codes) + self.heap_bytes
+
+    @classmethod
+    def from_buffers(cls, sections: dict[str, memoryview], name: str, length: int, swap: bool) -> "StrColumn":
+        column = cls()
+        column.codes = _typed(sections[f"{name}.codes"], "i", swap)
+        heap = sections[f"{name}.heap"]
+        column.dictionary = StrHeap(_typed(sections[f"{name}.offsets"], "q", swap), heap)
+        column.lookup = None
+        column.heap_bytes = heap.nbytes
+        return column
+
+    #Строки словаря пишутся в кучу байт подряд, offsets[i]..offsets[i+1] - границы i-й строки
+    def buffers(self, name: str) -> dict[str, Any]:
+        encoded = [value.encode("utf-8", "surrogatepass") for value in self.dictionary]
+        offsets = array("q", [0])
+        offsets.extend(accumulate(map(len, encoded)))
+        return {f"{name}.codes": self.codes, f"{name}.offsets": offsets, f"{name}.heap": b"".join(encoded)}
+
+    #Часть столбца: срез кодов, словарь общий
+    def segment(self, start: int, end: int) -> "StrColumn":
+        column = StrColumn()
+        column.codes = self.codes[start:end]
+        column.dictionary = self.dictionary
+        column.lookup = None
+        return column
+
+    #Тот же столбец со своим словарем только из встречающихся строк (для записи части таблицы в файл)
+    def compacted(self) -> "StrColumn":
+        used = sorted(set(self.codes) - {-1})
+        remap = dict(zip(used, range(len(used))))
+        remap[-1] = -1
+        column = StrColumn()
+        column.codes = array("i", map(remap.__getitem__, self.codes))
+        column.dictionary = [self.dictionary[code] for code in used]
+        column.lookup = dict(zip(column.dictionary, range(len(used))))
+        return column
+
+    def _own_dictionary(self) -> None:
+        if self.lookup is None:
+            self.dictionary = list(self.dictionary)
+            self.lookup = {value: code for code, value in enumerate(self.dictionary)}
+
+    def own(self) -> None:
+        self._own_dictionary()
+        if type(self.codes) is not array:
+            self.codes = _owned("i", self.codes)
+
+
+COLUMN_TYPES = {"int": IntColumn, "bool": BoolColumn, "str": StrColumn}
+
+
+class RowView:
+    """Легкое представление строки поверх колонок (ведет себя как dict для чтения и записи)"""
+
+    __slots__ = ("_table", "pos")
+
+    def __init__(self, table: "ColumnarTable", pos: int):
+        self._table = table
+        self.pos = pos
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._table.get_value(self.pos, key)
+        return default if value is MISSING else value
+
+    def __getitem__(self, key: str) -> Any:
+        value = self._table.get_value(self.pos, key)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._table.set_value(self.pos, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return self._table.get_value(self.pos, key) is not MISSING
+
+    def items(self) -> Iterator[tuple[str, Any]]:
+        return self._table.row_items(self.pos)
+
+    def to_dict(self) -> dict[str, Any]:
+        return dict(self.items())
+
+    def __repr__(self) -> str:
+        return f"RowView({self.to_dict()!r})"
+
+
+class ColumnarTable:
+    """Таблица по столбцам. Удаление помечает строку мертвой, место освобождается при сжатии"""
+
+    def __init__(self, schema: Schema):
+        self.schema = schema
+        self._undo: list[tuple[Any, ...]] | None = None #журнал отмены открытой транзакции
+        #Файлы, которые совпадают с таблицей в памяти: (путь, отпечаток, позиция первой строки файла
+        #в таблице, строк в файле). Один двоичный файл или части формата segments; ведет storage
+        self.source_files: list[tuple[str, tuple[int, int], int, int]] | None = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self.columns: dict[str, Any] = {
+            col.name: COLUMN_TYPES[col.type]() for col in self.schema.columns
+        }
+        self.live = Bitset()
+        self.extras: dict[int, dict[str, Any]] = {} #значения вне схемы или не того типа
+        self._size = 0
+        self._live_count = 0
+        self._last_id: int | None = None
+        self._id_map: dict[int, int] | None = None #нужен, только если ID идут не по возрастанию
+        self._mapped = False #столбцы смотрят в mmap двоичного файла
+        #Сегменты (по SEGMENT_ROWS позиций), измененные с последней записи файлов сегментов; None - все
+        self.changed: set[int] | None = None
+        #min/max столбцов по сегментам из манифеста (формат segments); у измененных сегментов устарели
+        self.zones: list[dict[str, Any]] | None = None
+
+    @classmethod
+    def from_rows(cls, schema: Schema, rows: Iterable[dict[str, Any]]) -> "ColumnarTable":
+        table = cls(schema)
+        for row in rows:
+            table.append(row)
+        return table
+
+    #Таблица поверх секций двоичного файла (см. utils.open_binary_table), без копирования данных
+    @classmethod
+    def from_buffers(
+        cls,
+        schema: Schema,
+        header: dict[str, Any],
+        sections: dict[str, memoryview],
+    ) -> "ColumnarTable":
+        table = cls(schema)
+        size = header["rows"]
+        swap = header.get("byteorder", sys.byteorder) != sys.byteorder
+        table.columns = {
+            col.name: COLUMN_TYPES[col.type].from_buffers(sections, col.name, size, swap)
+            for col in schema.columns
+        }
+        table.live = Bitset.from_buffer(sections["live"], size)
+        if "extras" in sections:
+            extras = json.loads(bytes(sections["extras"]))
+            table.extras = {int(pos): extra for pos, extra in extras.items()}
+        table._size = size
+        table._live_count = header["live"]
+        table._last_id = header.get("last_id")
+        table._mapped = True
+        if not header.get("ids_sorted", True):
+            table._build_id_map()
+        return table
+
+    def _build_id_map(self) -> None:
+        self._id_map = {}
+        for view in self:
+            if type(view.get("ID")) is int:
+                self._id_map[view["ID"]] = view.pos
+
+    #Заголовок и секции для utils.save_binary_table
+    def to_buffers(self) -> tuple[dict[str, Any], dict[str, Any]]:
+        self.materialize() #файл под отображением будет заменен
+        header = {
+            "schema": self.schema.source,
+            "rows": self._size,
+            "live": self._live_count,
+            "byteorder": sys.byteorder,
+            "ids_sorted": self._id_map is None,
+            "last_id": self._last_id,
+        }
+        sections: dict[str, Any] = {"live": self.live.buffer}
+        for name, column in self.columns.items():
+            sections.update(column.buffers(name))
+        if self.extras:
+            extras = {str(pos): extra for pos, extra in self.extras.items()}
+            sections["extras"] = json.dumps(extras, ensure_ascii=False).encode("utf-8")
+        return header, sections
+
+    #Таблица из частей подряд (файлов сегментов): столбцы склеиваются, строки словарей сводятся в один.
+    #Все части, кроме последней, - ровно по SEGMENT_ROWS позиций
+    @classmethod
+    def concat(cls, schema: Schema, parts: list["ColumnarTable"], ids_sorted: bool = True) -> "ColumnarTable":
+        table = cls(schema)
+        for name, column in table.columns.items():
+            columns = [part.columns[name] for part in parts]
+            if isinstance(column, IntColumn):
+                for part in columns:
+                    column.values.frombytes(memoryview(part.values).cast("B"))
+                column.present = Bitset.concat(part.present for part in columns)
+            elif isinstance(column, BoolColumn):
+                column.values = Bitset.concat(part.values for part in columns)
+                column.present = Bitset.concat(part.present for part in columns)
+            else:
+                for part in columns:
+                    remap = [column._encode(value) for value in part.dictionary]
+                    remap.append(-1) #код -1 (нет значения) остается -1
+                    column.codes.extend(map(remap.__getitem__, part.codes))
+        table.live = Bitset.concat(part.live for part in parts)
+        start = 0
+        for part in parts:
+            table.extras.update((start + pos, extra) for pos, extra in part.extras.items())
+            start += len(part.live)
+        table._size = start
+        table._live_count = sum(len(part) for part in parts)
+        ids = [part._last_id for part in parts if part._last_id is not None]
+        table._last_id = ids[-1] if ids else None
+        if not ids_sorted or any(part._id_map is not None for part in parts) or ids != sorted(set(ids)):
+            table._build_id_map()
+        return table
+
+    #Строки с позиций start..end как отдельная таблица только для чтения (параллельный проход, запись
+    #сегмента): столбцы - срезы (у mmap без копирования), позиции в ней считаются от start. start кратно 8
+    def segment(self, start: int, end: int) -> "ColumnarTable":
+        part = ColumnarTable(self.schema)
+        part.columns = {name: column.segment(start, end) for name, column in self.columns.items()}
+        part.live = self.live.segment(start, end)
+        part.extras = {pos - start: extra for pos, extra in self.extras.items() if start <= pos < end}
+        part._size = end - start
+        part._live_count = part.live.count()
+        part._mapped = True
+        ids = part.columns.get("ID")
+        if ids is not None:
+            #последний ID части: по нему таблица, собранная из частей, продолжает нумерацию
+            part._last_id = next(
+                (ids.values[pos] for pos in reversed(range(part._size)) if ids.present[pos] and pos not in part.extras),
+                None,
+            )
+        return part
+
+    #Копирует столбцы из mmap в память (перед дозаписью и перезаписью файла)
+    def materialize(self) -> None:
+        if not self._mapped:
+            return
+        for column in self.columns.values():
+            column.own()
+        self.live.own()
+        self._mapped = False
+
+    #ID идут по возрастанию позиций (поиск по ID - бинарный)
+    @property
+    def ids_sorted(self) -> bool:
+        return self._id_map is None
+
+    @property
+    def mapped(self) -> bool:
+        return self._mapped
+
+    def __len__(self) -> int:
+        return self._live_count
+
+    def __iter__(self) -> Iterator[RowView]:
+        for pos in self.live.positions():
+            yield RowView(self, pos)
+
+    @property
+    def dead_count(self) -> int:
+        return self._size - self._live_count
+
+    @property
+    def nbytes(self) -> int:
+        return self.live.nbytes + sum(col.nbytes for col in self.columns.values())
+
+    #Позиция изменилась: ее сегмент нужно переписать в файл, его min/max больше не годятся
+    def _touch(self, pos: int) -> None:
+        if self.changed is not None:
+            self.changed.add(pos // SEGMENT_ROWS)
+
+    def append(self, record: dict[str, Any]) -> RowView:
+        if self._mapped:
+            self.materialize()
+        pos = self._size
+        self._touch(pos)
+        extra: dict[str, Any] = {}
+        for name, column in self.columns.items():
+            value = record.get(name, MISSING)
+            if value is not MISSING and not column.accepts(value):
+                extra[name] = value
+                value = MISSING
+            column.append(value)
+        for key, value in record.items():
+            if key not in self.columns:
+                extra[key] = value
+        if extra:
+            self.extras[pos] = extra
+
+        self.live.append(True)
+        self._size += 1
+        self._live_count += 1
+        self._track_id(pos, record.get("ID"))
+        if self._undo is not None:
+            self._undo.append(("append", pos))
+        return RowView(self, pos)
+
+    #Пока ID растут, поиск по ID - бинарный по массиву; иначе - через словарь
+    def _track_id(self, pos: int, row_id: Any) -> None:
+        if self._id_map is None:
+            if type(row_id) is int and self.columns.get("ID") is not None and (
+                self._last_id is None or row_id > self._last_id
+            ) and pos not in self.extras:
+                self._last_id = row_id
+                return
+            self._id_map = {}
+            for view in self:
+                if view.pos != pos and type(view.get("ID")) is int:
+                    self._id_map[view["ID"]] = view.pos
+        if type(row_id) is int:
+            self._id_map[row_id] = pos
+
+    def _position_of(self, row_id: Any) -> int | None:
+        if type(row_id) is not int:
+            return None
+        if self._id_map is not None:
+            return self._id_map.get(row_id)
+        ids = self.columns["ID"].values
+        pos = bisect_left(ids, row_id)
+        if pos < self._size and ids[pos] == row_id and self.live[pos]:
+            return pos
+        return None
+
+    #Пачка записей по столбцам. Если хоть одна запись не ложится в схему - построчно
+    def extend(self, records: list[dict[str, Any]]) -> range:
+        if self._mapped:
+            self.materialize()
+        start = self._size
+        width = len(self.columns)
+        batch = {name: [r.get(name, MISSING) for r in records] for name in self.columns}
+        fits = all(len(r) == width for r in records) and all(
+            column.accepts_all(batch[name]) for name, column in self.columns.items()
+        )
+        ids = batch.get("ID", [])
+        in_order = (
+            self._id_map is None
+            and bool(ids)
+            and (self._last_id is None or ids[0] > self._last_id)
+            and all(map(operator.lt, ids, ids[1:]))
+        )
+        if not (fits and in_order):
+            for record in records:
+                self.append(record)
+            return range(start, self._size)
+
+        for name, column in self.columns.items():
+            column.extend(batch[name])
+        self.live.extend_ones(len(records))
+        if self.changed is not None:
+            self.changed.update(range(start // SEGMENT_ROWS, (start + len(records) - 1) // SEGMENT_ROWS + 1))
+        self._size += len(records)
+        self._live_count += len(records)
+        self._last_id = ids[-1]
+        if self._undo is not None:
+            self._undo.extend(("append", pos) for pos in range(start, self._size))
+        return range(start, self._size)
+
+    def row(self, pos: int) -> RowView:
+        return RowView(self, pos)
+
+    #Живые строки из диапазона позиций
+    def rows_at(self, positions: range) -> Iterator[RowView]:
+        live = self.live
+        for pos in positions:
+            if live[pos]:
+                yield RowView(self, pos)
+
+    #Строки по списку ID (несуществующие пропускаются)
+    def rows_by_ids(self, ids: Iterable[int]) -> Iterator[RowView]:
+        for row_id in ids:
+            pos = self._position_of(row_id)
+            if pos is not None:
+                yield RowView(self, pos)
+
+    #Позиции строк с ID в диапазоне (бинарный поиск, пока ID идут по возрастанию), иначе None
+    def id_positions(self, op: str, value: int) -> range | None:
+        if self._id_map is not None or type(value) is not int:
+            return None
+        ids = self.columns["ID"].values
+        start, end = 0, self._size
+        if op == ">":
+            start = bisect_right(ids, value)
+        elif op == ">=":
+            start = bisect_left(ids, value)
+        elif op == "<":
+            end = bisect_left(ids, value)
+        elif op == "<=":
+            end = bisect_right(ids, value)
+        else:
+            return None
+        return range(start, end)
+
+    def row_by_id(self, row_id: Any) -> RowView | None:
+        pos = self._position_of(row_id)
+        return RowView(self, pos) if pos is not None else None
+
+    def get_value(self, pos: int, key: str) -> Any:
+        extra = self.extras.get(pos)
+        if extra is not None and key in extra:
+            return extra[key]
+        column = self.columns.get(key)
+        return column.get(pos) if column is not None else MISSING
+
+    def set_value(self, pos: int, key: str, value: Any) -> None:
+        if self._undo is not None:
+            self._undo.append(("set", pos, key, self.get_value(pos, key)))
+        self._touch(pos)
+        column = self.columns.get(key)
+        extra = self.extras.get(pos)
+        if column is not None and column.accepts(value):
+            column.set(pos, value)
+            if extra is not None and key in extra:
+                del extra[key]
+                if not extra:
+                    del self.extras[pos]
+            return
+        if column is not None:
+            column.set(pos, MISSING)
+        self.extras.setdefault(pos, {})[key] = value
+
+    def row_items(self, pos: int) -> Iterator[tuple[str, Any]]:
+        extra = self.extras.get(pos, {})
+        for name, column in self.columns.items():
+            value = extra[name] if name in extra else column.get(pos)
+            if value is not MISSING:
+                yield name, value
+        for key, value in extra.items():
+            if key not in self.columns:
+                yield key, value
+
+    #Строки, где значение столбца проходит проверку test (сравнение, IN и т.п.).
+    #segments - номера сегментов по SEGMENT_ROWS позиций, остальные не просматриваются
+    def iter_match(
+        self, key: str, test: Callable[[Any], bool], segments: Iterable[int] | None = None
+    ) -> Iterator[RowView]:
+        if segments is None:
+            return self._match_range(key, test, 0, self._size)
+        return chain.from_iterable(
+            self._match_range(key, test, start, end) for start, end in self._segment_bounds(segments)
+        )
+
+    def _match_range(self, key: str, test: Callable[[Any], bool], start: int, end: int) -> Iterator[RowView]:
+        live = self.live
+        column = self.columns.get(key)
+        hits: Iterable[int] = ()
+        if column is not None and start == 0 and end == self._size:
+            hits = column.match(test)
+        elif column is not None:
+            hits = (start + pos for pos in column.segment(start, end).match(test))
+        extra_hits = sorted(
+            pos for pos, extra in self.extras.items() if start <= pos < end and key in extra and test(extra[key])
+        )
+        for pos in heapq.merge(hits, extra_hits) if extra_hits else hits:
+            if live[pos]:
+                yield RowView(self, pos)
+
+    #Все живые строки из указанных сегментов
+    def rows_in(self, segments: Iterable[int]) -> Iterator[RowView]:
+        return chain.from_iterable(self.rows_at(range(start, end)) for start, end in self._segment_bounds(segments))
+
+    #Число живых строк в указанных сегментах
+    def live_in(self, segments: Iterable[int]) -> int:
+        return sum(self.live.segment(start, end).count() for start, end in self._segment_bounds(segments))
+
+    def _segment_bounds(self, segments: Iterable[int]) -> Iterator[tuple[int, int]]:
+        for num in segments:
+            start = num * SEGMENT_ROWS
+            if start < self._size:
+                yield start, min(self._size, start + SEGMENT_ROWS)
+
+    def delete(self, rows: Iterable[RowView]) -> None:
+        for row in rows:
+            if not self.live[row.pos]:
+                continue
+            self._kill(row.pos)
+            if self._undo is not None:
+                self._undo.append(("delete", row.pos))
+
+        if self._undo is None and needs_compaction(self.dead_count, self._size):
+            self.compact() #в транзакции не сжимаем: журнал отмены ссылается на позиции строк
+
+    def _kill(self, pos: int) -> None:
+        self._touch(pos)
+        self.live[pos] = False
+        self._live_count -= 1
+        if self._id_map is not None:
+            self._id_map.pop(self.get_value(pos, "ID"), None)
+
+    def _revive(self, pos: int) -> None:
+        self._touch(pos)
+        self.live[pos] = True
+        self._live_count += 1
+        row_id = self.get_value(pos, "ID")
+        if self._id_map is not None and type(row_id) is int:
+            self._id_map[row_id] = pos
+
+    #Журнал отмены: пока он включен, каждое изменение запоминает, как его откатить
+    def begin_undo(self) -> None:
+        self._undo = []
+
+    def end_undo(self) -> None:
+        self._undo = None
+
+    #Откат изменений с begin_undo в обратном порядке. Вставленные строки помечаются удаленными.
+    #Возвращает число отмененных изменений
+    def rollback_undo(self) -> int:
+        undo, self._undo = self._undo or [], None
+        for entry in reversed(undo):
+            kind, pos = entry[0], entry[1]
+            if kind == "set":
+                self._restore_value(pos, entry[2], entry[3])
+            elif kind == "append" and self.live[pos]:
+                self._kill(pos)
+            elif kind == "delete" and not self.live[pos]:
+                self._revive(pos)
+        return len(undo)
+
+    def _restore_value(self, pos: int, key: str, value: Any) -> None:
+        if value is not MISSING:
+            self.set_value(pos, key, value)
+            return
+        self._touch(pos)
+        column = self.columns.get(key)
+        if column is not None:
+            column.set(pos, MISSING)
+        extra = self.extras.get(pos)
+        if extra is not None and key in extra:
+            del extra[key]
+            if not extra:
+                del self.extras[pos]
+
+    #Сжатие: выбрасывает удаленные строки, позиции строк после него меняются
+    def compact(self) -> None:
+        rows = list(self.to_dicts())
+        self._reset()
+        for row in rows:
+            self.append(row)
+
+    def to_dicts(self) -> Iterator[dict[str, Any]]:
+        for pos in self.live.positions():
+            yield dict(self.row_items(pos))
@@ -2,20 +2,31 @@
 Основная логика работы с таблицами / итоговый файл с декораторами
 """
 
-from typing import Any
+import time
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator
 
-from src.decorators import confirm_action, create_cacher, log_time #импортируем созданные декораторы
+from src.decorators import confirm_action #импортируем созданные декораторы
 
-SUPPORTED_TYPES = {"int", "str", "bool"}
+from .aggregate import Aggregate, aggregate, aggregate_from_index, count_only
+from .cache import QueryCache
+from .columnar import ColumnarTable, RowView
+from .index import TableIndexes
+from .metrics import METRICS
+from .parallel import aggregate_rows, segment_count
+from .query import Predicate, plan_query
+from .schema import SUPPORTED_TYPES, DbValueError, get_schema
 
-class DbValueError(ValueError):
-    """Выводит ошибки"""
+INDEXES_KEY = "__indexes__" #служебный раздел метаданных: таблица -> индексированные столбцы
 
 #Функция создания таблиц
 def create_table(metadata: dict, table_name: str, columns: list[str]) -> dict:
     if table_name in metadata:
         raise ValueError(f'Таблица "{table_name}" уже существует.')
 
+    if table_name == INDEXES_KEY:
+        raise DbValueError(table_name)
+
     if not columns:
         raise DbValueError("columns")
 
@@ -53,126 +64,220 @@ def drop_table(metadata: dict, table_name: str) -> dict:
         raise ValueError(f'Таблица "{table_name}" не существует.')
 
     del metadata[table_name]
+    metadata.get(INDEXES_KEY, {}).pop(table_name, None)
     return metadata
 
 #Список таблиц
 def list_tables(metadata: dict) -> list[str]:
-    return sorted(metadata.keys())
+    return sorted(name for name in metadata if name != INDEXES_KEY)
+
+#Индексированные столбцы таблицы
+def table_indexes(metadata: dict, table_name: str) -> list[str]:
+    return metadata.get(INDEXES_KEY, {}).get(table_name, [])
+
+#Создание индекса
+def create_index(metadata: dict, table_name: str, column: str) -> dict:
+    get_schema(metadata, table_name).column(column)
+
+    if column == "ID":
+        raise ValueError("Столбец ID уже проиндексирован.")
+
+    columns = metadata.setdefault(INDEXES_KEY, {}).setdefault(table_name, [])
+    if column in columns:
+        raise ValueError(f'Индекс по столбцу "{column}" уже существует.')
+
+    columns.append(column)
+    return metadata
+
+#Удаление индекса
+def drop_index(metadata: dict, table_name: str, column: str) -> dict:
+    columns = table_indexes(metadata, table_name)
+    if column not in columns:
+        raise ValueError(f'Индекса по столбцу "{column}" в таблице "{table_name}" нет.')
+
+    columns.remove(column)
+    if not columns:
+        del metadata[INDEXES_KEY][table_name]
+    return metadata
 
 #Выводит колонки
 def format_columns_for_print(columns: list[str]) -> str:
     return ", ".join(columns)
 
 #Обновление логики - CRUD
-@log_time
 def insert(
     metadata: dict,
     table_name: str,
     values: list[str],
-    table_data: list[dict[str, Any]],
-) -> list[dict[str, Any]]:
-    if table_name not in metadata:
-        raise ValueError(f'Таблица "{table_name}" не существует.')
-
-    schema = metadata[table_name]
-    if len(values) != len(schema) - 1:
-        raise DbValueError("values")
+    table_data: ColumnarTable,
+    new_id: int,
+    indexes: TableIndexes | None = None,
+) -> ColumnarTable:
+    schema = get_schema(metadata, table_name)
+    record: dict[str, Any] = {"ID": new_id}
+    record.update(schema.parse_values(values))
 
-    max_id = 0
-    for row in table_data:
-        row_id = row.get("ID", 0)
-        if isinstance(row_id, int) and row_id > max_id:
-            max_id = row_id
-    new_id = max_id + 1
+    row = table_data.append(record)
+    if indexes is not None:
+        indexes.add(row)
+    return table_data
 
-    record: dict[str, Any] = {"ID": new_id}
 
-    for idx, col_def in enumerate(schema[1:], start=0):
-        col_name, col_type = col_def.split(":", 1)
-        col_name = col_name.strip()
-        col_type = col_type.strip()
-        raw = values[idx].strip()
+LOAD_BATCH_SIZE = 10_000 #по сколько строк приводить и добавлять при массовой загрузке
 
-        if col_type == "int":
+#Массовая загрузка: приводит записи к схеме и добавляет их пачками, раздает ID подряд с first_id.
+#Плохие строки не прерывают загрузку, а возвращаются списком (номер, запись, причина).
+#on_batch получает каждую принятую пачку (например, для записи в журнал таблицы)
+def bulk_insert(
+    metadata: dict,
+    table_name: str,
+    records: Iterable[tuple[int, Any]],
+    table_data: ColumnarTable,
+    first_id: int,
+    indexes: TableIndexes | None = None,
+    on_batch: Callable[[list[dict[str, Any]]], None] | None = None,
+) -> tuple[int, list[tuple[int, Any, str]]]:
+    columns = get_schema(metadata, table_name).data_columns
+
+    next_id = first_id
+    rejected: list[tuple[int, Any, str]] = []
+    records = iter(records)
+    while batch := list(islice(records, LOAD_BATCH_SIZE)):
+        accepted: list[dict[str, Any]] = []
+        for num, raw in batch:
+            if type(raw) is not dict:
+                rejected.append((num, raw, "строка не является записью"))
+                continue
             try:
-                record[col_name] = int(raw)
-            except ValueError as e:
-                raise DbValueError(raw) from e
-
-        elif col_type == "bool":
-            low = raw.lower()
-            if low == "true":
-                record[col_name] = True
-            elif low == "false":
-                record[col_name] = False
-            else:
-                raise DbValueError(raw)
-
-        elif col_type == "str":
-            if len(raw) >= 2 and (
-                (raw[0] == '"' and raw[-1] == '"') or (raw[0] == "'" and raw[-1] == "'")
-            ):
-                record[col_name] = raw[1:-1]
-            else:
-                raise DbValueError(raw)
-
-        else:
-            raise DbValueError(col_type)
+                record = {"ID": next_id}
+                for col in columns:
+                    record[col.name] = col.load(raw.get(col.name))
+            except DbValueError as e:
+                rejected.append((num, raw, str(e)))
+                continue
+            accepted.append(record)
+            next_id += 1
+
+        table_data.extend(accepted)
+        if indexes is not None:
+            indexes.extend(accepted)
+        if on_batch is not None:
+            on_batch(accepted)
+
+    return next_id - first_id, rejected
+
+
+_SELECT_CACHE = QueryCache() #ограниченный LRU-кэш, сбрасывается при смене версии таблицы
+
+#Статистика кэша select: попадания, промахи, вытеснения
+def select_cache_stats() -> dict[str, int]:
+    return _SELECT_CACHE.stats()
 
-    table_data.append(record)
-    return table_data
 
+METRICS.register_source("select_cache", select_cache_stats)
 
-_SELECT_CACHE = create_cacher()
 
+def _select_cache_key(where: Predicate) -> tuple:
+    return ("select_where", where.key())
 
-# Фукнция select
-@log_time
+
+#Лежит ли результат select с этим условием в кэше (для explain; статистика кэша не меняется)
+def select_is_cached(table_name: str, version: tuple[int, int], where: Predicate) -> bool:
+    return _SELECT_CACHE.contains(table_name, version, _select_cache_key(where))
+
+
+# Фукнция select: отдает строки лениво, limit/offset останавливают проход досрочно.
+#В метрики rows_scanned идет число строк к просмотру по плану (с limit - оценка сверху)
 def select(
-    table_data: list[dict[str, Any]],
-    where_clause: dict[str, Any] | None = None,
-) -> list[dict[str, Any]]:
-    def compute() -> list[dict[str, Any]]:
-        if where_clause is None:
-            return table_data
-
-        (key, value), = where_clause.items()
-        result: list[dict[str, Any]] = []
-        for row in table_data:
-            if row.get(key) == value:
-                result.append(row)
-        return result
-
-    max_id = 0
-    for row in table_data:
-        row_id = row.get("ID", 0)
-        if isinstance(row_id, int) and row_id > max_id:
-            max_id = row_id
-
-    if where_clause is None:
-        cache_key = ("select_all", len(table_data), max_id)
-    else:
-        (k, v), = where_clause.items()
-        cache_key = ("select_where", k, v, len(table_data), max_id)
-
-    return _SELECT_CACHE(cache_key, compute)
+    table_name: str,
+    table_data: ColumnarTable,
+    version: tuple[int, int],
+    where: Predicate | None = None,
+    indexes: TableIndexes | None = None,
+    limit: int | None = None,
+    offset: int = 0,
+) -> Iterator[RowView]:
+    stop = None if limit is None else offset + limit
+    if where is None:
+        scanned = len(table_data) if stop is None else min(len(table_data), stop)
+        METRICS.add("rows_scanned", table_name, scanned)
+        return islice(table_data, offset, stop)
+
+    plan = plan_query(table_data, where, indexes)
+    if plan.access != "full_scan":
+        METRICS.add("rows_scanned", table_name, plan.estimated_rows)
+        return islice(plan.rows(), offset, stop) #поиск по ID/индексу и так дешевый
+
+    def scan() -> list[RowView]:
+        METRICS.add("rows_scanned", table_name, plan.estimated_rows)
+        return list(plan.rows())
+
+    cache_key = _select_cache_key(where)
+    if limit is None:
+        rows = _SELECT_CACHE.get_or_compute(table_name, version, cache_key, scan)
+        return islice(rows, offset, None)
+
+    #С limit полный результат не нужен: берем из кэша, если он там уже есть, иначе сканируем до N-й строки
+    cached = _SELECT_CACHE.peek(table_name, version, cache_key)
+    if cached is not None:
+        return islice(cached, offset, stop)
+    METRICS.add("rows_scanned", table_name, plan.estimated_rows)
+    return islice(plan.rows(), offset, stop)
+
+
+#select с агрегатами: без условия - сначала попытка ответить по индексам, иначе один проход
+#по строкам плана (поиск по ID/индексу или полный проход)
+def select_aggregates(
+    table_name: str,
+    table_data: ColumnarTable,
+    aggregates: list[Aggregate],
+    where: Predicate | None = None,
+    indexes: TableIndexes | None = None,
+    group_by: str | None = None,
+) -> list[tuple[Any, ...]]:
+    if where is None:
+        rows = aggregate_from_index(table_data, aggregates, group_by, indexes)
+        if rows is not None:
+            return rows
+        METRICS.add("rows_scanned", table_name, len(table_data))
+        if group_by is not None and segment_count(table_data):
+            return aggregate_rows(table_data, None, None, aggregates, group_by)
+        return aggregate(table_data, aggregates, group_by)
+
+    plan = plan_query(table_data, where, indexes)
+    if plan.access == "index_lookup" and plan.residual is None and group_by is None and count_only(aggregates):
+        return [tuple(plan.estimated_rows for _ in aggregates)] #список ID из индекса и есть ответ
+
+    METRICS.add("rows_scanned", table_name, plan.estimated_rows)
+    if plan.segments: #процессы возвращают частичные итоги групп, здесь они сливаются
+        start = time.perf_counter_ns()
+        rows = aggregate_rows(
+            table_data, plan.driver, plan.residual, aggregates, group_by, plan.count_segment, plan.parts
+        )
+        plan.filter_ns += time.perf_counter_ns() - start
+        return rows
+    return aggregate(table_data, aggregates, group_by, (row.pos for row in plan.rows()))
 
 
 #Update для обновления записей
 def update(
-    table_data: list[dict[str, Any]],
+    table_data: ColumnarTable,
     set_clause: dict[str, Any],
-    where_clause: dict[str, Any],
-) -> tuple[list[dict[str, Any]], list[int]]:
-    (where_key, where_val), = where_clause.items()
+    where: Predicate,
+    indexes: TableIndexes | None = None,
+) -> tuple[ColumnarTable, list[int]]:
     (set_key, set_val), = set_clause.items()
 
+    matched = list(plan_query(table_data, where, indexes).rows())
+
     updated_ids: list[int] = []
-    for row in table_data:
-        if row.get(where_key) == where_val:
-            row[set_key] = set_val
-            if isinstance(row.get("ID"), int):
-                updated_ids.append(row["ID"])
+    for row in matched:
+        old_value = row.get(set_key)
+        row[set_key] = set_val
+        if indexes is not None:
+            indexes.change(row, set_key, old_value)
+        if isinstance(row.get("ID"), int):
+            updated_ids.append(row["ID"])
 
     return table_data, updated_ids
 
@@ -180,19 +285,18 @@ def update(
 #Удаление записей
 @confirm_action("удаление записи")
 def delete(
-    table_data: list[dict[str, Any]],
-    where_clause: dict[str, Any],
-) -> tuple[list[dict[str, Any]], list[int]]:
-    (key, value), = where_clause.items()
+    table_data: ColumnarTable,
+    where: Predicate,
+    indexes: TableIndexes | None = None,
+) -> tuple[ColumnarTable, list[int]]:
+    matched = list(plan_query(table_data, where, indexes).rows())
 
     deleted_ids: list[int] = []
-    new_data: list[dict[str, Any]] = []
-
-    for row in table_data:
-        if row.get(key) == value:
-            if isinstance(row.get("ID"), int):
-                deleted_ids.append(row["ID"])
-        else:
-            new_data.append(row)
-
-    return new_data, deleted_ids
\ No newline at end of file
+    for row in matched:
+        if indexes is not None:
+            indexes.remove(row)
+        if isinstance(row.get("ID"), int):
+            deleted_ids.append(row["ID"])
+
+    table_data.delete(matched)
+    return table_data, deleted_ids
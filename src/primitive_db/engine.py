@@ -1,137 +1,143 @@
 """
 Запуск, игровой цикл и парсинг команд / финальный с выводом ошибок через декораторы
 """
+import contextlib
+import io
+import os
+import re
 import shlex
+import time
+from itertools import islice
+from typing import Iterable
 
 import prompt
-from prettytable import PrettyTable
 
 from src.decorators import handle_db_errors
 
+from .aggregate import count_only
 from .core import (
     DbValueError,
+    bulk_insert,
+    create_index,
     create_table,
     delete,
+    drop_index,
     drop_table,
     format_columns_for_print,
     insert,
     list_tables,
     select,
+    select_aggregates,
+    select_is_cached,
+    table_indexes,
     update,
 )
-from .utils import load_metadata, load_table_data, save_metadata, save_table_data
+from .index import TableIndexes
+from .metrics import METRICS
+from .output import FORMATS as OUTPUT_FORMATS
+from .output import configure as configure_output
+from .output import output_format, pretty_table, write_rows
+from .parallel import min_rows as parallel_min_rows
+from .parallel import workers as parallel_workers
+from .query import Plan, Predicate, analyze_plans, plan_query
+from .schema import get_schema
+from .statements import (
+    STATEMENTS,
+    Bound,
+    Delete,
+    Explain,
+    Insert,
+    Select,
+    Update,
+    count_value,
+    path_value,
+    prepare,
+    value,
+)
+from .storage import TableManager
+from .utils import iter_import_file, save_rejected_rows, table_file_size
 
 META_FILEPATH = "db_meta.json"
 
+_EXPLAIN_RE = re.compile(r"^\s*explain(\s+analyze)?\s+", re.IGNORECASE)
+
+_TABLES = TableManager(META_FILEPATH) #таблицы и метаданные живут в памяти между командами
+
+#Команды, которые меняют схему или пишут файлы напрямую: внутри транзакции их не откатить
+_NON_TRANSACTIONAL = {"create_table", "drop_table", "create_index", "drop_index", "load", "convert", "vacuum"}
+
+#Команды с таблицей: у этих имя таблицы - третье слово (select from users ...), у остальных - второе
+_TABLE_THIRD = {"select", "insert", "delete"}
+_TABLE_SECOND = {
+    "update", "info", "load", "convert", "vacuum", "create_table", "drop_table", "create_index", "drop_index"
+}
+
+METRICS.register_source("wal", lambda: {"commits": _TABLES.wal.commits, "syncs": _TABLES.wal.syncs})
+
 #Выводит вспомогательные команды для пользователей
 def print_help() -> None:
     print("\n***Операции с данными***\n")
     print("Функции:")
     print('<command> insert into <имя_таблицы> values (<значение1>, <значение2>, ...) - создать запись.')
-    print("<command> select from <имя_таблицы> where <столбец> = <значение> - прочитать записи по условию.")
+    print("<command> select from <имя_таблицы> where <условие> - прочитать записи по условию.")
     print("<command> select from <имя_таблицы> - прочитать все записи.")
+    print("<command> select ... [limit <N>] [offset <M>] - прочитать не больше N записей, пропустив первые M.")
+    print(
+        "<command> select ... [format table|jsonl|csv|tsv] [into outfile <путь>] - вывести записи в формате "
+        "(в конце команды) или записать в файл."
+    )
+    print(
+        "<command> select count(*), sum(<столбец>), avg(..), min(..), max(..) from <имя_таблицы> "
+        "[where <условие>] [group by <столбец>] - итоги по записям."
+    )
     print(
         "<command> update <имя_таблицы> set <столбец1> = <новое_значение1> "
-        "where <столбец_условия> = <значение_условия> - обновить запись."
+        "where <условие> - обновить записи."
+    )
+    print("<command> delete from <имя_таблицы> where <условие> - удалить записи.")
+    print("<command> load <имя_таблицы> from <путь> [format csv|jsonl] - загрузить записи из файла.")
+    print("<command> info <имя_таблицы> - вывести информацию о таблице.")
+    print("<command> begin / commit / rollback - начать, зафиксировать или отменить транзакцию.")
+    print("<command> explain [analyze] <select|update|delete ...> - план запроса (analyze - выполнить и замерить).")
+    print(
+        "Условие: <столбец> =|!=|<|<=|>|>= <значение>, <столбец> in (<значение1>, ...), "
+        "условия объединяются через and/or и скобки.\n"
     )
-    print("<command> delete from <имя_таблицы> where <столбец> = <значение> - удалить запись.")
-    print("<command> info <имя_таблицы> - вывести информацию о таблице.\n")
 
     print("Команды управления таблицами:")
     print("<command> create_table <имя_таблицы> <столбец1:тип> .. - создать таблицу")
     print("<command> list_tables - показать список всех таблиц")
-    print("<command> drop_table <имя_таблицы> - удалить таблицу\n")
+    print("<command> drop_table <имя_таблицы> - удалить таблицу")
+    print("<command> create_index <имя_таблицы> <столбец> - создать индекс по столбцу")
+    print("<command> drop_index <имя_таблицы> <столбец> - удалить индекс")
+    print("<command> convert <имя_таблицы> to binary|jsonl|segments - перевести файл таблицы в другой формат")
+    print("<command> vacuum <имя_таблицы> - сжать таблицу: убрать удаленные строки и старые версии из файла")
+    print("<command> output [table|jsonl|csv|tsv] - показать или сменить формат вывода select по умолчанию")
+    print("<command> stats [reset] - задержки команд (p50/p95/p99), строки, байты, попадания в кэши\n")
 
     print("Общие команды:")
     print("<command> exit - выход из программы")
     print("<command> help- справочная информация\n")
 
-#Обновленный двигатель - добавлены CRUD-команды
-def _split_values(values_text: str) -> list[str]:
-    items: list[str] = []
-    buf = ""
-    in_quotes = False
-    quote_char = ""
-
-    for ch in values_text:
-        if ch in ("'", '"'):
-            if not in_quotes:
-                in_quotes = True
-                quote_char = ch
-            elif quote_char == ch:
-                in_quotes = False
-
-        if ch == "," and not in_quotes:
-            items.append(buf.strip())
-            buf = ""
-            continue
-
-        buf += ch
-
-    if buf.strip():
-        items.append(buf.strip())
-
-    return items
-
-
-def _parse_expr(text: str) -> tuple[str, str]:
-    if "=" not in text:
-        raise DbValueError(text)
-
-    left, right = text.split("=", 1)
-    col = left.strip()
-    raw = right.strip()
-
-    if col == "" or raw == "":
-        raise DbValueError(text)
-
-    return col, raw
-
-
-def _cast_by_schema(metadata: dict, table_name: str, col: str, raw: str):
-    if table_name not in metadata:
-        raise ValueError(f'Таблица "{table_name}" не существует.')
-
-    col_type = None
-    for item in metadata[table_name]:
-        name, t = item.split(":", 1)
-        if name.strip() == col:
-            col_type = t.strip()
-            break
-
-    if col_type is None:
-        raise DbValueError(col)
-
-    if col_type == "int":
-        try:
-            return int(raw)
-        except ValueError as e:
-            raise DbValueError(raw) from e
-
-    if col_type == "bool":
-        low = raw.lower()
-        if low == "true":
-            return True
-        if low == "false":
-            return False
-        raise DbValueError(raw)
-
-    if col_type == "str":
-        s = raw.strip()
-        if len(s) >= 2 and ((s[0] == '"' and s[-1] == '"') or (s[0] == "'" and s[-1] == "'")):
-            return s[1:-1]
-        raise DbValueError(raw)
-
-    raise DbValueError(col_type)
-
-#Вывод таблицы
-def _print_table(metadata: dict, table_name: str, rows: list[dict]) -> None:
-    columns = [item.split(":", 1)[0].strip() for item in metadata.get(table_name, [])]
-    table = PrettyTable()
-    table.field_names = columns
-    for row in rows:
-        table.add_row([row.get(col) for col in columns])
-    print(table)
+#Индексы таблицы (первичный по ID и вторичные из метаданных)
+def _indexes(metadata: dict, table_name: str) -> TableIndexes:
+    return _TABLES.get_indexes(table_name, table_indexes(metadata, table_name))
+
+#Результат select в формате вывода (таблица - страницами) или в файл. Возвращает число строк
+def _print_table(
+    table_name: str,
+    columns: list[str],
+    rows: Iterable[Iterable],
+    out_format: str,
+    outfile: str | None,
+) -> int:
+    printed = write_rows(columns, rows, out_format, outfile)
+    METRICS.add("rows_returned", table_name, printed)
+    if outfile is not None:
+        print(f"Записано строк: {printed} в {outfile}")
+    elif not printed and out_format == "table":
+        print("Записей нет.")
+    return printed
 
 #Декораторы
 @handle_db_errors
@@ -153,7 +159,8 @@ def _cmd_create_table(metadata: dict, rest: list[str]) -> None:
     columns = rest[1:]
 
     new_metadata = create_table(metadata, table_name, columns)
-    save_metadata(META_FILEPATH, new_metadata)
+    _TABLES.save_metadata(new_metadata, "create_table")
+    _TABLES.discard(table_name) #схема поменялась - старую копию таблицы в памяти не используем
 
     cols_text = format_columns_for_print(new_metadata[table_name])
     print(f'Таблица "{table_name}" успешно создана со столбцами: {cols_text}')
@@ -165,125 +172,197 @@ def _cmd_drop_table(metadata: dict, rest: list[str]) -> None:
         raise DbValueError("drop_table")
 
     table_name = rest[0]
+    indexed = list(table_indexes(metadata, table_name))
     new_metadata = drop_table(metadata, table_name)
 
     if new_metadata is None:
         return
 
-    save_metadata(META_FILEPATH, new_metadata)
+    _TABLES.save_metadata(new_metadata, "drop_table")
+    for column in indexed:
+        _TABLES.drop_index(table_name, column)
+    _TABLES.discard(table_name)
     print(f'Таблица "{table_name}" успешно удалена.')
 
 
 @handle_db_errors
-def _cmd_insert(metadata: dict, user_input: str, args: list[str]) -> None:
-    if len(args) < 4 or args[1] != "into" or args[3] != "values":
-        raise DbValueError("insert")
+def _cmd_create_index(metadata: dict, rest: list[str]) -> None:
+    if len(rest) != 2:
+        raise DbValueError("create_index")
 
-    table_name = args[2]
-    table_data = load_table_data(table_name)
+    table_name, column = rest
+    new_metadata = create_index(metadata, table_name, column)
+    _TABLES.save_metadata(new_metadata, "create_index")
 
-    low = user_input.lower()
-    pos = low.find("values")
-    if pos == -1:
-        raise DbValueError("values")
-
-    after = user_input[pos + len("values") :].strip()
-    if not (after.startswith("(") and after.endswith(")")):
-        raise DbValueError(after)
-
-    inside = after[1:-1].strip()
-    values = _split_values(inside)
-
-    table_data = insert(metadata, table_name, values, table_data)
-    save_table_data(table_name, table_data)
-
-    new_id = table_data[-1]["ID"]
-    print(f'Запись с ID={new_id} успешно добавлена в таблицу "{table_name}".')
+    _indexes(new_metadata, table_name)
+    _TABLES.save_indexes(table_name)
+    print(f'Индекс по столбцу "{column}" таблицы "{table_name}" успешно создан.')
 
 
 @handle_db_errors
-def _cmd_select(metadata: dict, user_input: str, args: list[str]) -> None:
-    if len(args) < 3 or args[1] != "from":
-        raise DbValueError("select")
-
-    table_name = args[2]
-    table_data = load_table_data(table_name)
+def _cmd_drop_index(metadata: dict, rest: list[str]) -> None:
+    if len(rest) != 2:
+        raise DbValueError("drop_index")
 
-    if table_name not in metadata:
-        raise ValueError(f'Таблица "{table_name}" не существует.')
-
-    if len(args) == 3:
-        rows = select(table_data)
-        if not rows:
-            print("Записей нет.")
-        else:
-            _print_table(metadata, table_name, rows)
-        return
+    table_name, column = rest
+    new_metadata = drop_index(metadata, table_name, column)
+    _TABLES.save_metadata(new_metadata, "drop_index")
+    _TABLES.drop_index(table_name, column)
+    print(f'Индекс по столбцу "{column}" таблицы "{table_name}" успешно удален.')
 
-    if len(args) >= 5 and args[3] == "where":
-        where_text = user_input.lower().split("where", 1)[1].strip()
-        col, raw = _parse_expr(where_text)
-        value = _cast_by_schema(metadata, table_name, col, raw)
 
-        rows = select(table_data, {col: value})
-        if not rows:
-            print("Записей нет.")
-        else:
-            _print_table(metadata, table_name, rows)
-        return
+@handle_db_errors
+def _cmd_insert(metadata: dict, statement: Insert, params: list[str]) -> None:
+    table_name = statement.table
+    table_data = _TABLES.get_table(table_name)
+    values = [value(slot, params) for slot in statement.values]
+
+    new_id = _TABLES.next_id(table_name)
+    table_data = insert(
+        metadata,
+        table_name,
+        values,
+        table_data,
+        new_id,
+        _indexes(metadata, table_name),
+    )
+    _TABLES.append_row(table_name, table_data.row_by_id(new_id).to_dict())
 
-    raise DbValueError("select")
+    print(f'Запись с ID={new_id} успешно добавлена в таблицу "{table_name}".')
 
 
 @handle_db_errors
-def _cmd_update(metadata: dict, user_input: str, args: list[str]) -> None:
-    if len(args) < 2:
-        raise DbValueError("update")
-
-    table_name = args[1]
-    table_data = load_table_data(table_name)
+def _cmd_load(metadata: dict, args: list[str]) -> None:
+    if len(args) not in (4, 6) or args[2] != "from":
+        raise DbValueError("load")
+
+    table_name, path = args[1], args[3]
+    if len(args) == 6:
+        if args[4] != "format" or args[5] not in ("csv", "jsonl"):
+            raise DbValueError(" ".join(args[4:]))
+        file_format = args[5]
+    else:
+        file_format = "csv" if path.lower().endswith(".csv") else "jsonl"
+
+    table_data = _TABLES.get_table(table_name)
+    indexes = _indexes(metadata, table_name)
+
+    start = time.monotonic()
+    with _TABLES.bulk_append(table_name) as write_batch:
+        loaded, rejected = bulk_insert(
+            metadata,
+            table_name,
+            iter_import_file(path, file_format),
+            table_data,
+            _TABLES.next_id(table_name),
+            indexes,
+            write_batch,
+        )
+    elapsed = time.monotonic() - start
+
+    rate = loaded / elapsed if elapsed > 0 else float(loaded)
+    print(
+        f'Загружено {loaded} записей в таблицу "{table_name}" '
+        f"за {elapsed:.3f} секунд ({rate:.0f} записей/сек)."
+    )
+    if rejected:
+        rejected_path = f"{os.path.splitext(path)[0]}.rejected.jsonl"
+        save_rejected_rows(rejected_path, rejected)
+        print(f"Отклонено строк: {len(rejected)}, подробности в {rejected_path}")
+
+
+#limit и offset select (у update и delete их нет)
+def _window(statement: Select | Update | Delete, params: list[str]) -> tuple[int | None, int]:
+    if not isinstance(statement, Select):
+        return None, 0
+    limit = None if statement.limit is None else count_value(statement.limit, params)
+    offset = 0 if statement.offset is None else count_value(statement.offset, params)
+    return limit, offset
+
+
+#select count(*), sum(<столбец>), ... from <таблица> [where ...] [group by <столбец>]: столбцы и строки итогов
+def _select_aggregates(
+    metadata: dict,
+    table_name: str,
+    bound: Bound,
+    where: Predicate | None,
+) -> tuple[list[str], list[tuple]]:
+    aggregates, group_by = bound.aggregates or [], bound.group_by
+    if where is None and group_by is None and count_only(aggregates):
+        #число строк известно без загрузки таблицы
+        count = _TABLES.row_count(table_name)
+        rows = [tuple(count for _ in aggregates)]
+    else:
+        rows = select_aggregates(
+            table_name,
+            _TABLES.get_table(table_name),
+            aggregates,
+            where,
+            _indexes(metadata, table_name),
+            group_by,
+        )
 
-    low = user_input.lower()
-    if " set " not in low or " where " not in low:
-        raise DbValueError("update")
+    columns = ([group_by] if group_by is not None else []) + [str(agg) for agg in aggregates]
+    return columns, rows
 
-    set_part = user_input.split("set", 1)[1].rsplit("where", 1)[0].strip()
-    where_part = user_input.rsplit("where", 1)[1].strip()
 
-    set_col, set_raw = _parse_expr(set_part)
-    where_col, where_raw = _parse_expr(where_part)
+@handle_db_errors
+def _cmd_select(metadata: dict, statement: Select, bound: Bound, params: list[str]) -> int:
+    table_name = statement.table
+    limit, offset = _window(statement, params)
+    where = bound.predicate(params)
+
+    if bound.aggregates is None:
+        indexes = None if where is None else _indexes(metadata, table_name)
+        rows = select(
+            table_name,
+            _TABLES.get_table(table_name),
+            _TABLES.version(table_name),
+            where,
+            indexes,
+            limit,
+            offset,
+        )
+        columns = bound.schema.names
+        values: Iterable[Iterable] = ([row.get(col) for col in columns] for row in rows)
+    else:
+        columns, totals = _select_aggregates(metadata, table_name, bound, where)
+        values = islice(totals, offset, None if limit is None else offset + limit)
 
-    if set_col == "ID":
-        raise DbValueError("ID")
+    out_format = statement.format or output_format()
+    outfile = None if statement.outfile is None else path_value(statement.outfile, params)
+    return _print_table(table_name, columns, values, out_format, outfile)
 
-    set_val = _cast_by_schema(metadata, table_name, set_col, set_raw)
-    where_val = _cast_by_schema(metadata, table_name, where_col, where_raw)
 
-    table_data, updated_ids = update(table_data, {set_col: set_val}, {where_col: where_val})
+@handle_db_errors
+def _cmd_update(metadata: dict, statement: Update, bound: Bound, params: list[str]) -> None:
+    table_name = statement.table
+    table_data = _TABLES.get_table(table_name)
+
+    where = bound.predicate(params)
+    set_col = bound.column.name
+    set_val = bound.column.parse(value(statement.value, params))
+
+    table_data, updated_ids = update(
+        table_data,
+        {set_col: set_val},
+        where,
+        _indexes(metadata, table_name),
+    )
     if not updated_ids:
         print("Ошибка: Записи не найдены.")
         return
 
-    save_table_data(table_name, table_data)
+    _TABLES.update_rows(table_name, updated_ids, {set_col: set_val})
     print(f'Запись с ID={updated_ids[0]} в таблице "{table_name}" успешно обновлена.')
 
 
 @handle_db_errors
-def _cmd_delete(metadata: dict, user_input: str, args: list[str]) -> None:
-    if len(args) < 4 or args[1] != "from":
-        raise DbValueError("delete")
-
-    table_name = args[2]
-    table_data = load_table_data(table_name)
-
-    if args[3] != "where":
-        raise DbValueError("where")
+def _cmd_delete(metadata: dict, statement: Delete, bound: Bound, params: list[str]) -> None:
+    table_name = statement.table
+    table_data = _TABLES.get_table(table_name)
 
-    where_text = user_input.lower().split("where", 1)[1].strip()
-    col, raw = _parse_expr(where_text)
-    value = _cast_by_schema(metadata, table_name, col, raw)
-
-    result = delete(table_data, {col: value})
+    result = delete(table_data, bound.predicate(params), _indexes(metadata, table_name))
     if result is None:
         return
 
@@ -292,10 +371,35 @@ def _cmd_delete(metadata: dict, user_input: str, args: list[str]) -> None:
         print("Ошибка: Записи не найдены.")
         return
 
-    save_table_data(table_name, table_data)
+    _TABLES.delete_rows(table_name, deleted_ids)
     print(f'Запись с ID={deleted_ids[0]} успешно удалена из таблицы "{table_name}".')
 
 
+#Команда с данными (select, insert, update, delete, explain): разбор берется из кэша по тексту команды
+#с ? вместо литералов, привязка - по схеме таблицы. Возвращает имя таблицы (None - ошибка)
+@handle_db_errors
+def _cmd_statement(metadata: dict, user_input: str) -> str | None:
+    prepared, params = prepare(user_input)
+    statement = prepared.statement
+    table_name = statement.table
+    if table_name not in metadata:
+        raise ValueError(f'Таблица "{table_name}" не существует.')
+
+    bound = prepared.bind(get_schema(metadata, table_name))
+    match statement:
+        case Select():
+            _cmd_select(metadata, statement, bound, params)
+        case Insert():
+            _cmd_insert(metadata, statement, params)
+        case Update():
+            _cmd_update(metadata, statement, bound, params)
+        case Delete():
+            _cmd_delete(metadata, statement, bound, params)
+        case Explain():
+            _cmd_explain(metadata, user_input, statement, bound, params)
+    return table_name
+
+
 @handle_db_errors
 def _cmd_info(metadata: dict, args: list[str]) -> None:
     if len(args) != 2:
@@ -305,58 +409,501 @@ def _cmd_info(metadata: dict, args: list[str]) -> None:
     if table_name not in metadata:
         raise ValueError(f'Таблица "{table_name}" не существует.')
 
-    table_data = load_table_data(table_name)
     cols_text = format_columns_for_print(metadata[table_name])
+    indexed = table_indexes(metadata, table_name)
 
     print(f"Таблица: {table_name}")
     print(f"Столбцы: {cols_text}")
-    print(f"Количество записей: {len(table_data)}")
+    print(f"Индексы: {format_columns_for_print(indexed) if indexed else 'нет'}")
+    print(f"Формат файла: {_TABLES.file_format(table_name)}")
 
-#Основной цикл: чтение, парсинг команд, обработка
-def run() -> None:
-    print_help()
+    stats = _TABLES.table_stats(table_name, exact=True) #обычно из файла статистики, без строк таблицы
+    print(f"Количество записей: {stats.rows}")
+    print(f"Следующий ID: {stats.next_id}")
+    if not stats.rows:
+        return
+    table = pretty_table(["Столбец", "мин", "макс", "пропусков", "различных (~)"])
+    for name, column in stats.columns.items():
+        table.add_row([name, column.min, column.max, column.missing, column.distinct_count()])
+    print(table)
 
-    while True:
-        metadata = load_metadata(META_FILEPATH)
-        user_input = prompt.string(">>>Введите команду: ").strip()
-        args = shlex.split(user_input)
 
-        if not args:
+@handle_db_errors
+def _cmd_convert(metadata: dict, args: list[str]) -> None:
+    if len(args) != 4 or args[2] != "to" or args[3] not in ("jsonl", "binary", "segments"):
+        raise DbValueError("convert")
+
+    table_name, file_format = args[1], args[3]
+    if table_name not in metadata:
+        raise ValueError(f'Таблица "{table_name}" не существует.')
+
+    _indexes(metadata, table_name) #индексы пересохранятся под новый файл таблицы
+    old_format = _TABLES.convert(table_name, file_format)
+    if old_format == file_format:
+        print(f'Таблица "{table_name}" уже хранится в формате {file_format}.')
+        return
+
+    size = table_file_size(table_name, file_format)
+    print(
+        f'Таблица "{table_name}" переведена из формата {old_format} в {file_format} '
+        f"(размер файла: {size / 1024:.1f} КБ)."
+    )
+
+@handle_db_errors
+def _cmd_vacuum(metadata: dict, args: list[str]) -> None:
+    if len(args) != 2:
+        raise DbValueError("vacuum")
+
+    table_name = args[1]
+    if table_name not in metadata:
+        raise ValueError(f'Таблица "{table_name}" не существует.')
+
+    garbage = _TABLES.vacuum(table_name)
+    if not garbage:
+        print(f'В таблице "{table_name}" нечего сжимать.')
+        return
+
+    size = table_file_size(table_name, _TABLES.file_format(table_name))
+    print(f'Таблица "{table_name}" сжата: убрано строк мусора {garbage} (размер файла: {size / 1024:.1f} КБ).')
+
+#output - текущий формат вывода select, output <формат> - сменить его для следующих команд
+@handle_db_errors
+def _cmd_output(args: list[str]) -> None:
+    if len(args) == 1:
+        print(f"Формат вывода: {output_format()}")
+        return
+    if len(args) != 2 or args[1] not in OUTPUT_FORMATS:
+        raise DbValueError("output")
+    configure_output(args[1])
+    print(f"Формат вывода: {args[1]}")
+
+@handle_db_errors
+def _cmd_begin() -> None:
+    _TABLES.begin()
+    print("Транзакция начата.")
+
+
+@handle_db_errors
+def _cmd_commit() -> None:
+    _TABLES.commit_transaction()
+    print("Транзакция зафиксирована.")
+
+
+@handle_db_errors
+def _cmd_rollback() -> None:
+    undone = _TABLES.rollback()
+    print(f"Транзакция отменена (отменено изменений: {undone}).")
+
+_ACCESS_TEXT = {
+    "full_scan": "полный проход",
+    "id_lookup": "поиск по ID",
+    "id_range": "диапазон ID",
+    "index_lookup": "поиск по индексу",
+    "index_union": "объединение поисков по ID и индексам",
+}
+
+def _access_text(plan: Plan) -> str:
+    text = _ACCESS_TEXT[plan.access]
+    column = getattr(plan.driver, "column", None)
+    if plan.access in ("full_scan", "index_lookup") and column is not None:
+        text += f" по столбцу {column}"
+    if plan.segments:
+        text += f", параллельно: сегментов {plan.segments}, процессов {parallel_workers()}"
+    if plan.pruned is not None:
+        text += f", пропущено частей по min/max: {plan.pruned[0]} из {plan.pruned[1]}"
+    return text
+
+
+def _estimate_text(plan: Plan) -> str:
+    text = f"оценка строк: {plan.estimated_rows}"
+    if plan.estimated_matches is not None:
+        text += f", подойдет по статистике: ~{plan.estimated_matches}"
+    return text
+
+
+#Почему большая таблица проходится в одном процессе, хотя процессов задано больше одного
+def _print_serial_reason(table_name: str, plan: Plan) -> None:
+    if plan.access != "full_scan" or plan.segments or parallel_workers() < 2:
+        return
+    if len(_TABLES.get_table(table_name)) < parallel_min_rows():
+        return
+    if _TABLES.file_format(table_name) == "jsonl":
+        print("Параллельный проход: нет - таблица в формате jsonl (параллельно проходятся binary и segments)")
+    else:
+        print("Параллельный проход: нет - изменения таблицы еще не записаны в файл (до контрольной точки)")
+
+
+def _print_steps(plan: Plan) -> None:
+    steps = plan.steps()
+    if not steps:
+        return
+    print("Порядок условий:")
+    for num, pred in enumerate(steps, start=1):
+        role = "ведущее" if num == 1 and pred is plan.driver else "фильтр найденных строк"
+        print(f"  {num}. {pred} - {role}")
+
+
+def _ms(ns: int) -> str:
+    return f"{ns / 1e6:.3f} мс"
+
+
+#explain: способ доступа, оценка строк и порядок условий без выполнения запроса
+def _explain_plan(metadata: dict, statement: Select | Update | Delete, bound: Bound, params: list[str]) -> None:
+    table_name = statement.table
+    table_data = _TABLES.get_table(table_name)
+    indexes = _indexes(metadata, table_name)
+    where = bound.predicate(params)
+    if where is None:
+        limit, offset = _window(statement, params)
+        estimate = len(table_data) if limit is None else min(len(table_data), offset + limit)
+        print(f"Доступ: полный проход без условия (оценка строк: {estimate})")
+        return
+
+    plan = plan_query(table_data, where, indexes)
+    cached = select_is_cached(table_name, _TABLES.version(table_name), where)
+    if statement.kind == "select" and plan.access == "full_scan" and cached:
+        print("Доступ: готовый результат из кэша select (проход не нужен)")
+    else:
+        print(f"Доступ: {_access_text(plan)} ({_estimate_text(plan)})")
+        _print_serial_reason(table_name, plan)
+    _print_steps(plan)
+
+
+#explain analyze: запрос выполняется (select - без вывода строк), планы считают строки и время
+def _explain_analyze(metadata: dict, statement: Select | Update | Delete, bound: Bound, params: list[str]) -> None:
+    table_name, kind = statement.table, statement.kind
+    read_before, mapped_before = METRICS.total("bytes_read"), METRICS.total("bytes_mapped")
+    start = time.perf_counter_ns()
+    _TABLES.get_table(table_name)
+    _indexes(metadata, table_name)
+    load_ns = time.perf_counter_ns() - start
+
+    output = io.StringIO()
+    returned = None
+    with analyze_plans() as plans:
+        start = time.perf_counter_ns()
+        if kind == "select":
+            with contextlib.redirect_stdout(output):
+                returned = _cmd_select(metadata, statement, bound, params)
+        elif kind == "update":
+            _cmd_update(metadata, statement, bound, params)
+        else:
+            _cmd_delete(metadata, statement, bound, params)
+        run_ns = time.perf_counter_ns() - start
+
+    if kind == "select" and returned is None:
+        print(output.getvalue(), end="") #ошибка запроса
+        return
+
+    plan = plans[0] if plans else None
+    filter_ns = sum(p.filter_ns for p in plans)
+    if plan is None:
+        print("Доступ: полный проход без условия")
+        print(f"Фактически: просмотрено строк {len(_TABLES.get_table(table_name))}, выдано {returned}")
+    elif plan.candidates is None:
+        print("Доступ: готовый результат из кэша select или индекса (проход не нужен)")
+        _print_steps(plan)
+        print(f"Фактически: просмотрено строк 0, выдано {returned}")
+    else:
+        print(f"Доступ: {_access_text(plan)} ({_estimate_text(plan)})")
+        _print_serial_reason(table_name, plan)
+        _print_steps(plan)
+        #полный проход по столбцу проверяет все строки, а дальше отдает только совпавшие с ведущим условием
+        full_column_scan = plan.access == "full_scan" and plan.driver is not None
+        scanned = plan.table_rows if full_column_scan else plan.candidates
+        print(
+            f"Фактически: просмотрено строк {scanned}, после ведущего условия {plan.candidates}, "
+            f"подошло {plan.matched}" + (f", выдано {returned}" if returned is not None else "")
+        )
+
+    last_step = "вывод" if kind == "select" else "изменение и журнал"
+    print(
+        f"Время: загрузка {_ms(load_ns)}, фильтр {_ms(filter_ns)}, {last_step} {_ms(run_ns - filter_ns)}, "
+        f"всего {_ms(load_ns + run_ns)}"
+    )
+    if METRICS.enabled:
+        read = METRICS.total("bytes_read") - read_before
+        mapped = METRICS.total("bytes_mapped") - mapped_before
+        print(f"Прочитано с диска: {_format_bytes(read)} (отображено через mmap: {_format_bytes(mapped)})")
+    else:
+        print("Прочитано с диска: - (метрики выключены)")
+
+
+def _cmd_explain(metadata: dict, user_input: str, explain: Explain, bound: Bound, params: list[str]) -> None:
+    match = _EXPLAIN_RE.match(user_input)
+    print(f"Запрос: {user_input[match.end() :].strip() if match else user_input}")
+    if explain.analyze:
+        _explain_analyze(metadata, explain.statement, bound, params)
+    else:
+        _explain_plan(metadata, explain.statement, bound, params)
+
+
+def _format_bytes(size: int) -> str:
+    for unit in ("Б", "КБ", "МБ"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "Б" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
+
+
+def _hit_rate(hits: int, misses: int) -> str:
+    total = hits + misses
+    return f"{hits / total:.0%}" if total else "-"
+
+
+@handle_db_errors
+def _cmd_stats(args: list[str]) -> None:
+    if args[1:] == ["reset"]:
+        METRICS.reset()
+        print("Метрики сброшены.")
+        return
+    if len(args) != 1:
+        raise DbValueError("stats")
+    if not METRICS.enabled:
+        print("Метрики выключены (запуск с --metrics off).")
+        return
+
+    snapshot = METRICS.snapshot()
+    histograms, counters, sources = snapshot["histograms"], snapshot["counters"], snapshot["sources"]
+
+    for kind, title in (("command", "Команда"), ("table", "Таблица"), ("io", "Операция")):
+        if kind not in histograms:
             continue
+        table = pretty_table([title, "вызовов", "p50, мс", "p95, мс", "p99, мс", "макс, мс"])
+        for label, s in histograms[kind].items():
+            table.add_row(
+                [label, s["count"]] + [f"{s[key]:.3f}" for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+            )
+        print(table)
+
+    scanned, returned = counters.get("rows_scanned", {}), counters.get("rows_returned", {})
+    if scanned or returned:
+        table = pretty_table(["Таблица", "строк просмотрено", "строк выдано"])
+        for name in sorted(set(scanned) | set(returned)):
+            table.add_row([name, scanned.get(name, 0), returned.get(name, 0)])
+        print(table)
+
+    read, written, mapped = (counters.get(kind, {}) for kind in ("bytes_read", "bytes_written", "bytes_mapped"))
+    if read or written or mapped:
+        table = pretty_table(["Файлы", "прочитано", "записано", "mmap"])
+        for label in sorted(set(read) | set(written) | set(mapped)):
+            table.add_row([label] + [_format_bytes(c.get(label, 0)) for c in (read, written, mapped)])
+        print(table)
+
+    select_cache = sources["select_cache"]
+    table_cache, index_cache = counters.get("table_cache", {}), counters.get("index_cache", {})
+    print(
+        f"Кэш select: {_hit_rate(select_cache['hits'], select_cache['misses'])} попаданий "
+        f"({select_cache['hits']} из {select_cache['hits'] + select_cache['misses']}), "
+        f"вытеснено {select_cache['evictions']}"
+    )
+    print(
+        f"Кэш таблиц: {_hit_rate(table_cache.get('hits', 0), table_cache.get('misses', 0))} попаданий, "
+        f"загрузок с диска {table_cache.get('misses', 0)}"
+    )
+    print(
+        f"Кэш индексов: попаданий {index_cache.get('hits', 0)}, "
+        f"загружено {index_cache.get('loads', 0)}, построено {index_cache.get('builds', 0)} "
+        f"(из них вместо устаревших файлов {index_cache.get('stale', 0)})"
+    )
+    statement_cache = sources["statement_cache"]
+    print(
+        f"Кэш разобранных команд: {_hit_rate(statement_cache['hits'], statement_cache['misses'])} попаданий "
+        f"({statement_cache['hits']} из {statement_cache['hits'] + statement_cache['misses']}), "
+        f"команд в кэше {statement_cache['entries']}"
+    )
+    print(f"Журнал: коммитов {sources['wal']['commits']}, fsync {sources['wal']['syncs']}")
+    compactions = counters.get("compactions", {})
+    if compactions:
+        print(
+            f"Сжатия таблиц: по порогу мусора {compactions.get('threshold', 0)}, "
+            f"в простое {compactions.get('idle', 0)}, vacuum {compactions.get('vacuum', 0)}"
+        )
+
+    path = METRICS.dump()
+    if path:
+        print(f"Метрики сохранены в {path}")
+
+#Таблица, к которой обращается команда (None - если команда без таблицы или имя не указано)
+def command_table(args: list[str]) -> str | None:
+    if args[0] == "explain":
+        args = args[2:] if len(args) > 1 and args[1].lower() == "analyze" else args[1:]
+        if not args:
+            return None
+    if args[0] == "select" and "from" in args[1:]:
+        position = args.index("from") + 1 #select count(*), sum(age) from users
+    elif args[0] in _TABLE_THIRD:
+        position = 2
+    elif args[0] in _TABLE_SECOND:
+        position = 1
+    else:
+        return None
+    return args[position] if len(args) > position else None
+
+#Менеджер таблиц процесса (общий для всех подключений в сетевом режиме)
+def table_manager() -> TableManager:
+    return _TABLES
+
+#Лимит памяти под таблицы в байтах (флаг --memory-limit). Вызывается при запуске, до первой команды:
+#менеджер таблиц создается заново
+def configure_tables(memory_limit: int) -> None:
+    global _TABLES
+    _TABLES = TableManager(META_FILEPATH, memory_limit=memory_limit)
+
+#Сохранение при выходе; незавершенная транзакция откатывается
+def shutdown() -> None:
+    if _TABLES.in_transaction:
+        print("Незавершенная транзакция отменена.")
+        _TABLES.rollback()
+    _TABLES.close()
+    path = METRICS.dump()
+    if path:
+        print(f"Метрики сохранены в {path}")
+
 
+@handle_db_errors
+def _split_args(user_input: str) -> list[str]:
+    return shlex.split(user_input)
+
+#Выполняет одну команду. Возвращает False на exit
+def execute(user_input: str) -> bool:
+    metadata = _TABLES.metadata()
+    words = user_input.split(None, 1)
+    if words and words[0] in STATEMENTS:
+        #команды с данными разбирает кэш разобранных команд, без shlex
+        command, rest, table_name = words[0], [], None
+    else:
+        args = _split_args(user_input)
+        if not args:
+            return True
         command, *rest = args
+        table_name = command_table(args)
+
+    if command in _NON_TRANSACTIONAL and _TABLES.in_transaction:
+        print(f"Ошибка: {command} нельзя выполнить внутри транзакции. Сначала commit или rollback.")
+        return True
+
+    start = time.perf_counter_ns()
+    match command:
+        case "exit":
+            return False
+
+        case "help":
+            print_help()
+
+        case "list_tables":
+            _cmd_list_tables(metadata)
+
+        case "create_table":
+            _cmd_create_table(metadata, rest)
+
+        case "drop_table":
+            _cmd_drop_table(metadata, rest)
+
+        case "create_index":
+            _cmd_create_index(metadata, rest)
+
+        case "drop_index":
+            _cmd_drop_index(metadata, rest)
+
+        case "select" | "insert" | "update" | "delete" | "explain":
+            table_name = _cmd_statement(metadata, user_input)
+
+        case "load":
+            _cmd_load(metadata, args)
+
+        case "info":
+            _cmd_info(metadata, args)
+
+        case "convert":
+            _cmd_convert(metadata, args)
 
-        match command:
-            case "exit":
-                print("Всего доброго!")
-                return
+        case "vacuum":
+            _cmd_vacuum(metadata, args)
 
-            case "help":
-                print_help()
+        case "begin":
+            _cmd_begin()
 
-            case "list_tables":
-                _cmd_list_tables(metadata)
+        case "commit":
+            _cmd_commit()
 
-            case "create_table":
-                _cmd_create_table(metadata, rest)
+        case "rollback":
+            _cmd_rollback()
 
-            case "drop_table":
-                _cmd_drop_table(metadata, rest)
+        case "stats":
+            _cmd_stats(args)
 
-            case "insert":
-                _cmd_insert(metadata, user_input, args)
+        case "output":
+            _cmd_output(args)
 
-            case "select":
-                _cmd_select(metadata, user_input, args)
+        case _:
+            print(f"Функции {command} нет. Попробуйте снова.")
+            return True
 
-            case "update":
-                _cmd_update(metadata, user_input, args)
+    if METRICS.enabled:
+        elapsed = time.perf_counter_ns() - start
+        METRICS.observe("command", command, elapsed)
+        if table_name is not None:
+            METRICS.observe("table", table_name, elapsed)
+    return True
+
+#Текст скрипта -> команды: по одной на строку и/или через ";" (вне кавычек; \" внутри строки - не конец строки,
+#как в разборе команд). Пустые строки и комментарии (# и --) пропускаются
+def split_statements(text: str) -> list[str]:
+    statements: list[str] = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith(("#", "--")):
+            continue
+        if ";" not in stripped:
+            statements.append(stripped)
+            continue
+        start = 0
+        quote_char = ""
+        escaped = False
+        for i, ch in enumerate(stripped):
+            if escaped:
+                escaped = False
+            elif ch == "\\" and quote_char:
+                escaped = True
+            elif ch in ("'", '"'):
+                if not quote_char:
+                    quote_char = ch
+                elif quote_char == ch:
+                    quote_char = ""
+            elif ch == ";" and not quote_char:
+                statements.append(stripped[start:i].strip())
+                start = i + 1
+        statements.append(stripped[start:].strip())
+    return [statement for statement in statements if statement]
 
-            case "delete":
-                _cmd_delete(metadata, user_input, args)
+#Основной цикл: чтение, парсинг команд, обработка
+def run() -> None:
+    print_help()
 
-            case "info":
-                _cmd_info(metadata, args)
+    while True:
+        user_input = prompt.string(">>>Введите команду: ").strip()
+
+        if not execute(user_input):
+            shutdown()
+            print("Всего доброго!")
+            return
 
-            case _:
-                print(f"Функции {command} нет. Попробуйте снова.")
\ No newline at end of file
+        _TABLES.commit(sync=True) #изменения команды - одна дозапись в журнал с fsync
+
+#Пакетный режим: команды без приглашения и вопросов, таблицы держатся в памяти весь пакет.
+#Журнал синхронизируется группами коммитов; файлы таблиц - каждые checkpoint команд (0 - только в конце)
+def run_batch(statements: Iterable[str], checkpoint: int = 0) -> int:
+    executed = 0
+    with _TABLES.batch():
+        try:
+            for statement in statements:
+                if not execute(statement):
+                    break
+                executed += 1
+                _TABLES.commit()
+                if checkpoint and executed % checkpoint == 0:
+                    _TABLES.checkpoint()
+        finally:
+            shutdown()
+    return executed
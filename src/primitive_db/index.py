@@ -0,0 +1,122 @@
+"""
+Хеш-индексы: значение столбца -> множество ID записей
+"""
+
+from typing import Any, Iterable
+
+from .columnar import ColumnarTable, RowView
+from .stats import TableStats
+
+
+class HashIndex:
+    """Вторичный индекс по одному столбцу"""
+
+    def __init__(self, column: str):
+        self.column = column
+        self.entries: dict[Any, set[int]] = {}
+
+    @classmethod
+    def build(cls, column: str, rows: Iterable[RowView]) -> "HashIndex":
+        index = cls(column)
+        for row in rows:
+            index.add(row)
+        return index
+
+    def add(self, row: RowView | dict[str, Any]) -> None:
+        row_id = row.get("ID")
+        if isinstance(row_id, int) and self.column in row:
+            self.entries.setdefault(_key(row[self.column]), set()).add(row_id)
+
+    def remove(self, row: RowView, value: Any = None) -> None:
+        row_id = row.get("ID")
+        value = row.get(self.column) if value is None else value
+        ids = self.entries.get(_key(value))
+        if ids is None:
+            return
+        ids.discard(row_id)
+        if not ids:
+            del self.entries[_key(value)]
+
+    def lookup(self, value: Any) -> set[int]:
+        return self.entries.get(_key(value), set())
+
+    #Сохранение: ключи JSON - только строки, поэтому пишем пары [значение, [ID...]]
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "column": self.column,
+            "entries": [[value, sorted(ids)] for (_, value), ids in self.entries.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "HashIndex":
+        index = cls(data["column"])
+        for value, ids in data["entries"]:
+            index.entries[_key(value)] = set(ids)
+        return index
+
+
+#True == 1 в Python, поэтому тип входит в ключ
+def _key(value: Any) -> tuple[str, Any]:
+    return type(value).__name__, value
+
+
+class TableIndexes:
+    """Все индексы одной таблицы: первичный по ID (из самой таблицы) и вторичные хеш-индексы.
+    Вместе с индексами при каждом изменении обновляется статистика таблицы"""
+
+    def __init__(
+        self,
+        table: ColumnarTable,
+        secondary: dict[str, HashIndex] | None = None,
+        stats: TableStats | None = None,
+    ):
+        self.table = table
+        self.secondary: dict[str, HashIndex] = secondary or {}
+        self.stats = stats
+        self.dirty = False
+
+    def columns(self) -> list[str]:
+        return sorted(self.secondary)
+
+    #ID строк с любым из значений (по возрастанию) для проиндексированного столбца
+    def ids(self, column: str, values: Iterable[Any]) -> list[int]:
+        index = self.secondary[column]
+        found: set[int] = set()
+        for value in values:
+            found |= index.lookup(value)
+        return sorted(found)
+
+    def add(self, row: RowView | dict[str, Any]) -> None:
+        for index in self.secondary.values():
+            index.add(row)
+        if self.stats is not None:
+            self.stats.add(row)
+        self.dirty = True
+
+    #Пачка новых записей (массовая загрузка)
+    def extend(self, records: list[dict[str, Any]]) -> None:
+        for index in self.secondary.values():
+            for record in records:
+                index.add(record) #индексу нужны только ID и значения - словаря достаточно
+        if self.stats is not None:
+            self.stats.extend(records)
+        self.dirty = True
+
+    def remove(self, row: RowView) -> None:
+        for index in self.secondary.values():
+            index.remove(row)
+        if self.stats is not None:
+            self.stats.remove(row)
+        self.dirty = True
+
+    #Вызывается после изменения значения столбца в строке
+    def change(self, row: RowView, column: str, old_value: Any) -> None:
+        if self.stats is not None:
+            self.stats.change(column, old_value, row.get(column))
+        index = self.secondary.get(column)
+        if index is None:
+            return
+        if old_value is not None:
+            index.remove(row, old_value)
+        index.add(row)
+        self.dirty = True
@@ -1,9 +1,253 @@
 #!/usr/bin/env python3
 
-from .engine import run
+import argparse
+import sys
 
-def main() -> None:
-    run()
+from src.decorators import set_confirm_policy
+
+from .benchmark import (
+    DEFAULT_OPS,
+    DEFAULT_REPEAT,
+    DEFAULT_SIZES,
+    DEFAULT_THRESHOLD,
+    compare_results,
+    format_comparison,
+    format_result,
+    load_results,
+    run_suite,
+    save_results,
+)
+from .client import run_bench, run_client
+from .engine import configure_tables, run, run_batch, split_statements
+from .metrics import DEFAULT_METRICS_FILE, METRICS, MODES
+from .output import DEFAULT_FORMAT as DEFAULT_OUTPUT_FORMAT
+from .output import FORMATS as OUTPUT_FORMATS
+from .output import configure as configure_output
+from .parallel import DEFAULT_WORKERS, PARALLEL_MIN_ROWS
+from .parallel import configure as configure_workers
+from .server import DEFAULT_HOST, DEFAULT_PORT, serve
+from .storage import DEFAULT_MEMORY_LIMIT
+
+_MB = 1024 * 1024
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="project", description="Примитивная база данных")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--script", metavar="FILE", help="выполнить команды из файла (- читать из stdin)")
+    source.add_argument("-c", dest="commands", metavar="COMMANDS", help='выполнить команды через ";"')
+    parser.add_argument(
+        "--yes",
+        action="store_true",
+        help="подтверждать удаление без вопроса (в пакетном режиме без флага удаление отменяется)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=int,
+        default=0,
+        metavar="N",
+        help="в пакетном режиме сбрасывать изменения на диск каждые N команд (по умолчанию - в конце)",
+    )
+    parser.add_argument(
+        "--metrics",
+        choices=MODES,
+        default=METRICS.mode,
+        help="метрики: off - выключены, memory - в памяти (команда stats), file - еще и в файл при выходе",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        default=DEFAULT_METRICS_FILE,
+        metavar="FILE",
+        help=f"куда сохранять метрики в режиме file (по умолчанию {DEFAULT_METRICS_FILE})",
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=_positive,
+        default=DEFAULT_WORKERS,
+        metavar="N",
+        help=(
+            "процессов для прохода по большим таблицам в форматах binary и segments, jsonl проходится в одном "
+            "процессе (по умолчанию - число ядер, 1 - без параллельности)"
+        ),
+    )
+    parser.add_argument(
+        "--parallel-min-rows",
+        type=_positive,
+        default=PARALLEL_MIN_ROWS,
+        metavar="N",
+        help=f"с какого числа строк проходить таблицу параллельно (по умолчанию {PARALLEL_MIN_ROWS})",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=_positive,
+        default=DEFAULT_MEMORY_LIMIT // _MB,
+        metavar="MB",
+        help=(
+            "сколько памяти держать под таблицы, МБ: сверх лимита давно не использованные таблицы "
+            f"записываются и выгружаются (по умолчанию {DEFAULT_MEMORY_LIMIT // _MB})"
+        ),
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS,
+        default=DEFAULT_OUTPUT_FORMAT,
+        help="формат вывода select по умолчанию: table - таблица, jsonl/csv/tsv - строки для других программ",
+    )
+
+    modes = parser.add_subparsers(dest="mode", metavar="{serve,client,bench,benchmark}")
+    serve_parser = modes.add_parser("serve", help="сетевой режим: принимать команды по TCP")
+    client_parser = modes.add_parser("client", help="подключиться к серверу")
+    bench_parser = modes.add_parser("bench", help="нагрузочный тест сервера")
+    for mode_parser in (serve_parser, client_parser, bench_parser):
+        mode_parser.add_argument("--host", default=DEFAULT_HOST)
+        mode_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    #default=SUPPRESS: без флага после подкоманды остается значение общего флага (project --yes serve)
+    serve_parser.add_argument(
+        "--yes",
+        action="store_true",
+        default=argparse.SUPPRESS,
+        help="подтверждать удаление по запросам клиентов (без флага удаление отменяется)",
+    )
+    client_parser.add_argument(
+        "-c",
+        dest="commands",
+        metavar="COMMANDS",
+        default=argparse.SUPPRESS,
+        help='выполнить команды через ";"',
+    )
+    bench_parser.add_argument(
+        "-c",
+        dest="commands",
+        metavar="COMMANDS",
+        default=argparse.SUPPRESS,
+        help='команды через ";", клиенты отправляют их по кругу (по умолчанию list_tables)',
+    )
+    bench_parser.add_argument("--clients", type=_positive, default=8, help="число подключений")
+    bench_parser.add_argument("--requests", type=_positive, default=1000, help="запросов на подключение")
+
+    benchmark_parser = modes.add_parser("benchmark", help="замеры CRUD на синтетических таблицах")
+    benchmark_parser.add_argument(
+        "--sizes",
+        type=_sizes,
+        default=DEFAULT_SIZES,
+        metavar="N,N,...",
+        help="размеры таблиц (по умолчанию 10000,100000,1000000)",
+    )
+    benchmark_parser.add_argument("--ops", type=_positive, default=DEFAULT_OPS, help="операций на точечный замер")
+    benchmark_parser.add_argument(
+        "--repeat", type=_positive, default=DEFAULT_REPEAT, help="повторов сохранения/загрузки файла"
+    )
+    benchmark_parser.add_argument("--seed", type=int, default=42)
+    benchmark_parser.add_argument(
+        "--no-memory", dest="memory", action="store_false", help="не замерять пиковую память (без прохода с tracemalloc)"
+    )
+    benchmark_parser.add_argument(
+        "--output", default="benchmark.json", metavar="FILE", help="куда сохранить результаты (JSON)"
+    )
+    benchmark_parser.add_argument("--baseline", metavar="FILE", help="сравнить с результатами прошлого прогона")
+    benchmark_parser.add_argument(
+        "--results",
+        metavar="FILE",
+        help="не запускать замеры, а сравнить с --baseline уже сохраненные результаты",
+    )
+    benchmark_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD * 100,
+        metavar="PERCENT",
+        help="изменение больше этого процента - регрессия или улучшение (по умолчанию 10)",
+    )
+    return parser.parse_args(argv)
+
+def _positive(text: str) -> int:
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("нужно число больше 0")
+    return value
+
+def _sizes(text: str) -> list[int]:
+    try:
+        return [_positive(part.replace("_", "")) for part in text.split(",")]
+    except ValueError as e:
+        raise argparse.ArgumentTypeError("нужны числа через запятую") from e
+
+#Замеры или сравнение готовых результатов. При регрессии - код выхода 1 (для CI)
+def _run_benchmark(args: argparse.Namespace) -> None:
+    try:
+        if args.results is not None:
+            if args.baseline is None:
+                sys.exit("Ошибка: для --results нужен --baseline.")
+            current = load_results(args.results)
+        else:
+            current = run_suite(
+                args.sizes,
+                args.ops,
+                args.repeat,
+                args.seed,
+                args.memory,
+                on_result=lambda result: print(format_result(result)),
+            )
+            save_results(args.output, current)
+            print(f"Результаты сохранены в {args.output}")
+
+        if args.baseline is None:
+            return
+        rows = compare_results(load_results(args.baseline), current, args.threshold / 100)
+    except (OSError, ValueError, KeyError) as e:
+        sys.exit(f"Ошибка: не удалось прочитать результаты замеров: {e}")
+
+    print(f"Сравнение с {args.baseline}:")
+    for line in format_comparison(rows):
+        print(line)
+    regressions = sum(row["status"] == "regression" for row in rows)
+    if regressions:
+        sys.exit(f"Регрессий: {regressions}")
+
+def main(argv: list[str] | None = None) -> None:
+    args = _parse_args(argv)
+    METRICS.configure(args.metrics, args.metrics_file)
+    configure_tables(args.memory_limit * _MB)
+    configure_workers(args.workers, args.parallel_min_rows)
+    configure_output(args.output_format)
+
+    if args.mode == "serve":
+        set_confirm_policy(args.yes)
+        serve(args.host, args.port)
+        return
+    if args.mode == "client":
+        commands = None if args.commands is None else split_statements(args.commands)
+        run_client(args.host, args.port, commands)
+        return
+    if args.mode == "benchmark":
+        _run_benchmark(args)
+        return
+    if args.mode == "bench":
+        commands = split_statements(args.commands or "list_tables")
+        if not commands:
+            sys.exit("Ошибка: нет команд для нагрузочного теста.")
+        run_bench(args.host, args.port, commands, args.clients, args.requests)
+        return
+
+    if args.script is None and args.commands is None:
+        if args.yes:
+            set_confirm_policy(True)
+        run()
+        return
+
+    set_confirm_policy(args.yes)
+    if args.commands is not None:
+        text = args.commands
+    elif args.script == "-":
+        text = sys.stdin.read()
+    else:
+        try:
+            with open(args.script, encoding="utf-8") as f:
+                text = f.read()
+        except OSError as e:
+            sys.exit(f"Ошибка: не удалось прочитать {args.script}: {e.strerror}")
+
+    run_batch(split_statements(text), args.checkpoint)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
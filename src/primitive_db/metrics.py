@@ -0,0 +1,147 @@
+"""
+Метрики: гистограммы задержек команд и таблиц, счетчики строк, байтов и попаданий в кэши.
+Режимы: off - ничего не записывается, memory - в памяти (команда stats), file - еще и в JSON при выходе
+"""
+
+import json
+import math
+import os
+from typing import Any, Callable
+
+MODES = ("off", "memory", "file")
+DEFAULT_MODE = "memory"
+DEFAULT_METRICS_FILE = "metrics.json"
+
+_SUB_BITS = 3 #2**3 корзин на каждое удвоение: ошибка перцентиля не больше 12.5%
+_LINEAR_LIMIT = 1 << (_SUB_BITS + 1) #значения меньше этого хранятся точно
+
+
+def _bucket(ns: int) -> int:
+    if ns < _LINEAR_LIMIT:
+        return ns
+    bits = ns.bit_length()
+    return (bits << _SUB_BITS) | ((ns >> (bits - _SUB_BITS - 1)) & ((1 << _SUB_BITS) - 1))
+
+
+#Наибольшее значение, попадающее в корзину
+def _bucket_upper(index: int) -> int:
+    if index < _LINEAR_LIMIT:
+        return index
+    bits, sub = index >> _SUB_BITS, index & ((1 << _SUB_BITS) - 1)
+    return (((1 << _SUB_BITS) | sub) + 1 << (bits - _SUB_BITS - 1)) - 1
+
+
+class Histogram:
+    """Задержки (нс) в логарифмических корзинах: память не растет с числом замеров"""
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, ns: int) -> None:
+        index = _bucket(ns)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    #Оценка перцентиля сверху: граница корзины, в которую он попал
+    def percentile(self, percent: float) -> int:
+        rank = max(1, math.ceil(percent / 100 * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(_bucket_upper(index), self.max)
+        return self.max
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count / 1e6 if self.count else 0.0,
+            "p50_ms": self.percentile(50) / 1e6,
+            "p95_ms": self.percentile(95) / 1e6,
+            "p99_ms": self.percentile(99) / 1e6,
+            "max_ms": self.max / 1e6,
+        }
+
+
+class MetricsRegistry:
+    """Все метрики процесса по (вид, метка): например ("command", "select") или ("bytes_read", "table").
+    В режиме off методы сразу выходят - проверка одного флага"""
+
+    def __init__(self, mode: str = DEFAULT_MODE, filepath: str = DEFAULT_METRICS_FILE):
+        self.histograms: dict[tuple[str, str], Histogram] = {}
+        self.counters: dict[tuple[str, str], int] = {}
+        self._sources: dict[str, Callable[[], dict[str, Any]]] = {}
+        self.configure(mode, filepath)
+
+    def configure(self, mode: str, filepath: str | None = None) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим метрик: {mode}")
+        self.mode = mode
+        self.enabled = mode != "off"
+        if filepath is not None:
+            self.filepath = filepath
+
+    def observe(self, kind: str, label: str, ns: int) -> None:
+        if not self.enabled:
+            return
+        histogram = self.histograms.get((kind, label))
+        if histogram is None:
+            histogram = self.histograms[(kind, label)] = Histogram()
+        histogram.record(ns)
+
+    def add(self, kind: str, label: str, value: int = 1) -> None:
+        if not self.enabled:
+            return
+        self.counters[(kind, label)] = self.counters.get((kind, label), 0) + value
+
+    #Сумма счетчика по всем меткам
+    def total(self, kind: str) -> int:
+        return sum(value for (k, _), value in self.counters.items() if k == kind)
+
+    #Размер файла, прочитанного или записанного целиком (один fstat, только если метрики включены)
+    def add_file_size(self, kind: str, label: str, f: Any) -> None:
+        if self.enabled:
+            self.add(kind, label, os.fstat(f.fileno()).st_size)
+
+    #Готовая статистика другого компонента (кэш select, журнал), берется только при выводе
+    def register_source(self, name: str, source: Callable[[], dict[str, Any]]) -> None:
+        self._sources[name] = source
+
+    def reset(self) -> None:
+        self.histograms.clear()
+        self.counters.clear()
+
+    def snapshot(self) -> dict[str, Any]:
+        histograms: dict[str, dict[str, Any]] = {}
+        for (kind, label), histogram in sorted(self.histograms.items()):
+            histograms.setdefault(kind, {})[label] = histogram.summary()
+        counters: dict[str, dict[str, int]] = {}
+        for (kind, label), value in sorted(self.counters.items()):
+            counters.setdefault(kind, {})[label] = value
+        return {
+            "mode": self.mode,
+            "histograms": histograms,
+            "counters": counters,
+            "sources": {name: source() for name, source in self._sources.items()},
+        }
+
+    #В режиме file - снимок метрик в JSON (через временный файл)
+    def dump(self) -> str | None:
+        if self.mode != "file":
+            return None
+        tmp_path = self.filepath + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.filepath)
+        return self.filepath
+
+
+METRICS = MetricsRegistry() #метрики процесса; режим задается флагом --metrics
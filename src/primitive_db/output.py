@@ -0,0 +1,112 @@
+"""
+Вывод результатов select: таблица (PrettyTable, страницами) или машиночитаемые форматы jsonl/csv/tsv.
+Строки берутся из выборки по мере записи и уходят в stdout или файл пачками, без подсчета ширины столбцов
+"""
+
+import csv
+import io
+import json
+import sys
+from itertools import islice
+from typing import Any, Iterable, TextIO
+
+from .metrics import METRICS
+
+FORMATS = ("table", "jsonl", "csv", "tsv")
+DEFAULT_FORMAT = "table"
+
+PRINT_PAGE_SIZE = 50 #по сколько строк выводить таблицу за раз
+WRITE_BATCH_ROWS = 1000 #по сколько строк jsonl/csv/tsv собирать в одну запись
+FILE_BUFFER_SIZE = 1 << 20
+
+_FORMAT = DEFAULT_FORMAT
+
+
+#Формат вывода по умолчанию (для select без format ...)
+def configure(output_format: str) -> None:
+    global _FORMAT
+    if output_format not in FORMATS:
+        raise ValueError(f"Неизвестный формат вывода: {output_format}. Доступны: {', '.join(FORMATS)}.")
+    _FORMAT = output_format
+
+
+def output_format() -> str:
+    return _FORMAT
+
+
+#PrettyTable импортируется только при первом выводе таблицы: запуск и машиночитаемый вывод без него
+def pretty_table(columns: list[str]) -> Any:
+    from prettytable import PrettyTable
+
+    table = PrettyTable()
+    table.field_names = columns
+    return table
+
+
+#Строки в выбранном формате (None - формат по умолчанию) в stdout или в файл path.
+#Возвращает число записанных строк
+def write_rows(
+    columns: list[str],
+    rows: Iterable[Iterable],
+    output_format: str | None = None,
+    path: str | None = None,
+) -> int:
+    output_format = output_format or _FORMAT
+    if path is None:
+        return _WRITERS[output_format](sys.stdout, columns, iter(rows))
+    with open(path, "w", encoding="utf-8", newline="", buffering=FILE_BUFFER_SIZE) as f:
+        written = _WRITERS[output_format](f, columns, iter(rows))
+        METRICS.add("bytes_written", "outfile", f.tell())
+    return written
+
+
+def _write_table(stream: TextIO, columns: list[str], rows: Iterable[Iterable]) -> int:
+    written = 0
+    while page := list(islice(rows, PRINT_PAGE_SIZE)):
+        table = pretty_table(columns)
+        for row in page:
+            table.add_row(list(row))
+        stream.write(f"{table}\n")
+        written += len(page)
+    return written
+
+
+def _write_jsonl(stream: TextIO, columns: list[str], rows: Iterable[Iterable]) -> int:
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    written = 0
+    while batch := list(islice(rows, WRITE_BATCH_ROWS)):
+        stream.write("".join(f"{encode(dict(zip(columns, row)))}\n" for row in batch))
+        written += len(batch)
+    return written
+
+
+#true/false - как в командах и при загрузке, пустая ячейка - нет значения
+def _text_cell(value: Any) -> Any:
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    return value
+
+
+def _write_delimited(stream: TextIO, columns: list[str], rows: Iterable[Iterable], delimiter: str) -> int:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter, lineterminator="\n")
+    writer.writerow(columns)
+    written = 0
+    while batch := list(islice(rows, WRITE_BATCH_ROWS)):
+        writer.writerows([_text_cell(value) for value in row] for row in batch)
+        stream.write(buffer.getvalue())
+        buffer.seek(0)
+        buffer.truncate()
+        written += len(batch)
+    stream.write(buffer.getvalue()) #заголовок, если строк нет
+    return written
+
+
+_WRITERS = {
+    "table": _write_table,
+    "jsonl": _write_jsonl,
+    "csv": lambda stream, columns, rows: _write_delimited(stream, columns, rows, ","),
+    "tsv": lambda stream, columns, rows: _write_delimited(stream, columns, rows, "\t"),
+}
@@ -0,0 +1,199 @@
+"""
+Параллельный проход по сегментам: строки таблицы делятся на части фиксированного размера, условие
+и агрегаты по каждой части считает отдельный процесс. Части - куски двоичного файла таблицы или файлы
+частей формата segments; процессы сами открывают их через mmap и возвращают только позиции подошедших
+строк или частичные итоги групп. Таблицы jsonl проходятся в одном процессе
+"""
+
+import atexit
+import multiprocessing
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Iterator
+
+from .aggregate import Aggregate, collect_groups, group_rows, merge_groups
+from .columnar import SEGMENT_ROWS, ColumnarTable, RowView
+from .schema import Schema
+from .utils import open_binary_file
+
+PARALLEL_MIN_ROWS = 4 * SEGMENT_ROWS #таблицы меньше проходятся в этом процессе: запуск задач дороже прохода
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+_WORKERS = DEFAULT_WORKERS
+_MIN_ROWS = PARALLEL_MIN_ROWS
+_POOL: ProcessPoolExecutor | None = None
+
+#Таблицы, открытые в процессе-исполнителе: путь -> (отпечаток файла, таблица поверх mmap)
+_OPENED: dict[str, tuple[tuple[int, int], ColumnarTable]] = {}
+_OPENED_LIMIT = 8
+
+
+#Число процессов (1 - параллельный проход выключен) и с какого числа строк проходить таблицу
+#параллельно (None - не менять). Прежний пул закрывается
+def configure(workers: int, min_rows: int | None = None) -> None:
+    global _WORKERS, _MIN_ROWS
+    shutdown()
+    _WORKERS = max(1, workers)
+    if min_rows is not None:
+        _MIN_ROWS = max(1, min_rows)
+
+
+def workers() -> int:
+    return _WORKERS
+
+
+def min_rows() -> int:
+    return _MIN_ROWS
+
+
+def shutdown() -> None:
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(cancel_futures=True)
+        _POOL = None
+
+
+atexit.register(shutdown)
+
+
+#Пул создается при первом параллельном проходе. spawn: процессы не наследуют память и потоки родителя
+def _pool() -> ProcessPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _POOL
+
+
+#Сколько сегментов пройти параллельно (0 - проход в этом процессе); keep - номера сегментов, оставшихся
+#после отбора по min/max (None - все). Параллельно проходятся только таблицы, совпадающие со своими
+#файлами (двоичным или частями segments): процессы читают строки из файлов, а не из памяти
+def segment_count(table: ColumnarTable, keep: list[int] | None = None) -> int:
+    if _WORKERS < 2 or table.source_files is None or len(table) < _MIN_ROWS:
+        return 0
+    return len(_segments(table, keep))
+
+
+#Сегменты в порядке позиций: (путь, отпечаток, позиция первой строки файла, начало, конец в файле).
+#Двоичный файл режется по SEGMENT_ROWS строк, файл части segments - уже один сегмент
+def _segments(table: ColumnarTable, keep: list[int] | None) -> list[tuple[str, tuple[int, int], int, int, int]]:
+    segments = [
+        (path, stamp, base, start, min(rows, start + SEGMENT_ROWS))
+        for path, stamp, base, rows in table.source_files
+        for start in range(0, rows, SEGMENT_ROWS)
+    ]
+    return segments if keep is None else [segments[num] for num in keep if num < len(segments)]
+
+
+#Задачи по сегментам в порядке позиций; результаты отдаются по мере готовности, в том же порядке
+def _map(table: ColumnarTable, keep: list[int] | None, task: Callable[..., Any], *args: Any) -> Iterator[Any]:
+    schema = table.schema.source
+    futures = [
+        _pool().submit(task, path, stamp, schema, base, start, end, *args)
+        for path, stamp, base, start, end in _segments(table, keep)
+    ]
+    try:
+        for future in futures:
+            yield future.result()
+    except BrokenProcessPool:
+        shutdown() #процесс упал - следующий проход создаст пул заново
+        raise ValueError("Процесс параллельного прохода завершился аварийно.") from None
+    finally:
+        for future in futures:
+            future.cancel() #проход остановили досрочно (limit) - оставшиеся сегменты не нужны
+
+
+#Строки, подходящие под условие: ведущее проверяется по массиву столбца, остаток - на найденных строках.
+#on_segment получает по каждому сегменту (проверено строк, подошло)
+def scan_rows(
+    table: ColumnarTable,
+    driver: Any,
+    residual: Any,
+    on_segment: Callable[[int, int], None] | None = None,
+    keep: list[int] | None = None,
+) -> Iterator[RowView]:
+    for candidates, positions in _map(table, keep, _scan_segment, driver, residual):
+        if on_segment is not None:
+            on_segment(candidates, len(positions))
+        for pos in positions:
+            yield RowView(table, pos)
+
+
+#Агрегаты по строкам, подходящим под условие (driver и residual - None: все строки)
+def aggregate_rows(
+    table: ColumnarTable,
+    driver: Any,
+    residual: Any,
+    aggregates: list[Aggregate],
+    group_by: str | None,
+    on_segment: Callable[[int, int], None] | None = None,
+    keep: list[int] | None = None,
+) -> list[tuple[Any, ...]]:
+    parts = []
+    for candidates, matched, groups in _map(table, keep, _aggregate_segment, driver, residual, aggregates, group_by):
+        if on_segment is not None:
+            on_segment(candidates, matched)
+        parts.append(groups)
+    return group_rows(merge_groups(parts), aggregates, group_by)
+
+
+#Дальше - код процессов-исполнителей
+
+def _open(path: str, stamp: tuple[int, int], schema: list[str]) -> ColumnarTable:
+    opened = _OPENED.get(path)
+    if opened is not None and opened[0] == stamp:
+        return opened[1]
+    st = os.stat(path)
+    if (st.st_mtime_ns, st.st_size) != tuple(stamp):
+        raise ValueError(f"Файл {path} изменился во время параллельного прохода.")
+    header, sections = open_binary_file(path, os.path.basename(path))
+    if header["schema"] != schema:
+        raise ValueError(f"Схема в файле {path} не совпадает с таблицей.")
+    if len(_OPENED) >= _OPENED_LIMIT:
+        _OPENED.clear()
+    table = ColumnarTable.from_buffers(Schema(schema), header, sections)
+    _OPENED[path] = (stamp, table)
+    return table
+
+
+def _segment_rows(segment: ColumnarTable, driver: Any, residual: Any, counter: list[int]) -> Iterator[RowView]:
+    rows = segment.iter_match(driver.column, driver.test) if driver is not None else iter(segment)
+    for row in rows:
+        counter[0] += 1
+        if residual is None or residual.matches(row):
+            yield row
+
+
+def _scan_segment(
+    path: str,
+    stamp: tuple[int, int],
+    schema: list[str],
+    base: int,
+    start: int,
+    end: int,
+    driver: Any,
+    residual: Any,
+) -> tuple[int, array]:
+    segment = _open(path, stamp, schema).segment(start, end)
+    counter = [0]
+    positions = array("q", (base + start + row.pos for row in _segment_rows(segment, driver, residual, counter)))
+    return counter[0], positions
+
+
+def _aggregate_segment(
+    path: str,
+    stamp: tuple[int, int],
+    schema: list[str],
+    base: int,
+    start: int,
+    end: int,
+    driver: Any,
+    residual: Any,
+    aggregates: list[Aggregate],
+    group_by: str | None,
+) -> tuple[int, int, dict[Any, Any]]:
+    segment = _open(path, stamp, schema).segment(start, end)
+    counter = [0]
+    positions = [row.pos for row in _segment_rows(segment, driver, residual, counter)]
+    return counter[0], len(positions), collect_groups(segment, aggregates, group_by, positions)
@@ -0,0 +1,432 @@
+"""
+Условия WHERE (AND/OR, сравнения, IN) и простой планировщик: чем искать строки - ID, индексом или полным проходом
+"""
+
+import operator
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+from .columnar import SEGMENT_ROWS, ColumnarTable, RowView
+from .index import TableIndexes
+from .parallel import scan_rows, segment_count
+from .stats import TableStats
+
+_OPS: dict[str, Callable[[Any, Any], bool]] = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+class Comparison:
+    """Сравнение столбца со значением: col = 1, col >= 'a'"""
+
+    __slots__ = ("column", "op", "value")
+
+    def __init__(self, column: str, op: str, value: Any):
+        self.column = column
+        self.op = op
+        self.value = value
+
+    #Проверка одного значения (отсутствующее или другого типа не подходит ни под одно условие)
+    def test(self, value: Any) -> bool:
+        return type(value) is type(self.value) and _OPS[self.op](value, self.value)
+
+    def matches(self, row: RowView) -> bool:
+        return self.test(row.get(self.column))
+
+    def key(self) -> tuple:
+        return ("cmp", self.column, self.op, type(self.value).__name__, self.value)
+
+    def __str__(self) -> str:
+        return f"{self.column} {self.op} {self.value!r}"
+
+
+class InList:
+    """Принадлежность списку: col in (1, 2, 3)"""
+
+    __slots__ = ("column", "values", "_keys")
+
+    def __init__(self, column: str, values: list[Any]):
+        self.column = column
+        self.values = values
+        self._keys = {(type(v), v) for v in values}
+
+    def test(self, value: Any) -> bool:
+        return (type(value), value) in self._keys
+
+    def matches(self, row: RowView) -> bool:
+        return self.test(row.get(self.column))
+
+    def key(self) -> tuple:
+        return ("in", self.column, tuple(sorted(map(repr, self.values))))
+
+    def __str__(self) -> str:
+        return f"{self.column} in ({', '.join(map(repr, self.values))})"
+
+
+class And:
+    """Все условия сразу"""
+
+    __slots__ = ("children",)
+
+    def __init__(self, children: list[Any]):
+        self.children = children
+
+    def matches(self, row: RowView) -> bool:
+        return all(child.matches(row) for child in self.children)
+
+    def key(self) -> tuple:
+        return ("and", *(child.key() for child in self.children))
+
+    def __str__(self) -> str:
+        return " and ".join(_wrap(child) for child in self.children)
+
+
+class Or:
+    """Хотя бы одно из условий"""
+
+    __slots__ = ("children",)
+
+    def __init__(self, children: list[Any]):
+        self.children = children
+
+    def matches(self, row: RowView) -> bool:
+        return any(child.matches(row) for child in self.children)
+
+    def key(self) -> tuple:
+        return ("or", *(child.key() for child in self.children))
+
+    def __str__(self) -> str:
+        return " or ".join(_wrap(child) for child in self.children)
+
+
+Predicate = Comparison | InList | And | Or
+
+
+def _wrap(pred: Predicate) -> str:
+    return f"({pred})" if isinstance(pred, (And, Or)) else str(pred)
+
+
+class Plan:
+    """Выбранный способ поиска строк: ведущее условие (через ID/индекс) и остаток для фильтрации.
+    В explain analyze план еще считает строки и время выборки (candidates остается None, если
+    строки так и не понадобились - например, результат взят из кэша)"""
+
+    __slots__ = (
+        "access",
+        "driver",
+        "residual",
+        "estimated_rows",
+        "estimated_matches",
+        "segments",
+        "parts",
+        "pruned",
+        "table_rows",
+        "counting",
+        "candidates",
+        "matched",
+        "filter_ns",
+        "_source",
+    )
+
+    def __init__(
+        self,
+        access: str,
+        driver: Predicate | None,
+        residual: Predicate | None,
+        estimated_rows: int,
+        source: Callable[[], Iterator[RowView]],
+    ):
+        self.access = access
+        self.driver = driver
+        self.residual = residual
+        self.estimated_rows = estimated_rows
+        self.estimated_matches: int | None = None #сколько строк подойдет, по статистике таблицы
+        self.segments = 0 #сегментов параллельного прохода (0 - проход в этом процессе)
+        self.parts: list[int] | None = None #номера частей, оставшихся после отбора по min/max (None - все)
+        self.pruned: tuple[int, int] | None = None #формат segments: (пропущено частей по min/max, всего частей)
+        self.table_rows = 0 #размер таблицы (заполняется в explain analyze)
+        self.counting = False
+        self.candidates: int | None = None
+        self.matched = 0
+        self.filter_ns = 0
+        self._source = source
+
+    def rows(self) -> Iterator[RowView]:
+        if self.counting:
+            return self._counted_rows()
+        return self._rows()
+
+    def _rows(self) -> Iterator[RowView]:
+        residual = None if self.segments else self.residual #при параллельном проходе остаток проверили процессы
+        for row in self._source():
+            if residual is None or residual.matches(row):
+                yield row
+
+    #Строки с подсчетом: сколько дал источник (ID/индекс/проход), сколько прошло фильтр и за какое время
+    def _counted_rows(self) -> Iterator[RowView]:
+        if self.segments:
+            yield from self._counted_segments()
+            return
+        residual = self.residual
+        clock = time.perf_counter_ns
+        self.candidates = 0
+        start = clock()
+        source = self._source()
+        self.filter_ns += clock() - start
+        while True:
+            start = clock()
+            row = next(source, None)
+            if row is None:
+                self.filter_ns += clock() - start
+                return
+            self.candidates += 1
+            passed = residual is None or residual.matches(row)
+            self.filter_ns += clock() - start
+            if passed:
+                self.matched += 1
+                yield row
+
+    #Параллельный проход: строки считают процессы (count_segment), здесь - только время ожидания
+    def _counted_segments(self) -> Iterator[RowView]:
+        clock = time.perf_counter_ns
+        self.candidates = 0
+        source = self._source()
+        while True:
+            start = clock()
+            row = next(source, None)
+            self.filter_ns += clock() - start
+            if row is None:
+                return
+            yield row
+
+    #Итоги сегмента параллельного прохода (в explain analyze)
+    def count_segment(self, candidates: int, matched: int) -> None:
+        if self.counting:
+            self.candidates = (self.candidates or 0) + candidates
+            self.matched += matched
+
+    #Условия в порядке проверки: сначала ведущее, затем фильтр найденных строк
+    def steps(self) -> list[Predicate]:
+        steps = [self.driver] if self.driver is not None else []
+        if isinstance(self.residual, And):
+            steps.extend(self.residual.children)
+        elif self.residual is not None:
+            steps.append(self.residual)
+        return steps
+
+
+_ANALYZED: list[Plan] | None = None #планы, собранные explain analyze
+
+
+#explain analyze: планы, построенные внутри блока, считают строки и время и попадают в список
+@contextmanager
+def analyze_plans() -> Iterator[list[Plan]]:
+    global _ANALYZED
+    _ANALYZED = plans = []
+    try:
+        yield plans
+    finally:
+        _ANALYZED = None
+
+
+#Способ найти строки по одному условию без полного прохода: (оценка числа строк, способ, источник)
+def _access(
+    pred: Predicate,
+    table: ColumnarTable,
+    indexes: TableIndexes | None,
+) -> tuple[int, str, Callable[[], Iterator[RowView]]] | None:
+    if isinstance(pred, Or):
+        parts = [_access(child, table, indexes) for child in pred.children]
+        if any(part is None for part in parts):
+            return None
+
+        def union() -> Iterator[RowView]:
+            seen: dict[int, RowView] = {}
+            for _, _, source in parts:
+                for row in source():
+                    seen.setdefault(row.pos, row)
+            for pos in sorted(seen):
+                yield seen[pos]
+
+        return sum(part[0] for part in parts), "index_union", union
+
+    if isinstance(pred, And):
+        found = [a for a in (_access(child, table, indexes) for child in pred.children) if a]
+        return min(found, key=lambda a: a[0]) if found else None
+
+    if isinstance(pred, InList):
+        values = pred.values
+    elif isinstance(pred, Comparison) and pred.op == "=":
+        values = [pred.value]
+    elif isinstance(pred, Comparison) and pred.column == "ID" and pred.op != "!=":
+        positions = table.id_positions(pred.op, pred.value)
+        if positions is None:
+            return None
+        return len(positions), "id_range", lambda: table.rows_at(positions)
+    else:
+        return None
+
+    if pred.column == "ID":
+        ids = sorted({v for v in values if type(v) is int})
+        return len(ids), "id_lookup", lambda: table.rows_by_ids(ids)
+
+    if indexes is None or pred.column not in indexes.secondary:
+        return None
+    ids = indexes.ids(pred.column, values)
+    return len(ids), "index_lookup", lambda: table.rows_by_ids(ids)
+
+
+#Планировщик: самое избирательное условие, которое можно найти через ID или индекс, ведет поиск,
+#остальные проверяются на найденных строках. Если такого нет - полный проход
+def plan_query(table: ColumnarTable, where: Predicate, indexes: TableIndexes | None) -> Plan:
+    stats = indexes.stats if indexes is not None else None
+    plan = _choose_plan(table, where, indexes, stats)
+    if stats is not None:
+        plan.estimated_matches = round(len(table) * selectivity(where, stats))
+    if _ANALYZED is not None:
+        plan.table_rows = plan.estimated_rows if plan.pruned is not None else len(table) #пропущенные части не читаются
+        plan.counting = True
+        _ANALYZED.append(plan)
+    return plan
+
+
+def _choose_plan(
+    table: ColumnarTable,
+    where: Predicate,
+    indexes: TableIndexes | None,
+    stats: TableStats | None,
+) -> Plan:
+    children = where.children if isinstance(where, And) else [where]
+
+    best: tuple[int, str, Callable[[], Iterator[RowView]], Predicate] | None = None
+    for child in children:
+        access = _access(child, table, indexes)
+        if access is not None and (best is None or access[0] < best[0]):
+            best = (*access, child)
+
+    if best is not None and best[0] < len(table):
+        estimate, kind, source, driver = best
+        residual = _rest(children, driver)
+        if isinstance(driver, (And, Or)):
+            #вложенные условия дают надмножество строк - перепроверяем их целиком
+            residual = driver if residual is None else And([driver, residual])
+        return Plan(kind, driver, residual, estimate, source)
+
+    #Полный проход: простое условие проверяется прямо по массиву столбца. По статистике берется
+    #самое избирательное - остальные условия проверяются на меньшем числе строк
+    simple = [
+        child for child in children if isinstance(child, (Comparison, InList)) and child.column in table.columns
+    ]
+    driver = None
+    if simple:
+        if stats is not None:
+            simple.sort(key=lambda child: selectivity(child, stats))
+        driver = simple[0]
+    residual = _rest(children, driver) if driver is not None else where
+
+    #Формат segments: части, где по min/max подходящих строк быть не может, не просматриваются
+    keep = _segments_to_scan(table, simple)
+    total = -(-len(table.live) // SEGMENT_ROWS)
+
+    #Большая таблица, совпадающая со своими файлами, - проход по сегментам в нескольких процессах
+    segments = segment_count(table, keep)
+    if segments:
+        rows = table.live_in(keep) if keep is not None else len(table)
+        plan = Plan(
+            "full_scan", driver, residual, rows, lambda: scan_rows(table, driver, residual, plan.count_segment, keep)
+        )
+        plan.segments = segments
+        plan.parts = keep
+        if keep is not None:
+            plan.pruned = (total - len(keep), total)
+        return plan
+
+    if keep is not None:
+        rows = table.live_in(keep)
+        if driver is not None:
+            plan = Plan("full_scan", driver, residual, rows, lambda: table.iter_match(driver.column, driver.test, keep))
+        else:
+            plan = Plan("full_scan", None, where, rows, lambda: table.rows_in(keep))
+        plan.pruned = (total - len(keep), total)
+        return plan
+    if driver is not None:
+        return Plan(
+            "full_scan", driver, residual, len(table), lambda: table.iter_match(driver.column, driver.test)
+        )
+    return Plan("full_scan", None, where, len(table), lambda: iter(table))
+
+
+#Номера частей таблицы, которые нужно просмотреть, или None - смотреть все. Часть пропускается, если
+#хоть одно из условий (они соединены через and) не проходит по ее min/max. Части, измененные после
+#записи, просматриваются всегда: их min/max устарели
+def _segments_to_scan(table: ColumnarTable, conditions: list[Comparison | InList]) -> list[int] | None:
+    zones, changed = table.zones, table.changed
+    if zones is None or changed is None or not conditions:
+        return None
+    total = -(-len(table.live) // SEGMENT_ROWS)
+    keep = [
+        num
+        for num in range(total)
+        if num in changed or num >= len(zones) or all(_zone_may_match(child, zones[num]) for child in conditions)
+    ]
+    return keep if len(keep) < total else None
+
+
+#Может ли в части с такими min/max найтись строка под условие
+def _zone_may_match(pred: Comparison | InList, zone: dict[str, Any]) -> bool:
+    if pred.column not in zone:
+        return True
+    bounds = zone[pred.column]
+    values = pred.values if isinstance(pred, InList) else [pred.value]
+    if bounds is None:
+        return False #у столбца в части нет ни одного значения - сравнение не подойдет
+    low, high = bounds
+    if any(type(value) is not type(low) for value in values):
+        return True #значение другого типа: min/max о нем ничего не говорят
+    if isinstance(pred, InList) or pred.op == "=":
+        return any(low <= value <= high for value in values)
+    value = pred.value
+    if pred.op == "!=":
+        return not low == high == value
+    if pred.op == "<":
+        return low < value
+    if pred.op == "<=":
+        return low <= value
+    if pred.op == ">":
+        return high > value
+    return high >= value
+
+
+#Оценка доли строк, подходящих под условие: значения считаются равновероятными, условия - независимыми
+def selectivity(pred: Predicate, stats: TableStats) -> float:
+    if isinstance(pred, And):
+        fraction = 1.0
+        for child in pred.children:
+            fraction *= selectivity(child, stats)
+        return fraction
+    if isinstance(pred, Or):
+        return min(1.0, sum(selectivity(child, stats) for child in pred.children))
+
+    column = stats.columns.get(pred.column)
+    if column is None:
+        return 1.0
+    if isinstance(pred, InList):
+        return min(1.0, len(pred.values) * column.equal_fraction(stats.rows))
+    if pred.op == "=":
+        return column.equal_fraction(stats.rows)
+    if pred.op == "!=":
+        return max(0.0, column.count / stats.rows - column.equal_fraction(stats.rows)) if stats.rows else 0.0
+    return column.range_fraction(pred.op, pred.value, stats.rows)
+
+
+def _rest(children: list[Predicate], driver: Predicate) -> Predicate | None:
+    rest = [child for child in children if child is not driver]
+    if not rest:
+        return None
+    return rest[0] if len(rest) == 1 else And(rest)
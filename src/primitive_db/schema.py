@@ -0,0 +1,144 @@
+"""
+Скомпилированные схемы таблиц: строки "имя:тип" разбираются один раз, у каждого столбца свои функции приведения
+"""
+
+import re
+from typing import Any, Callable
+
+SUPPORTED_TYPES = {"int", "str", "bool"}
+
+_BOOL_LITERALS = {"true": True, "false": False}
+_ESCAPE_RE = re.compile(r"\\(.)", re.DOTALL)
+
+
+class DbValueError(ValueError):
+    """Выводит ошибки"""
+
+
+#Значение из команды: int - число, bool - true/false, str - в кавычках
+def _parse_int(raw: str) -> int:
+    try:
+        return int(raw)
+    except ValueError as e:
+        raise DbValueError(raw) from e
+
+
+def _parse_bool(raw: str) -> bool:
+    value = _BOOL_LITERALS.get(raw.lower())
+    if value is None:
+        raise DbValueError(raw)
+    return value
+
+
+def _parse_str(raw: str) -> str:
+    if len(raw) >= 2 and ((raw[0] == '"' and raw[-1] == '"') or (raw[0] == "'" and raw[-1] == "'")):
+        return unquote(raw)
+    raise DbValueError(raw)
+
+
+#Строка в кавычках -> значение: \ перед символом делает его обычным символом (\" - кавычка, \\ - \)
+def unquote(raw: str) -> str:
+    return _ESCAPE_RE.sub(r"\1", raw[1:-1])
+
+
+#Значение из загружаемого файла: csv - строки, jsonl - типы JSON
+def _load_int(value: Any) -> int:
+    if type(value) is int:
+        return value
+    if type(value) is str:
+        return _parse_int(value)
+    raise DbValueError(repr(value))
+
+
+def _load_bool(value: Any) -> bool:
+    if type(value) is bool:
+        return value
+    if type(value) is str and value.strip().lower() in _BOOL_LITERALS:
+        return _BOOL_LITERALS[value.strip().lower()]
+    raise DbValueError(repr(value))
+
+
+def _load_str(value: Any) -> str:
+    if type(value) is str:
+        return value
+    raise DbValueError(repr(value))
+
+
+_PARSERS: dict[str, Callable[[str], Any]] = {"int": _parse_int, "bool": _parse_bool, "str": _parse_str}
+_LOADERS: dict[str, Callable[[Any], Any]] = {"int": _load_int, "bool": _load_bool, "str": _load_str}
+
+
+class Column:
+    """Столбец: имя, тип, позиция в схеме и готовые функции приведения"""
+
+    __slots__ = ("name", "type", "position", "_parse", "_load")
+
+    def __init__(self, name: str, col_type: str, position: int):
+        if col_type not in SUPPORTED_TYPES:
+            raise DbValueError(col_type)
+        self.name = name
+        self.type = col_type
+        self.position = position
+        self._parse = _PARSERS[col_type]
+        self._load = _LOADERS[col_type]
+
+    #Литерал из команды (insert, where, set)
+    def parse(self, raw: str) -> Any:
+        return self._parse(raw.strip())
+
+    #Значение из файла при массовой загрузке
+    def load(self, value: Any) -> Any:
+        if value is None:
+            raise DbValueError(f"нет значения для {self.name}")
+        return self._load(value)
+
+    def __repr__(self) -> str:
+        return f"{self.name}:{self.type}"
+
+
+class Schema:
+    """Схема таблицы, собранная из списка "имя:тип" в метаданных"""
+
+    __slots__ = ("source", "columns", "names", "by_name")
+
+    def __init__(self, source: list[str]):
+        self.source = source
+        self.columns: list[Column] = []
+        for position, item in enumerate(source):
+            name, col_type = item.split(":", 1)
+            self.columns.append(Column(name.strip(), col_type.strip(), position))
+        self.names = [col.name for col in self.columns]
+        self.by_name = {col.name: col for col in self.columns}
+
+    #Столбцы со значениями от пользователя (все, кроме ID)
+    @property
+    def data_columns(self) -> list[Column]:
+        return self.columns[1:]
+
+    def column(self, name: str) -> Column:
+        col = self.by_name.get(name)
+        if col is None:
+            raise DbValueError(name)
+        return col
+
+    #Запись для insert: значения по порядку столбцов, без ID
+    def parse_values(self, values: list[str]) -> dict[str, Any]:
+        columns = self.data_columns
+        if len(values) != len(columns):
+            raise DbValueError("values")
+        return {col.name: col.parse(raw) for col, raw in zip(columns, values)}
+
+
+_SCHEMAS: dict[str, Schema] = {}
+
+#Схема таблицы из метаданных; пересобирается, только если список столбцов в метаданных заменился
+def get_schema(metadata: dict, table_name: str) -> Schema:
+    source = metadata.get(table_name)
+    if not isinstance(source, list):
+        raise ValueError(f'Таблица "{table_name}" не существует.')
+
+    schema = _SCHEMAS.get(table_name)
+    if schema is None or schema.source is not source:
+        schema = Schema(source)
+        _SCHEMAS[table_name] = schema
+    return schema
@@ -0,0 +1,136 @@
+"""
+Формат segments: таблица лежит в папке data/<имя>.seg/ частями по SEGMENT_ROWS позиций, каждая часть -
+отдельный файл в двоичном формате. ID растут вместе с позицией, поэтому часть покрывает свой диапазон ID.
+Манифест перечисляет части и min/max столбцов в каждой: контрольная точка переписывает только измененные
+части, а полный проход пропускает части, где по min/max не может быть подходящих строк
+"""
+
+import os
+from typing import Any
+
+from .columnar import SEGMENT_ROWS, BoolColumn, ColumnarTable, IntColumn, StrColumn, bits_mask, masked_chunks
+from .schema import Schema
+from .utils import (
+    load_segments_manifest,
+    open_binary_file,
+    remove_segment_files,
+    save_binary_file,
+    save_segments_manifest,
+    segment_filepath,
+    segments_dirpath,
+)
+
+MANIFEST_VERSION = 1
+
+
+#Таблица из частей: каждая открывается через mmap и копируется в общие столбцы (без разбора JSON строк).
+#Если схема в манифесте не та, что в метаданных, строки перекладываются под новую схему
+def load_segments_table(table_name: str, schema: Schema) -> tuple[ColumnarTable, int]:
+    manifest = load_segments_manifest(table_name)
+    if manifest is None:
+        raise ValueError(f'Манифест таблицы "{table_name}" не найден.')
+    stored = Schema(manifest["schema"])
+    parts = []
+    for item in manifest["segments"]:
+        header, sections = open_binary_file(segment_filepath(table_name, item["file"]), table_name)
+        parts.append(ColumnarTable.from_buffers(stored, header, sections))
+    table = ColumnarTable.concat(stored, parts, manifest["ids_sorted"])
+    if manifest["schema"] != schema.source:
+        return ColumnarTable.from_rows(schema, table.to_dicts()), manifest["next_id"]
+    table.zones = [item["zones"] for item in manifest["segments"]]
+    table.changed = set()
+    table.source_files = _source_files(table_name, manifest["segments"])
+    return table, manifest["next_id"]
+
+
+#Запись таблицы: новые файлы для измененных частей (table.changed, None - все), затем манифест,
+#затем удаление файлов, на которые он больше не ссылается. При сбое остается прежний манифест
+#со своими файлами
+def save_segments_table(table_name: str, table: ColumnarTable, next_id: int) -> None:
+    os.makedirs(segments_dirpath(table_name), exist_ok=True)
+    manifest = load_segments_manifest(table_name)
+    old: list[dict[str, Any]] = []
+    generation = 1
+    if manifest is not None:
+        generation = manifest["generation"] + 1
+        if manifest["schema"] == table.schema.source and manifest["segment_rows"] == SEGMENT_ROWS:
+            old = manifest["segments"]
+
+    size = len(table.live)
+    items = []
+    for num, start in enumerate(range(0, size, SEGMENT_ROWS)):
+        end = min(size, start + SEGMENT_ROWS)
+        kept = table.changed is not None and num not in table.changed
+        if kept and num < len(old) and old[num]["rows"] == end - start:
+            items.append(old[num])
+            continue
+        part = table.segment(start, end)
+        for name, column in part.columns.items():
+            if isinstance(column, StrColumn):
+                part.columns[name] = column.compacted() #в файл части - только ее строки словаря
+        header, sections = part.to_buffers()
+        filename = f"{num:06d}.{generation}.tbl"
+        save_binary_file(segment_filepath(table_name, filename), header, sections, "segments")
+        items.append({"file": filename, "rows": end - start, "live": len(part), "zones": _zones(part)})
+
+    save_segments_manifest(
+        table_name,
+        {
+            "version": MANIFEST_VERSION,
+            "schema": table.schema.source,
+            "next_id": next_id,
+            "generation": generation,
+            "segment_rows": SEGMENT_ROWS,
+            "rows": size,
+            "live": len(table),
+            "ids_sorted": table.ids_sorted,
+            "segments": items,
+        },
+    )
+    remove_segment_files(table_name, {item["file"] for item in items})
+    table.changed = set()
+    table.zones = [item["zones"] for item in items]
+    table.source_files = _source_files(table_name, items)
+
+
+#Файлы частей для параллельного прохода: (путь, отпечаток, позиция первой строки части, строк в части)
+def _source_files(table_name: str, items: list[dict[str, Any]]) -> list[tuple[str, tuple[int, int], int, int]]:
+    files, base = [], 0
+    for item in items:
+        path = os.path.abspath(segment_filepath(table_name, item["file"]))
+        st = os.stat(path)
+        files.append((path, (st.st_mtime_ns, st.st_size), base, item["rows"]))
+        base += item["rows"]
+    return files
+
+
+#min/max каждого столбца по живым строкам части (None - у столбца нет ни одного значения его типа).
+#Значения нужного типа, которые не легли в столбец (например, слишком большие числа), тоже учитываются
+def _zones(part: ColumnarTable) -> dict[str, list[Any] | None]:
+    size = len(part.live)
+    live = bits_mask(part.live)
+    zones: dict[str, list[Any] | None] = {}
+    for col in part.schema.columns:
+        column = part.columns[col.name]
+        values: list[Any] = []
+        if isinstance(column, IntColumn):
+            for chunk in masked_chunks(column.values, live & bits_mask(column.present), size):
+                values.extend((min(chunk), max(chunk)))
+        elif isinstance(column, BoolColumn):
+            present = live & bits_mask(column.present)
+            trues = (bits_mask(column.values) & present).bit_count()
+            if present:
+                values.extend((trues == present.bit_count(), trues > 0))
+        else:
+            codes: set[int] = set()
+            for chunk in masked_chunks(column.codes, live, size):
+                codes.update(chunk)
+            codes.discard(-1)
+            values.extend(column.dictionary[code] for code in codes)
+        values.extend(
+            extra[col.name]
+            for pos, extra in part.extras.items()
+            if part.live[pos] and type(extra.get(col.name)).__name__ == col.type
+        )
+        zones[col.name] = [min(values), max(values)] if values else None
+    return zones
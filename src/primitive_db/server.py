@@ -0,0 +1,234 @@
+"""
+Сетевой режим: asyncio-сервер принимает те же команды построчно по TCP,
+таблицы в памяти общие для всех подключений
+"""
+
+import asyncio
+import contextlib
+import io
+import shlex
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from .engine import command_table, execute, shutdown, table_manager
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7433
+IDLE_COMPACT_SECONDS = 5.0 #столько секунд без команд - сервер сжимает таблицы с заметной долей мусора
+
+#Ответ сервера: строки вывода команды и строка "." в конце.
+#Строки вывода, начинающиеся с ".", дополняются еще одной точкой (как в SMTP)
+END_OF_RESPONSE = "."
+
+#Команды, которые только читают таблицу
+_READ_COMMANDS = {"select", "info"}
+#Команды без таблицы, которые ничего не меняют
+_FREE_COMMANDS = {"help", "list_tables", "stats"}
+_TRANSACTION_COMMANDS = {"begin", "commit", "rollback"}
+
+
+def encode_response(output: str) -> bytes:
+    lines = ["." + line if line.startswith(".") else line for line in output.splitlines()]
+    lines.append(END_OF_RESPONSE)
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+#Выполнить команду движка и вернуть ее вывод. Вызывается только в потоке движка, а цикл событий
+#сам ничего не печатает, пока сервер работает, поэтому подмена stdout не смешивает вывод подключений
+def _run(command: str) -> str:
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        execute(command)
+    return buffer.getvalue()
+
+
+class TableLocks:
+    """Таблицы, занятые открытой транзакцией: команды других подключений к ним ждут commit/rollback"""
+
+    def __init__(self):
+        self._owners: dict[str, object] = {}
+        self._released = asyncio.Condition()
+
+    async def wait_free(self, table: str, session: object) -> None:
+        async with self._released:
+            await self._released.wait_for(lambda: self._owners.get(table, session) is session)
+
+    def hold(self, table: str, session: object) -> None:
+        self._owners[table] = session
+
+    async def release_all(self, session: object) -> None:
+        async with self._released:
+            for table in [t for t, owner in self._owners.items() if owner is session]:
+                del self._owners[table]
+            self._released.notify_all()
+
+
+class DatabaseServer:
+    """Общий движок для всех подключений.
+
+    Команды выполняются по одной в отдельном потоке движка (таблицы, кэши и журнал в памяти общие и
+    не рассчитаны на одновременный доступ), а цикл событий в это время принимает подключения, читает
+    команды и отправляет ответы: долгий select задерживает очередь команд, но не сеть. Открытая транзакция
+    держит блокировку записи до commit/rollback (журнал и откат в движке - одни на процесс) и таблицы,
+    которые она меняла: их чтение другими подключениями ждет конца транзакции. Записи вне транзакции
+    подтверждаются клиенту после fsync журнала, один fsync на все записи, выполненные за один проход
+    цикла (групповой коммит)"""
+
+    def __init__(self):
+        self.write_lock = asyncio.Lock()
+        self.locks = TableLocks()
+        self.connections = 0
+        self.commands = 0
+        self.closing = False #сервер останавливается: движок уже закрыт
+        self._txn_session: object | None = None
+        self._sync_waiter: asyncio.Future | None = None
+        self._last_command = time.monotonic()
+        self._engine = ThreadPoolExecutor(max_workers=1, thread_name_prefix="engine")
+
+    #Вызов движка в его потоке: все обращения к таблицам идут из одного потока по очереди
+    async def _call(self, func: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._engine, func, *args)
+
+    async def _execute(self, command: str) -> str:
+        return await self._call(_run, command)
+
+    #Дождаться команд, уже отправленных в поток движка (перед остановкой сервера)
+    def close(self) -> None:
+        self.closing = True
+        self._engine.shutdown(wait=True)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session = object()
+        self.connections += 1
+        try:
+            while line := await reader.readline():
+                command = line.decode("utf-8", errors="replace").strip()
+                if command == "exit":
+                    break
+                if not command:
+                    continue
+                output = await self.run_command(session, command)
+                writer.write(encode_response(output))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            #клиент отключился посреди транзакции - ее изменения отменяются
+            if self._txn_session is session and not self.closing:
+                await self._execute("rollback")
+                await self._end_transaction(session)
+            writer.close()
+
+    async def run_command(self, session: object, command: str) -> str:
+        self.commands += 1
+        self._last_command = time.monotonic()
+        try:
+            args = shlex.split(command)
+        except ValueError:
+            return await self._execute(command) #движок сам сообщит об ошибке разбора
+
+        name = args[0]
+        table = command_table(args)
+        if name == "explain":
+            #план без выполнения - чтение; explain analyze выполняет команду и может быть записью
+            analyze = len(args) > 2 and args[1].lower() == "analyze"
+            name = args[2] if analyze else "select"
+
+        if name in _FREE_COMMANDS:
+            return await self._execute(command)
+
+        if name in _TRANSACTION_COMMANDS:
+            return await self._transaction_command(session, name, command)
+
+        if name in _READ_COMMANDS:
+            if table is not None:
+                await self.locks.wait_free(table, session)
+            return await self._execute(command)
+
+        if self._txn_session is session:
+            if table is not None:
+                self.locks.hold(table, session)
+            return await self._execute(command)
+
+        async with self.write_lock:
+            output = await self._execute(command)
+            await self._call(table_manager().commit)
+        try:
+            await self._durable()
+        except OSError as e:
+            return f"{output}Ошибка: запись не подтверждена, fsync журнала не удался: {e}\n"
+        return output
+
+    async def _transaction_command(self, session: object, name: str, command: str) -> str:
+        if name == "begin":
+            if self._txn_session is session:
+                return await self._execute(command) #движок ответит, что транзакция уже открыта
+            await self.write_lock.acquire()
+            output = await self._execute(command)
+            if table_manager().in_transaction:
+                self._txn_session = session
+            else:
+                self.write_lock.release()
+            return output
+
+        if self._txn_session is not session:
+            return "Ошибка: Нет открытой транзакции.\n"
+        output = await self._execute(command)
+        if not table_manager().in_transaction:
+            await self._end_transaction(session)
+        return output
+
+    async def _end_transaction(self, session: object) -> None:
+        self._txn_session = None
+        await self.locks.release_all(session)
+        self.write_lock.release()
+
+    #Дождаться fsync журнала. Записи, выполненные до запуска _sync, ждут один и тот же fsync.
+    #fsync идет без блокировки записи, поэтому перед ним другое подключение может успеть открыть транзакцию
+    async def _durable(self) -> None:
+        if self._sync_waiter is None:
+            self._sync_waiter = asyncio.get_running_loop().create_future()
+            asyncio.get_running_loop().create_task(self._sync())
+        await asyncio.shield(self._sync_waiter)
+
+    #Сжатие в простое: если команд давно не было и никто не держит запись (транзакция, запись в работе),
+    #таблицы с мусором переписываются, пока сервер ничем не занят
+    async def compact_when_idle(self) -> None:
+        while True:
+            await asyncio.sleep(IDLE_COMPACT_SECONDS)
+            if time.monotonic() - self._last_command < IDLE_COMPACT_SECONDS or self.write_lock.locked():
+                continue
+            async with self.write_lock:
+                await self._call(table_manager().compact_idle)
+
+    async def _sync(self) -> None:
+        waiter, self._sync_waiter = self._sync_waiter, None
+        try:
+            await self._call(table_manager().sync)
+        except OSError as e:
+            waiter.set_exception(e)
+            return
+        waiter.set_result(None)
+
+
+async def _serve(host: str, port: int) -> None:
+    database = DatabaseServer()
+    server = await asyncio.start_server(database.handle, host, port)
+    compaction = asyncio.create_task(database.compact_when_idle())
+    with table_manager().batch(): #файлы меняет только этот процесс - проверять их перед командами не нужно
+        try:
+            print(f"Сервер слушает {host}:{port}. Остановка - Ctrl+C.")
+            async with server:
+                await server.serve_forever()
+        finally:
+            compaction.cancel()
+            database.close()
+            shutdown()
+            print(f"Сервер остановлен (подключений обслужено: {database.connections}, команд: {database.commands}).")
+
+
+#Запуск сервера до Ctrl+C; при остановке изменения сбрасываются контрольной точкой
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(_serve(host, port))
@@ -0,0 +1,446 @@
+"""
+Команды с данными (select, insert, update, delete, explain): дерево команды и кэш разобранных команд.
+Литералы (строки в кавычках, числа, true/false) заменяются на ? за один проход регулярным выражением;
+получившийся текст - ключ кэша. Разбирается только текст с ?, поэтому команды, которые отличаются
+одними значениями, разбираются и привязываются к схеме таблицы один раз, а дальше подставляются значения
+"""
+
+import re
+from collections import OrderedDict
+from typing import Any, Callable
+
+from .aggregate import Aggregate, make_aggregate
+from .metrics import METRICS
+from .output import FORMATS as OUTPUT_FORMATS
+from .query import And, Comparison, InList, Or, Predicate
+from .schema import Column, DbValueError, Schema, unquote
+
+STATEMENTS = ("select", "insert", "update", "delete", "explain")
+DEFAULT_MAX_STATEMENTS = 512 #сколько разобранных команд держать в кэше
+
+#Разделители слов: литерал - это отдельное слово, а не часть имени (t1, 1_000 остаются словами)
+_DELIMS = r"""\s=<>!(),'"*?"""
+_LITERAL_RE = re.compile(
+    rf"""("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')|(?<![^{_DELIMS}])(-?\d+|true|false)(?![^{_DELIMS}])""",
+    re.IGNORECASE,
+)
+_TOKEN_RE = re.compile(rf"""\s*(?:(\?)|(<=|>=|!=|<>|=|<|>|\(|\)|,|\*)|([^{_DELIMS}]+))""")
+_PARAM, _PUNCT, _WORD = 1, 2, 3
+
+#Место значения в команде: номер параметра (литерал из текста команды) или слово без кавычек как есть
+Slot = int | str
+
+
+class Condition:
+    """Условие where с местами для значений: col = ?, col in (?, ?)"""
+
+    __slots__ = ("column", "op", "slots")
+
+    def __init__(self, column: str, op: str, slots: list[Slot]):
+        self.column = column
+        self.op = op
+        self.slots = slots
+
+
+class Junction:
+    """Условия через and или or"""
+
+    __slots__ = ("op", "children")
+
+    def __init__(self, op: str, children: list[Any]):
+        self.op = op
+        self.children = children
+
+
+Where = Condition | Junction
+
+
+class Select:
+    """select [агрегаты] from <таблица> [where ...] [group by ...] [limit/offset/format/into outfile]"""
+
+    kind = "select"
+    __slots__ = ("table", "aggregates", "where", "group_by", "limit", "offset", "format", "outfile")
+
+    def __init__(self, table: str):
+        self.table = table
+        self.aggregates: list[tuple[str, str | None]] | None = None #None - select без агрегатов
+        self.where: Where | None = None
+        self.group_by: str | None = None
+        self.limit: Slot | None = None
+        self.offset: Slot | None = None
+        self.format: str | None = None #None - формат вывода по умолчанию
+        self.outfile: Slot | None = None
+
+
+class Insert:
+    """insert into <таблица> values (...)"""
+
+    kind = "insert"
+    __slots__ = ("table", "values")
+
+    def __init__(self, table: str, values: list[Slot]):
+        self.table = table
+        self.values = values
+
+
+class Update:
+    """update <таблица> set <столбец> = <значение> where ..."""
+
+    kind = "update"
+    __slots__ = ("table", "column", "value", "where")
+
+    def __init__(self, table: str, column: str, value: Slot, where: Where):
+        self.table = table
+        self.column = column
+        self.value = value
+        self.where = where
+
+
+class Delete:
+    """delete from <таблица> where ..."""
+
+    kind = "delete"
+    __slots__ = ("table", "where")
+
+    def __init__(self, table: str, where: Where):
+        self.table = table
+        self.where = where
+
+
+class Explain:
+    """explain [analyze] <select|update|delete ...>"""
+
+    kind = "explain"
+    __slots__ = ("analyze", "statement", "table")
+
+    def __init__(self, analyze: bool, statement: Select | Update | Delete):
+        self.analyze = analyze
+        self.statement = statement
+        self.table = statement.table
+
+
+Statement = Select | Insert | Update | Delete | Explain
+
+
+class Bound:
+    """Команда, привязанная к схеме таблицы: столбцы проверены, агрегаты собраны,
+    условие where - функция от значений параметров"""
+
+    __slots__ = ("schema", "where", "aggregates", "group_by", "column")
+
+    def __init__(self, schema: Schema):
+        self.schema = schema
+        self.where: Callable[[list[str]], Predicate] | None = None
+        self.aggregates: list[Aggregate] | None = None
+        self.group_by: str | None = None
+        self.column: Column | None = None #столбец из set в update
+
+    def predicate(self, params: list[str]) -> Predicate | None:
+        return None if self.where is None else self.where(params)
+
+
+class Prepared:
+    """Разобранная команда из кэша; привязка к схеме пересобирается, только если схема таблицы сменилась"""
+
+    __slots__ = ("statement", "param_count", "_bound")
+
+    def __init__(self, statement: Statement, param_count: int):
+        self.statement = statement
+        self.param_count = param_count
+        self._bound: Bound | None = None
+
+    def bind(self, schema: Schema) -> Bound:
+        bound = self._bound
+        if bound is None or bound.schema is not schema:
+            statement = self.statement
+            bound = _bind(statement.statement if isinstance(statement, Explain) else statement, schema)
+            self._bound = bound
+        return bound
+
+
+class StatementCache:
+    """Разобранные команды по тексту с ? вместо литералов, вытеснение LRU"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_STATEMENTS):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, Prepared] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_parse(self, key: str) -> Prepared:
+        prepared = self._entries.get(key)
+        if prepared is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return prepared
+
+        self.misses += 1
+        prepared = _parse(key)
+        self._entries[key] = prepared
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return prepared
+
+    def stats(self) -> dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+_STATEMENTS = StatementCache()
+METRICS.register_source("statement_cache", _STATEMENTS.stats)
+
+
+#Команда -> (разобранная команда, литералы по порядку). Литералы остаются текстом: тип им дает столбец
+def prepare(text: str) -> tuple[Prepared, list[str]]:
+    params: list[str] = []
+
+    def placeholder(match: re.Match) -> str:
+        params.append(match.group(0))
+        return "?"
+
+    key = " ".join(_LITERAL_RE.sub(placeholder, text).split())
+    prepared = _STATEMENTS.get_or_parse(key)
+    if prepared.param_count != len(params):
+        raise DbValueError("?") #знак ? вне кавычек в самой команде
+    return prepared, params
+
+
+#Значение места: литерал из команды или слово как есть
+def value(slot: Slot, params: list[str]) -> str:
+    return params[slot] if type(slot) is int else slot
+
+
+#Неотрицательное число (limit, offset)
+def count_value(slot: Slot, params: list[str]) -> int:
+    raw = value(slot, params)
+    try:
+        number = int(raw)
+    except ValueError as e:
+        raise DbValueError(raw) from e
+    if number < 0:
+        raise DbValueError(raw)
+    return number
+
+
+#Путь без кавычек (into outfile)
+def path_value(slot: Slot, params: list[str]) -> str:
+    raw = value(slot, params)
+    path = unquote(raw) if raw[:1] in ("'", '"') else raw
+    if not path:
+        raise DbValueError("into outfile")
+    return path
+
+
+def _bind(statement: Select | Insert | Update | Delete, schema: Schema) -> Bound:
+    bound = Bound(schema)
+    if isinstance(statement, Select):
+        if statement.aggregates is not None:
+            bound.aggregates = [make_aggregate(func, column, schema) for func, column in statement.aggregates]
+        if statement.group_by is not None:
+            bound.group_by = schema.column(statement.group_by).name
+    elif isinstance(statement, Update):
+        bound.column = schema.column(statement.column)
+        if bound.column.name == "ID":
+            raise DbValueError("ID")
+    if not isinstance(statement, Insert) and statement.where is not None:
+        bound.where = _bind_where(statement.where, schema)
+    return bound
+
+
+#Условие where -> функция, которая по значениям параметров строит готовое дерево условий
+def _bind_where(node: Where, schema: Schema) -> Callable[[list[str]], Predicate]:
+    if isinstance(node, Junction):
+        parts = [_bind_where(child, schema) for child in node.children]
+        junction = And if node.op == "and" else Or
+        return lambda params: junction([part(params) for part in parts])
+
+    column = schema.column(node.column)
+    name, parse, op, slots = column.name, column.parse, node.op, node.slots
+    if op == "in":
+        return lambda params: InList(name, [parse(value(slot, params)) for slot in slots])
+    slot = slots[0]
+    return lambda params: Comparison(name, op, parse(value(slot, params)))
+
+
+def _parse(key: str) -> Prepared:
+    kinds: list[int] = []
+    texts: list[str] = []
+    pos = 0
+    while pos < len(key):
+        match = _TOKEN_RE.match(key, pos)
+        if match is None:
+            raise DbValueError(key[pos:].strip())
+        kinds.append(match.lastindex or 0)
+        texts.append(match.group(match.lastindex or 0))
+        pos = match.end()
+
+    parser = _Parser(kinds, texts)
+    statement = parser.parse_statement()
+    if parser.pos != len(texts):
+        raise DbValueError(" ".join(texts[parser.pos :]))
+    return Prepared(statement, parser.params)
+
+
+class _Parser:
+    """Рекурсивный спуск по словам команды; литералы в ней уже заменены на ?"""
+
+    def __init__(self, kinds: list[int], texts: list[str]):
+        self.kinds = kinds
+        self.texts = texts
+        self.pos = 0
+        self.params = 0 #сколько ? уже пройдено: номер следующего параметра
+
+    def _peek(self) -> str:
+        return self.texts[self.pos].lower() if self.pos < len(self.texts) else ""
+
+    def _next(self, context: str) -> str:
+        if self.pos >= len(self.texts):
+            raise DbValueError(context)
+        self.pos += 1
+        return self.texts[self.pos - 1]
+
+    def _expect(self, token: str, context: str) -> None:
+        if self._next(context).lower() != token:
+            raise DbValueError(context)
+
+    def _skip(self, token: str) -> bool:
+        if self._peek() == token:
+            self.pos += 1
+            return True
+        return False
+
+    def _word(self, context: str) -> str:
+        text = self._next(context)
+        if self.kinds[self.pos - 1] != _WORD:
+            raise DbValueError(text)
+        return text
+
+    def _value(self, context: str) -> Slot:
+        text = self._next(context)
+        kind = self.kinds[self.pos - 1]
+        if kind == _PARAM:
+            self.params += 1
+            return self.params - 1
+        if kind != _WORD:
+            raise DbValueError(text)
+        return text
+
+    def parse_statement(self) -> Statement:
+        command = self._next("explain")
+        if command == "explain":
+            analyze = self._skip("analyze")
+            command = self._next("explain")
+            if command not in ("select", "update", "delete"):
+                raise DbValueError("explain")
+            return Explain(analyze, self._parse_command(command))
+        return self._parse_command(command)
+
+    def _parse_command(self, command: str) -> Statement:
+        if command == "select":
+            return self._select()
+        if command == "insert":
+            self._expect("into", "insert")
+            table = self._word("insert")
+            self._expect("values", "values")
+            return Insert(table, self._values("values"))
+        if command == "update":
+            table = self._word("update")
+            self._expect("set", "update")
+            column = self._word("update")
+            self._expect("=", "update")
+            value_slot = self._value("update")
+            self._expect("where", "update")
+            return Update(table, column, value_slot, self.parse_or())
+        if command == "delete":
+            self._expect("from", "delete")
+            table = self._word("delete")
+            self._expect("where", "where")
+            return Delete(table, self.parse_or())
+        raise DbValueError(command)
+
+    def _select(self) -> Select:
+        aggregates = None
+        if self._peek() != "from":
+            aggregates = [self._aggregate()]
+            while self._skip(","):
+                aggregates.append(self._aggregate())
+        self._expect("from", "select")
+        statement = Select(self._word("select"))
+        statement.aggregates = aggregates
+        if self._skip("where"):
+            statement.where = self.parse_or()
+        if self._skip("group"):
+            self._expect("by", "group by")
+            if aggregates is None:
+                raise DbValueError("group by")
+            statement.group_by = self._word("group by")
+
+        #хвост: limit, offset, format и into outfile в любом порядке
+        while self.pos < len(self.texts):
+            clause = self._next("select").lower()
+            if clause == "limit":
+                statement.limit = self._value("limit")
+            elif clause == "offset":
+                statement.offset = self._value("offset")
+            elif clause == "format":
+                statement.format = self._word("format").lower()
+                if statement.format not in OUTPUT_FORMATS:
+                    raise DbValueError(f"format {statement.format}")
+            elif clause == "into":
+                self._expect("outfile", "into outfile")
+                statement.outfile = self._value("into outfile")
+            else:
+                raise DbValueError(self.texts[self.pos - 1])
+        return statement
+
+    #count(*), sum(age), ...
+    def _aggregate(self) -> tuple[str, str | None]:
+        func = self._word("select")
+        self._expect("(", func)
+        if self._skip("*"):
+            column = None
+        else:
+            column = self._word(func)
+        self._expect(")", func)
+        return func, column
+
+    #(<значение>, <значение>, ...)
+    def _values(self, context: str) -> list[Slot]:
+        self._expect("(", context)
+        if self._skip(")"):
+            return []
+        values = [self._value(context)]
+        while self._skip(","):
+            values.append(self._value(context))
+        self._expect(")", context)
+        return values
+
+    def parse_or(self) -> Where:
+        children = [self.parse_and()]
+        while self._skip("or"):
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Junction("or", children)
+
+    def parse_and(self) -> Where:
+        children = [self.parse_atom()]
+        while self._skip("and"):
+            children.append(self.parse_atom())
+        return children[0] if len(children) == 1 else Junction("and", children)
+
+    def parse_atom(self) -> Where:
+        if self._skip("("):
+            node = self.parse_or()
+            self._expect(")", "where")
+            return node
+
+        column = self._word("where")
+        op = self._next("where").lower()
+        if op == "in":
+            values = self._values("where")
+            if not values:
+                raise DbValueError(f"{column} in ()")
+            return Condition(column, "in", values)
+        if self.kinds[self.pos - 1] != _PUNCT or op not in ("=", "!=", "<>", "<", "<=", ">", ">="):
+            raise DbValueError(op)
+        return Condition(column, "!=" if op == "<>" else op, [self._value("where")])
@@ -0,0 +1,262 @@
+"""
+Статистика таблицы: число строк, следующий ID, по столбцам - min/max, число пропусков и
+приблизительное число различных значений (HyperLogLog). Обновляется при каждом изменении
+и хранится в небольшом файле рядом с таблицей: info и планировщик читают ее без строк таблицы
+"""
+
+import base64
+import math
+import zlib
+from collections import Counter
+from typing import Any, Iterable
+
+from .columnar import MISSING, BoolColumn, ColumnarTable, IntColumn, bits_mask, masked_chunks
+from .schema import Schema
+
+_TYPES = {"int": int, "str": str, "bool": bool}
+
+HLL_BITS = 10 #2**10 регистров по байту на столбец: ошибка оценки около 3%
+_HLL_SIZE = 1 << HLL_BITS
+_HLL_REST = 32 - HLL_BITS
+_HLL_ALPHA = 0.7213 / (1 + 1.079 / _HLL_SIZE)
+
+
+#32-битный хеш значения, одинаковый во всех процессах (hash() для строк меняется от запуска к запуску).
+#crc32 перемешивается умножением: иначе у последовательных чисел похожие старшие биты
+def _hash(value: Any) -> int:
+    if type(value) is str:
+        data = value.encode("utf-8", "surrogatepass")
+    elif type(value) is bool:
+        data = b"\x01" if value else b"\x00"
+    else:
+        data = value.to_bytes(8, "little", signed=True)
+    return (zlib.crc32(data) * 0x9E3779B1) & 0xFFFFFFFF
+
+
+class HyperLogLog:
+    """Оценка числа различных значений за постоянную память: регистр хранит максимальное
+    число ведущих нулей хешей, попавших в него"""
+
+    __slots__ = ("registers",)
+
+    def __init__(self, registers: bytearray | None = None):
+        self.registers = registers if registers is not None else bytearray(_HLL_SIZE)
+
+    def add(self, value: Any) -> None:
+        h = _hash(value)
+        index = h >> _HLL_REST
+        rank = _HLL_REST - (h & ((1 << _HLL_REST) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values: Iterable[Any]) -> None:
+        for value in values:
+            self.add(value)
+
+    def estimate(self) -> int:
+        registers = self.registers
+        total = sum(2.0 ** -rank for rank in registers)
+        estimate = _HLL_ALPHA * _HLL_SIZE * _HLL_SIZE / total
+        zeros = registers.count(0)
+        if estimate <= 2.5 * _HLL_SIZE and zeros:
+            estimate = _HLL_SIZE * math.log(_HLL_SIZE / zeros) #мало значений - точнее по пустым регистрам
+        return round(estimate)
+
+
+class ColumnStats:
+    """Статистика столбца. Если удаление или изменение убрало крайнее значение, min/max становятся
+    границами (могут быть шире реальных) до пересчета по таблице - перед сохранением и в info.
+    Число различных значений не уменьшается до пересчета"""
+
+    __slots__ = ("type", "count", "missing", "min", "max", "distinct", "widened")
+
+    def __init__(self, col_type: str, unique: bool = False):
+        self.type = col_type
+        self.count = 0 #строк со значением столбца
+        self.missing = 0 #строк без значения (или со значением не того типа)
+        self.min: Any = None
+        self.max: Any = None
+        self.distinct = None if unique else HyperLogLog() #у ID все значения различны - оценка не нужна
+        self.widened = False #убрано значение, равное min или max: границы могут быть шире реальных
+
+    def accepts(self, value: Any) -> bool:
+        return type(value).__name__ == self.type
+
+    def add(self, value: Any) -> None:
+        if not self.accepts(value):
+            self.missing += 1
+            return
+        self.count += 1
+        self.extend_range(value, value)
+        if self.distinct is not None:
+            self.distinct.add(value)
+
+    def remove(self, value: Any) -> None:
+        if not self.accepts(value):
+            self.missing -= 1
+            return
+        self.count -= 1
+        if value == self.min or value == self.max:
+            self.widened = True
+
+    def extend_range(self, low: Any, high: Any) -> None:
+        if self.min is None or low < self.min:
+            self.min = low
+        if self.max is None or high > self.max:
+            self.max = high
+
+    def add_distinct(self, values: Iterable[Any]) -> None:
+        if self.distinct is not None:
+            self.distinct.update(values)
+
+    def distinct_count(self) -> int:
+        if self.distinct is None:
+            return self.count
+        return min(self.distinct.estimate(), self.count)
+
+    #Доля строк таблицы с этим значением (значения считаются равновероятными)
+    def equal_fraction(self, rows: int) -> float:
+        if not rows or not self.count:
+            return 0.0
+        return self.count / rows / max(1, self.distinct_count())
+
+    #Доля строк, подходящих под сравнение: для чисел - по положению значения между min и max
+    def range_fraction(self, op: str, value: Any, rows: int) -> float:
+        if not rows or not self.count:
+            return 0.0
+        present = self.count / rows
+        if self.type != "int" or type(value) is not int or self.min is None or self.max <= self.min:
+            return present / 3
+        below = min(1.0, max(0.0, (value - self.min) / (self.max - self.min)))
+        return present * (below if op in ("<", "<=") else 1 - below)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "type": self.type,
+            "count": self.count,
+            "missing": self.missing,
+            "min": self.min,
+            "max": self.max,
+            "hll": base64.b64encode(self.distinct.registers).decode("ascii") if self.distinct is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "ColumnStats":
+        stats = cls(data["type"], unique=data["hll"] is None)
+        stats.count = data["count"]
+        stats.missing = data["missing"]
+        stats.min = data["min"]
+        stats.max = data["max"]
+        if data["hll"] is not None:
+            stats.distinct = HyperLogLog(bytearray(base64.b64decode(data["hll"])))
+        return stats
+
+
+class TableStats:
+    """Статистика таблицы: строки, следующий ID и статистика каждого столбца схемы"""
+
+    __slots__ = ("schema", "rows", "next_id", "columns")
+
+    def __init__(self, schema: list[str], next_id: int = 1):
+        self.schema = schema #схема, по которой собрана статистика (список "имя:тип")
+        self.rows = 0
+        self.next_id = next_id
+        parsed = Schema(schema)
+        self.columns = {col.name: ColumnStats(col.type, unique=col.name == "ID") for col in parsed.columns}
+
+    #Пересчет по строкам таблицы: столбцы обрабатываются целиком, как в агрегатах
+    @classmethod
+    def build(cls, table: ColumnarTable, next_id: int) -> "TableStats":
+        stats = cls(table.schema.source, next_id)
+        stats.rows = len(table)
+        size = len(table.live)
+        live = bits_mask(table.live)
+        for name, column_stats in stats.columns.items():
+            column = table.columns[name]
+            if isinstance(column, IntColumn):
+                _build_int(column_stats, column, live & bits_mask(column.present), size)
+            elif isinstance(column, BoolColumn):
+                present = live & bits_mask(column.present)
+                column_stats.count = present.bit_count()
+                trues = (bits_mask(column.values) & present).bit_count()
+                if column_stats.count:
+                    column_stats.extend_range(trues == column_stats.count, trues > 0)
+                    column_stats.add_distinct({trues > 0, trues == column_stats.count})
+            else:
+                codes: Counter[int] = Counter()
+                for chunk in masked_chunks(column.codes, live, size):
+                    codes.update(chunk)
+                codes.pop(-1, None)
+                values = [column.dictionary[code] for code in codes]
+                column_stats.count = sum(codes.values())
+                if values:
+                    column_stats.extend_range(min(values), max(values))
+                    column_stats.add_distinct(values)
+            column_stats.missing = stats.rows - column_stats.count
+        return stats
+
+    #У какого-то столбца убрали крайнее значение - min/max нужно пересчитать по таблице
+    @property
+    def widened(self) -> bool:
+        return any(column_stats.widened for column_stats in self.columns.values())
+
+    def add(self, row: Any) -> None:
+        self.rows += 1
+        for name, column_stats in self.columns.items():
+            column_stats.add(row.get(name, MISSING))
+        self._track_next_id()
+
+    def _track_next_id(self) -> None:
+        id_stats = self.columns.get("ID")
+        if id_stats is not None and id_stats.max is not None and id_stats.max >= self.next_id:
+            self.next_id = id_stats.max + 1
+
+    #Пачка новых записей (массовая загрузка): по каждому столбцу - встроенные min/max по списку
+    def extend(self, records: list[dict[str, Any]]) -> None:
+        self.rows += len(records)
+        for name, column_stats in self.columns.items():
+            value_type = _TYPES[column_stats.type]
+            values = [r.get(name) for r in records]
+            if set(map(type, values)) != {value_type}: #обычно все значения уже приведены к типу столбца
+                values = [v for v in values if type(v) is value_type]
+            column_stats.count += len(values)
+            column_stats.missing += len(records) - len(values)
+            if values:
+                column_stats.extend_range(min(values), max(values))
+                column_stats.add_distinct(set(values))
+        self._track_next_id()
+
+    def remove(self, row: Any) -> None:
+        self.rows -= 1
+        for name, column_stats in self.columns.items():
+            column_stats.remove(row.get(name, MISSING))
+
+    #Значение столбца в строке поменялось с old_value (None - значения не было) на new_value
+    def change(self, column: str, old_value: Any, new_value: Any) -> None:
+        column_stats = self.columns.get(column)
+        if column_stats is None:
+            return
+        column_stats.remove(MISSING if old_value is None else old_value)
+        column_stats.add(new_value)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "schema": self.schema,
+            "rows": self.rows,
+            "next_id": self.next_id,
+            "columns": {name: stats.to_dict() for name, stats in self.columns.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "TableStats":
+        stats = cls(data["schema"], data["next_id"])
+        stats.rows = data["rows"]
+        stats.columns = {name: ColumnStats.from_dict(item) for name, item in data["columns"].items()}
+        return stats
+
+
+def _build_int(stats: ColumnStats, column: IntColumn, mask: int, size: int) -> None:
+    for chunk in masked_chunks(column.values, mask, size):
+        stats.count += len(chunk)
+        stats.extend_range(min(chunk), max(chunk))
+        stats.add_distinct(set(chunk))
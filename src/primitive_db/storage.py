@@ -0,0 +1,666 @@
+"""
+Менеджер таблиц (буферный пул): держит разобранные таблицы и метаданные в памяти между командами.
+Изменения сначала пишутся в журнал (WAL), файлы таблиц переписываются в контрольной точке
+"""
+
+import itertools
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+from .columnar import ColumnarTable, needs_compaction
+from .index import HashIndex, TableIndexes
+from .metrics import METRICS
+from .schema import Schema, get_schema
+from .segments import load_segments_table, save_segments_table
+from .stats import TableStats
+from .utils import (
+    append_table_versions,
+    load_index_data,
+    load_metadata,
+    load_stats_data,
+    load_table,
+    open_binary_table,
+    remove_index_data,
+    remove_stats_data,
+    remove_table_file,
+    save_binary_table,
+    save_index_data,
+    save_metadata,
+    save_stats_data,
+    save_table_data,
+    table_appender,
+    table_filepath,
+    table_format,
+)
+from .wal import FLUSH_OP, WAL_CHECKPOINT_BYTES, WriteAheadLog
+
+DEFAULT_MEMORY_LIMIT = 64 * 1024 * 1024 #лимит памяти под таблицы в байтах (оценка по размеру колонок)
+IDLE_COMPACT_RATIO = 0.1 #в простое сжимаются таблицы, где мусор - хотя бы такая доля строк файла
+
+#Отпечаток файла: по нему видно, что файл поменяли снаружи
+def _file_stamp(filepath: str) -> tuple[int, int] | None:
+    try:
+        st = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+#Двоичная таблица: столбцы остаются в mmap. Если схема в файле не та, что в метаданных
+#(таблицу пересоздали), строки перекладываются под новую схему
+def _load_binary_table(table_name: str, schema: Schema) -> tuple[ColumnarTable, int]:
+    header, sections = open_binary_table(table_name)
+    if header["schema"] == schema.source:
+        table = ColumnarTable.from_buffers(schema, header, sections)
+    else:
+        stored = ColumnarTable.from_buffers(Schema(header["schema"]), header, sections)
+        table = ColumnarTable.from_rows(schema, stored.to_dicts())
+    return table, header.get("next_id", 1)
+
+
+#Статистика из файла годится, если собрана по той же схеме и тому же файлу таблицы
+def _stats_fresh(data: dict[str, Any] | None, schema: Any, stamp: tuple[int, int] | None) -> bool:
+    return (
+        data is not None
+        and stamp is not None
+        and data.get("schema") == schema
+        and data.get("table_stamp") == list(stamp)
+    )
+
+
+#Индекс из файла годится, если построен по тому же столбцу и тому же файлу таблицы: иначе его
+#списки ID могут ссылаться на строки, которых в таблице уже нет или которые изменились
+def _index_fresh(data: dict[str, Any], column: str, stamp: tuple[int, int] | None) -> bool:
+    return stamp is not None and data.get("column") == column and data.get("table_stamp") == list(stamp)
+
+
+class CachedTable:
+    """Таблица в памяти вместе с отпечатком файла и флагом несохраненных изменений"""
+
+    __slots__ = (
+        "name",
+        "data",
+        "format",
+        "stamp",
+        "dirty",
+        "indexes",
+        "stats",
+        "next_id",
+        "mutations",
+        "pending",
+        "file_rows",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        data: ColumnarTable,
+        file_format: str,
+        stamp: tuple[int, int] | None,
+        next_id: int,
+        mutations: int,
+        file_rows: int = 0,
+    ):
+        self.name = name
+        self.data = data
+        #jsonl - журнал с дозаписью, binary - столбцы под mmap, segments - части по диапазонам ID
+        self.format = file_format
+        self.stamp = stamp
+        self.dirty = False
+        self.indexes: TableIndexes | None = None
+        self.stats: TableStats | None = None #None - пересчитать по строкам при следующем обращении
+        self.next_id = next_id #последовательность ID: хранится в заголовке файла таблицы
+        self.mutations = mutations
+        #ID записей, измененных после записи файла: jsonl дописывает их новые версии и надгробия.
+        #None - файл переписывается целиком
+        self.pending: set[int] | None = set()
+        self.file_rows = file_rows #строк с данными в файле jsonl, вместе со старыми версиями и надгробиями
+
+    #Версия таблицы для кэшей: меняется при каждой вставке и каждом изменении
+    @property
+    def version(self) -> tuple[int, int]:
+        return self.next_id, self.mutations
+
+    @property
+    def size(self) -> int:
+        return self.data.nbytes
+
+    #Сколько строк уберет сжатие: в jsonl - старые версии и надгробия в файле (с учетом еще не дописанных
+    #изменений), в двоичных форматах - удаленные строки, которые лежат в файле до сжатия
+    @property
+    def garbage(self) -> int:
+        if self.format == "jsonl":
+            return max(0, self.file_rows + len(self.pending or ()) - len(self.data))
+        return self.data.dead_count
+
+    #Строк в файле вместе с мусором (для доли мусора)
+    @property
+    def stored_rows(self) -> int:
+        return len(self.data) + self.garbage
+
+
+class TableManager:
+    """Кэширует таблицы и метаданные, перечитывает их только при изменении файлов"""
+
+    def __init__(
+        self,
+        meta_filepath: str,
+        memory_limit: int = DEFAULT_MEMORY_LIMIT,
+        wal: WriteAheadLog | None = None,
+        checkpoint_bytes: int = WAL_CHECKPOINT_BYTES,
+    ):
+        self.meta_filepath = meta_filepath
+        self.memory_limit = memory_limit
+        self.wal = wal or WriteAheadLog()
+        self.checkpoint_bytes = checkpoint_bytes
+        self._metadata: dict[str, Any] = {}
+        self._meta_stamp: tuple[int, int] | None = None
+        self._meta_loaded = False
+        self._meta_dirty = False #метаданные новее файла (изменения пока только в журнале)
+        self._tables: OrderedDict[str, CachedTable] = OrderedDict()
+        self._batch = False #в пакетном режиме файлы не перепроверяются: их меняем только мы
+        self._recovered = False
+        self._txn: dict[str, bool] | None = None #открытая транзакция: таблица -> был ли флаг dirty до нее
+        self._clock = itertools.count(1) #общий счетчик изменений, чтобы версии не повторялись
+
+    #Метаданные: перечитываются только если db_meta.json изменился
+    def metadata(self) -> dict[str, Any]:
+        if not self._recovered:
+            self._recover()
+        if self._meta_loaded and (self._batch or self._meta_dirty):
+            return self._metadata
+        stamp = _file_stamp(self.meta_filepath)
+        if not self._meta_loaded or stamp != self._meta_stamp:
+            self._metadata = load_metadata(self.meta_filepath)
+            self._meta_stamp = stamp
+            self._meta_loaded = True
+        return self._metadata
+
+    #Новые метаданные: запись в журнал (op - какая команда их поменяла), файл - в контрольной точке
+    def save_metadata(self, metadata: dict[str, Any], op: str = "metadata") -> None:
+        self.wal.log({"op": op, "metadata": metadata})
+        self._metadata = metadata
+        self._meta_loaded = True
+        self._meta_dirty = True
+
+    #Таблица: из памяти, если файл не менялся с прошлого чтения.
+    #В транзакции у таблицы включается журнал отмены (до того, как команда начнет ее менять)
+    def get_table(self, table_name: str) -> ColumnarTable:
+        cached = self._cached(table_name)
+        if self._txn is not None and table_name not in self._txn:
+            self._txn[table_name] = cached.dirty
+            cached.data.begin_undo()
+        return cached.data
+
+    #Следующий свободный ID (без полного прохода по таблице)
+    def next_id(self, table_name: str) -> int:
+        return self._cached(table_name).next_id
+
+    #Статистика таблицы: из памяти, если таблица загружена, иначе из файла статистики без загрузки строк.
+    #exact=True - min/max точные: если изменения убрали крайнее значение, статистика пересчитывается
+    def table_stats(self, table_name: str, exact: bool = False) -> TableStats:
+        if not self._recovered:
+            self._recover()
+        if table_name not in self._tables:
+            data = load_stats_data(table_name)
+            stamp = _file_stamp(table_filepath(table_name, table_format(table_name)))
+            if _stats_fresh(data, self.metadata().get(table_name), stamp):
+                return TableStats.from_dict(data) #в файл статистика попадает уже пересчитанной
+        cached = self._cached(table_name)
+        stats = self._stats(cached)
+        if exact and stats.widened:
+            stats = self._rebuild_stats(cached)
+        return stats
+
+    def row_count(self, table_name: str) -> int:
+        return self.table_stats(table_name).rows
+
+    #Статистика загруженной таблицы: из файла, если он относится к этому файлу таблицы, иначе
+    #пересчет по строкам (и сохранение, чтобы в следующий раз не пересчитывать)
+    def _stats(self, cached: CachedTable) -> TableStats:
+        if cached.stats is not None:
+            return cached.stats
+        data = load_stats_data(cached.name)
+        if not cached.dirty and _stats_fresh(data, cached.data.schema.source, cached.stamp):
+            cached.stats = TableStats.from_dict(data)
+            return cached.stats
+        self._rebuild_stats(cached)
+        if not cached.dirty:
+            self._save_stats(cached)
+        return cached.stats
+
+    def _rebuild_stats(self, cached: CachedTable) -> TableStats:
+        cached.stats = TableStats.build(cached.data, cached.next_id)
+        if cached.indexes is not None:
+            cached.indexes.stats = cached.stats
+        return cached.stats
+
+    def _save_stats(self, cached: CachedTable) -> None:
+        if cached.stats is None or cached.stamp is None:
+            return
+        if cached.stats.widened:
+            self._rebuild_stats(cached) #в файле - точные min/max
+        cached.stats.next_id = cached.next_id
+        save_stats_data(cached.name, {**cached.stats.to_dict(), "table_stamp": list(cached.stamp)})
+
+    def version(self, table_name: str) -> tuple[int, int]:
+        return self._cached(table_name).version
+
+    #Формат файла таблицы: jsonl, binary или segments
+    def file_format(self, table_name: str) -> str:
+        cached = self._tables.get(table_name)
+        return cached.format if cached is not None else table_format(table_name)
+
+    def _cached(self, table_name: str) -> CachedTable:
+        if not self._recovered:
+            self._recover()
+        cached = self._tables.get(table_name)
+        if cached is not None and (cached.dirty or self._batch):
+            self._tables.move_to_end(table_name)
+            METRICS.add("table_cache", "hits")
+            return cached
+
+        file_format = table_format(table_name)
+        stamp = _file_stamp(table_filepath(table_name, file_format))
+        if cached is not None and cached.format == file_format and cached.stamp == stamp:
+            self._tables.move_to_end(table_name)
+            METRICS.add("table_cache", "hits")
+            return cached
+
+        METRICS.add("table_cache", "misses")
+
+        schema = get_schema(self.metadata(), table_name)
+        file_rows = 0
+        if file_format == "binary":
+            data, next_id = _load_binary_table(table_name, schema)
+        elif file_format == "segments":
+            data, next_id = load_segments_table(table_name, schema)
+        else:
+            header, rows = load_table(table_name)
+            data, next_id, file_rows = ColumnarTable.from_rows(schema, rows), header["next_id"], header["file_rows"]
+        cached = CachedTable(
+            table_name,
+            data,
+            file_format,
+            _file_stamp(table_filepath(table_name, file_format)),
+            next_id,
+            next(self._clock),
+            file_rows,
+        )
+        if data.mapped: #таблица смотрит прямо в файл - его можно проходить параллельно
+            filepath = os.path.abspath(table_filepath(table_name, file_format))
+            data.source_files = [(filepath, cached.stamp, 0, len(data.live))]
+        self._tables[table_name] = cached
+        self._tables.move_to_end(table_name)
+        self._evict()
+        return cached
+
+    #Индексы таблицы: из памяти, из файлов рядом с таблицей или строятся заново
+    def get_indexes(self, table_name: str, columns: list[str]) -> TableIndexes:
+        cached = self._cached(table_name)
+        table = cached.data
+        indexes = cached.indexes
+        if indexes is not None and indexes.columns() == sorted(columns):
+            METRICS.add("index_cache", "hits")
+            return indexes
+
+        if indexes is None:
+            indexes = TableIndexes(table)
+        indexes.stats = self._stats(cached)
+        for column in set(indexes.secondary) - set(columns):
+            del indexes.secondary[column]
+        for column in columns:
+            if column in indexes.secondary:
+                continue
+            data = load_index_data(table_name, column)
+            if data is not None and not cached.dirty and _index_fresh(data, column, cached.stamp):
+                indexes.secondary[column] = HashIndex.from_dict(data)
+                METRICS.add("index_cache", "loads")
+            else:
+                if data is not None:
+                    METRICS.add("index_cache", "stale") #файл индекса есть, но относится к другому файлу таблицы
+                indexes.secondary[column] = HashIndex.build(column, table)
+                indexes.dirty = True
+                METRICS.add("index_cache", "builds")
+
+        cached.indexes = indexes
+        return indexes
+
+    #Записать индексы на диск вместе с отпечатком файла таблицы, к которому они относятся
+    def save_indexes(self, table_name: str) -> None:
+        cached = self._tables.get(table_name)
+        if cached is None or cached.indexes is None or not cached.indexes.dirty:
+            return
+        self.flush(table_name)
+        for column, index in cached.indexes.secondary.items():
+            data = index.to_dict()
+            data["table_stamp"] = list(cached.stamp) if cached.stamp else None
+            save_index_data(table_name, column, data)
+        cached.indexes.dirty = False
+
+    #Удалить индекс из памяти и с диска
+    def drop_index(self, table_name: str, column: str) -> None:
+        cached = self._tables.get(table_name)
+        if cached is not None and cached.indexes is not None:
+            cached.indexes.secondary.pop(column, None)
+        remove_index_data(table_name, column)
+
+    #Изменения строк: сама таблица в памяти уже изменена, здесь - запись в журнал.
+    #Файл таблицы перепишется в контрольной точке
+    def append_row(self, table_name: str, row: dict[str, Any]) -> None:
+        cached = self._log(table_name, {"op": "insert", "table": table_name, "row": row}, [row["ID"]])
+        cached.next_id = max(cached.next_id, row["ID"] + 1)
+
+    def update_rows(self, table_name: str, ids: list[int], values: dict[str, Any]) -> None:
+        self._log(table_name, {"op": "update", "table": table_name, "ids": ids, "values": values}, ids)
+
+    def delete_rows(self, table_name: str, ids: list[int]) -> None:
+        self._log(table_name, {"op": "delete", "table": table_name, "ids": ids}, ids)
+
+    def _log(self, table_name: str, record: dict[str, Any], ids: list[int]) -> CachedTable:
+        cached = self._cached(table_name)
+        self.wal.log(record)
+        if cached.pending is not None:
+            cached.pending.update(ids)
+        cached.dirty = True
+        cached.data.source_files = None #строки в памяти разошлись с файлом
+        cached.mutations = next(self._clock)
+        return cached
+
+    #Конец команды: ее записи уходят в журнал. sync=True - сразу fsync, иначе fsync на группу коммитов.
+    #Когда журнал разрастается - контрольная точка. В транзакции записи копятся до ее commit
+    def commit(self, sync: bool = False) -> None:
+        if self._txn is not None:
+            return
+        self.wal.commit()
+        if sync:
+            self.wal.sync()
+        if self.wal.size > self.checkpoint_bytes:
+            self.checkpoint()
+
+    #fsync уже закоммиченных записей журнала, в том числе когда открыта транзакция: ее записи еще в буфере
+    #и в файл не попадают, а записи команд до нее должны дойти до диска
+    def sync(self) -> None:
+        self.wal.sync()
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._txn is not None
+
+    #Транзакция: изменения команд копятся в памяти (журнал отмены в таблицах, записи для WAL в буфере)
+    def begin(self) -> None:
+        if self._txn is not None:
+            raise ValueError("Транзакция уже начата.")
+        self.wal.commit()
+        self._txn = {}
+
+    #Фиксация: все записи транзакции - одна дозапись в журнал с меткой commit и один fsync
+    def commit_transaction(self) -> None:
+        txn = self._end_transaction()
+        for name in txn:
+            cached = self._tables.get(name)
+            if cached is not None:
+                cached.data.end_undo()
+        self.wal.commit()
+        self.wal.sync()
+        if self.wal.size > self.checkpoint_bytes:
+            self.checkpoint()
+
+    #Откат без обращения к диску: таблицы возвращаются по журналам отмены, записи для WAL выбрасываются.
+    #Индексы измененных таблиц строятся заново при следующем обращении. Возвращает число отмененных изменений
+    def rollback(self) -> int:
+        txn = self._end_transaction()
+        self.wal.discard()
+        undone = 0
+        for name, was_dirty in txn.items():
+            cached = self._tables.get(name)
+            if cached is None:
+                continue
+            changes = cached.data.rollback_undo()
+            if changes:
+                undone += changes
+                cached.dirty = was_dirty
+                cached.indexes = None
+                cached.stats = None
+                cached.mutations = next(self._clock)
+        return undone
+
+    def _end_transaction(self) -> dict[str, bool]:
+        if self._txn is None:
+            raise ValueError("Нет открытой транзакции.")
+        txn, self._txn = self._txn, None
+        return txn
+
+    #Контрольная точка: измененные таблицы и метаданные атомарно пишутся в файлы, журнал очищается.
+    #Во время транзакции откладывается: в файлы не должны попасть незафиксированные изменения
+    def checkpoint(self) -> None:
+        if self._txn is not None:
+            return
+        self.wal.commit()
+        self.flush()
+        self.wal.sync() #отметки flush - на диск: сбой до очистки журнала не накатит записи второй раз
+        if self._meta_dirty:
+            save_metadata(self.meta_filepath, self._metadata)
+            self._meta_stamp = _file_stamp(self.meta_filepath)
+            self._meta_dirty = False
+        if self.wal.size:
+            self.wal.truncate()
+
+    #Восстановление при первом обращении: закоммиченные команды из журнала накатываются
+    #на файлы таблиц, затем контрольная точка. Повтор записи безопасен: строки ищутся по ID.
+    #Записи таблицы до ее последней отметки flush пропускаются - они уже в файле (jsonl дописал бы их
+    #версии в файл еще раз)
+    def _recover(self) -> None:
+        self._recovered = True
+        if not self.wal.size:
+            return
+        records = [record for records in self.wal.transactions() for record in records]
+        flushed = {record["table"]: num for num, record in enumerate(records) if record["op"] == FLUSH_OP}
+        for num, record in enumerate(records):
+            if record["op"] != FLUSH_OP and num > flushed.get(record.get("table"), -1):
+                self._replay(record)
+        self.checkpoint()
+
+    def _replay(self, record: dict[str, Any]) -> None:
+        if "metadata" in record:
+            old = self.metadata()
+            for name in list(self._tables):
+                if record["metadata"].get(name) != old.get(name):
+                    self.discard(name) #таблицу удалили или пересоздали
+            self._metadata = record["metadata"]
+            self._meta_dirty = True
+            return
+
+        table_name = record["table"]
+        if not isinstance(self.metadata().get(table_name), list):
+            return
+        cached = self._cached(table_name)
+        table = cached.data
+        if record["op"] == "insert":
+            row = record["row"]
+            if table.row_by_id(row["ID"]) is None:
+                table.append(row)
+            cached.next_id = max(cached.next_id, row["ID"] + 1)
+        if cached.pending is not None:
+            cached.pending.update([record["row"]["ID"]] if record["op"] == "insert" else record["ids"])
+        if record["op"] == "update":
+            for row in table.rows_by_ids(record["ids"]):
+                for key, value in record["values"].items():
+                    row[key] = value
+        elif record["op"] == "delete":
+            table.delete(list(table.rows_by_ids(record["ids"])))
+        cached.dirty = True
+        table.source_files = None
+        cached.stats = None #строки менялись мимо статистики - пересчитать
+
+    #Массовая дозапись: отдает функцию записи пачек, в конце один fsync и обновление кэша
+    @contextmanager
+    def bulk_append(self, table_name: str) -> Iterator[Callable[[list[dict[str, Any]]], None]]:
+        cached = self._cached(table_name)
+        self.flush(table_name) #файл должен совпадать с памятью: дальше строки дописываются в него напрямую
+        max_id = 0
+
+        def track(rows: list[dict[str, Any]]) -> None:
+            nonlocal max_id
+            if rows:
+                max_id = max(max_id, rows[-1]["ID"])
+
+        if cached.format != "jsonl":
+            yield track #строки уже в памяти, файл переписывается при записи таблицы
+            cached.dirty = True
+            self.flush(table_name)
+        else:
+            with table_appender(table_name, sync=True) as write:
+                def write_batch(rows: list[dict[str, Any]]) -> None:
+                    write(rows)
+                    track(rows)
+                    cached.file_rows += len(rows)
+
+                yield write_batch
+
+            cached.stamp = _file_stamp(table_filepath(table_name))
+        cached.next_id = max(cached.next_id, max_id + 1)
+        cached.mutations = next(self._clock)
+        self._save_stats(cached)
+
+    #Пакет команд: таблицы и метаданные берутся из памяти без проверки файлов
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        self._batch = True
+        try:
+            yield
+        finally:
+            self._batch = False
+
+    #Записать на диск измененные таблицы (все или одну). Их записи в журнале остаются до его очистки,
+    #поэтому каждая записанная таблица отмечается в журнале: восстановление не накатит их на файл повторно
+    def flush(self, table_name: str | None = None) -> None:
+        names = [table_name] if table_name is not None else list(self._tables)
+        for name in names:
+            cached = self._tables.get(name)
+            if cached is None or not cached.dirty:
+                continue
+            if cached.format == "binary":
+                header, sections = cached.data.to_buffers()
+                save_binary_table(name, {**header, "next_id": cached.next_id}, sections)
+            elif cached.format == "segments":
+                save_segments_table(name, cached.data, cached.next_id) #только измененные части
+            elif not self._append_versions(cached):
+                save_table_data(name, cached.data.to_dicts(), {"next_id": cached.next_id})
+                cached.file_rows = len(cached.data)
+            cached.pending = set()
+            filepath = table_filepath(name, cached.format)
+            cached.stamp = _file_stamp(filepath)
+            cached.dirty = False
+            self.wal.mark({"op": FLUSH_OP, "table": name}) #в обход буфера транзакции: rollback ее не отбросит
+            #двоичный файл теперь совпадает с таблицей в памяти - его можно проходить параллельно
+            #(части segments отмечает save_segments_table, jsonl проходится только в этом процессе)
+            if cached.format == "binary":
+                cached.data.source_files = [(os.path.abspath(filepath), cached.stamp, 0, len(cached.data.live))]
+            elif cached.format == "jsonl":
+                cached.data.source_files = None
+            self._save_stats(cached)
+
+    #jsonl: дописать в файл новые версии измененных записей и надгробия удаленных - запись стоит
+    #O(изменений), а не перезаписи таблицы. False - файл нужно переписать целиком: его нет, его поменяли
+    #снаружи или мусора набралось много (тогда перезапись и есть сжатие)
+    def _append_versions(self, cached: CachedTable) -> bool:
+        pending = cached.pending
+        if pending is None or cached.stamp is None or _file_stamp(table_filepath(cached.name)) != cached.stamp:
+            return False
+        if needs_compaction(cached.garbage, cached.stored_rows):
+            METRICS.add("compactions", "threshold")
+            return False
+        rows: list[dict[str, Any]] = []
+        deleted: list[int] = []
+        for row_id in sorted(pending):
+            row = cached.data.row_by_id(row_id)
+            if row is None:
+                deleted.append(row_id)
+            else:
+                rows.append(row.to_dict())
+        cached.file_rows += append_table_versions(cached.name, rows, deleted, {"next_id": cached.next_id})
+        return True
+
+    #Сжатие (vacuum): удаленные строки убираются из памяти, файл переписывается целиком без старых
+    #версий и надгробий. reason - метка в метриках (vacuum, idle). Возвращает, сколько строк мусора убрано
+    def vacuum(self, table_name: str, reason: str = "vacuum") -> int:
+        if self._txn is not None:
+            raise ValueError("Сжатие таблицы недоступно внутри транзакции.")
+        cached = self._cached(table_name)
+        garbage = cached.garbage
+        if cached.data.dead_count:
+            cached.data.compact()
+            cached.data.source_files = None
+            cached.mutations = next(self._clock) #позиции строк поменялись - кэши select устарели
+        if garbage:
+            cached.pending = None
+            cached.dirty = True
+            self.flush(table_name)
+            if cached.indexes is not None:
+                cached.indexes.dirty = True #индексы привязаны к отпечатку файла таблицы
+                self.save_indexes(table_name)
+            METRICS.add("compactions", reason)
+        return garbage
+
+    #Сжатие в простое (сетевой режим, когда нет команд): таблицы в памяти с заметной долей мусора.
+    #Возвращает имена сжатых таблиц
+    def compact_idle(self) -> list[str]:
+        if self._txn is not None:
+            return []
+        names = [
+            name
+            for name, cached in self._tables.items()
+            if needs_compaction(cached.garbage, cached.stored_rows, IDLE_COMPACT_RATIO)
+        ]
+        for name in names:
+            self.vacuum(name, "idle")
+        return names
+
+    #Перевести таблицу в другой формат: записать новый файл, удалить старый, пересохранить индексы
+    #(они привязаны к отпечатку файла таблицы). Возвращает прежний формат
+    def convert(self, table_name: str, file_format: str) -> str:
+        cached = self._cached(table_name)
+        old_format = cached.format
+        if old_format == file_format:
+            return old_format
+
+        cached.format = file_format
+        cached.dirty = True
+        cached.pending = None
+        cached.data.changed = None #новый файл пишется целиком
+        self.flush(table_name)
+        remove_table_file(table_name, old_format)
+        if cached.indexes is not None:
+            cached.indexes.dirty = True
+            self.save_indexes(table_name)
+        return old_format
+
+    #Сохранить все: контрольная точка и индексы (при выходе). Незавершенная транзакция откатывается
+    def close(self) -> None:
+        if self._txn is not None:
+            self.rollback()
+        self.checkpoint()
+        for name in list(self._tables):
+            self.save_indexes(name)
+        self.wal.close()
+
+    #Забыть таблицу (например, после drop_table); статистика старой таблицы больше не нужна
+    def discard(self, table_name: str) -> None:
+        self._tables.pop(table_name, None)
+        remove_stats_data(table_name)
+
+    #Вытеснение давно не использованных таблиц при превышении лимита памяти
+    def _evict(self) -> None:
+        total = sum(t.size for t in self._tables.values())
+        #самую свежую таблицу и таблицы открытой транзакции не трогаем
+        candidates = [name for name in list(self._tables)[:-1] if self._txn is None or name not in self._txn]
+        for name in candidates:
+            if total <= self.memory_limit:
+                break
+            cached = self._tables[name]
+            self.flush(name)
+            self.save_indexes(name)
+            del self._tables[name]
+            total -= cached.size
@@ -1,34 +1,421 @@
+import csv
 import json
+import mmap
 import os
-from typing import Any
+import shutil
+import struct
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator
+
+from .metrics import METRICS
 
 DATA_DIR = "data" #добавлена папка для хранения
 
+TABLE_EXT = ".jsonl" #таблица хранится как журнал JSON Lines (одна запись - одна строка)
+LEGACY_TABLE_EXT = ".json" #старый формат - один JSON-массив на весь файл
+HEADER_KEY = "__header__" #служебная строка журнала (счетчик ID и т.п.): первая и после каждой дозаписи версий
+TOMBSTONE_KEY = "__deleted__" #строка-надгробие: ID записей, удаленных после их последней версии в файле
+
+BINARY_TABLE_EXT = ".tbl" #двоичный формат: заголовок, столбцы фиксированной ширины и куча строк
+BINARY_MAGIC = b"PDBT"
+BINARY_VERSION = 1
+BINARY_PAGE_SIZE = 4096 #крупные секции выровнены по страницам: чтение столбца не задевает соседние
+_BINARY_PREFIX = struct.Struct("<4sHHQIQ") #метка, версия, резерв, число строк, длина заголовка, начало данных
+
+SEGMENTS_DIR_EXT = ".seg" #формат segments: папка с частями таблицы в двоичном формате и манифестом
+SEGMENTS_MANIFEST = "manifest.json"
+
 #Функция для загрузки данных из JSON
 def load_metadata(filepath: str) -> dict[str, Any]:
     try:
         with open(filepath, encoding="utf-8") as f:
+            METRICS.add_file_size("bytes_read", "metadata", f)
             return json.load(f)
     except FileNotFoundError:
         return {}
 
-#Функция сохранения данных в JSON
+#Функция сохранения данных в JSON (через временный файл: при сбое остается старая версия)
 def save_metadata(filepath: str, data: dict[str, Any]) -> None:
-    with open(filepath, "w", encoding="utf-8") as f:
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+        _sync(f)
+        METRICS.add_file_size("bytes_written", "metadata", f)
+    os.replace(tmp_path, filepath)
+
+#Данные файла - на диск до переименования (иначе после сбоя можно получить пустой файл)
+def _sync(f: Any) -> None:
+    f.flush()
+    os.fsync(f.fileno())
+
+#Путь к файлу таблицы (jsonl или binary; у segments - к манифесту)
+def table_filepath(table_name: str, file_format: str = "jsonl") -> str:
+    if file_format == "segments":
+        return os.path.join(segments_dirpath(table_name), SEGMENTS_MANIFEST)
+    ext = BINARY_TABLE_EXT if file_format == "binary" else TABLE_EXT
+    return os.path.join(DATA_DIR, f"{table_name}{ext}")
+
+#Папка с частями таблицы в формате segments
+def segments_dirpath(table_name: str) -> str:
+    return os.path.join(DATA_DIR, f"{table_name}{SEGMENTS_DIR_EXT}")
+
+#Формат, в котором таблица лежит на диске
+def table_format(table_name: str) -> str:
+    for file_format in ("binary", "segments"):
+        if os.path.exists(table_filepath(table_name, file_format)):
+            return file_format
+    return "jsonl"
+
+#Удаление файла таблицы в одном из форматов
+def remove_table_file(table_name: str, file_format: str) -> None:
+    if file_format == "segments":
+        shutil.rmtree(segments_dirpath(table_name), ignore_errors=True)
+        return
+    try:
+        os.remove(table_filepath(table_name, file_format))
+    except FileNotFoundError:
+        pass
+
+#Размер таблицы на диске в байтах (у segments - всех файлов папки)
+def table_file_size(table_name: str, file_format: str) -> int:
+    if file_format != "segments":
+        return os.path.getsize(table_filepath(table_name, file_format))
+    with os.scandir(segments_dirpath(table_name)) as entries:
+        return sum(entry.stat().st_size for entry in entries if entry.is_file())
+
+_ROW_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+#Одна запись в виде строки журнала
+def _encode_row(row: dict[str, Any]) -> str:
+    return _ROW_ENCODER.encode(row) + "\n"
+
+#Перевод старой таблицы-массива .json в журнал .jsonl (один раз, при первом открытии)
+def _migrate_legacy_table(table_name: str) -> None:
+    legacy_path = os.path.join(DATA_DIR, f"{table_name}{LEGACY_TABLE_EXT}")
+    if os.path.exists(table_filepath(table_name)) or not os.path.exists(legacy_path):
+        return
+
+    with open(legacy_path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    save_table_data(table_name, data)
+    os.remove(legacy_path)
 
 #Функция вызова таблицы
 def load_table_data(table_name: str) -> list[dict[str, Any]]:
-    filepath = os.path.join(DATA_DIR, f"{table_name}.json")
+    return load_table(table_name)[1]
+
+#Заголовок и строки таблицы. Журнал может содержать несколько версий одной записи (по ID): последняя
+#заменяет прежние на их месте, надгробие {"__deleted__": [ID...]} убирает записи. Строки {"__header__": {...}}
+#обновляют заголовок; next_id в нем сверяется с ID всех версий. В заголовке возвращается и file_rows -
+#число строк с данными в файле (вместе со старыми версиями и надгробиями: по нему считается доля мусора)
+def load_table(table_name: str) -> tuple[dict[str, Any], list[dict[str, Any]]]:
+    _migrate_legacy_table(table_name)
+    filepath = table_filepath(table_name)
+    header: dict[str, Any] = {"next_id": 1}
     try:
         with open(filepath, encoding="utf-8") as f:
+            METRICS.add_file_size("bytes_read", "table", f)
+            lines = f.readlines()
+    except FileNotFoundError:
+        header["file_rows"] = 0
+        return header, []
+
+    data: list[dict[str, Any] | None] = []
+    positions: dict[int, int] | None = None #ID -> место в data; строится, только если встретились версии
+    max_id = 0
+    file_rows = 0
+    for num, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            if num == len(lines):
+                break #недописанная последняя строка после сбоя - пропускаем
+            raise
+        if HEADER_KEY in row:
+            header.update(row[HEADER_KEY])
+            file_rows += num > 1
+            continue
+        file_rows += 1
+        if TOMBSTONE_KEY in row:
+            positions = positions if positions is not None else _row_positions(data)
+            for row_id in row[TOMBSTONE_KEY]:
+                pos = positions.pop(row_id, None)
+                if pos is not None:
+                    data[pos] = None
+            continue
+        row_id = row.get("ID")
+        if type(row_id) is not int:
+            data.append(row)
+            continue
+        if row_id > max_id: #обычный случай: ID растут - новая запись
+            max_id = row_id
+            if positions is not None:
+                positions[row_id] = len(data)
+            data.append(row)
+            continue
+        positions = positions if positions is not None else _row_positions(data)
+        pos = positions.get(row_id)
+        if pos is not None:
+            data[pos] = row #новая версия записи встает на место прежней
+            continue
+        positions[row_id] = len(data)
+        data.append(row)
+
+    header["next_id"] = max(header["next_id"], max_id + 1)
+    header["file_rows"] = file_rows
+    rows = data if positions is None else [row for row in data if row is not None]
+    return header, rows
+
+def _row_positions(data: list[dict[str, Any] | None]) -> dict[int, int]:
+    return {row["ID"]: pos for pos, row in enumerate(data) if row is not None and type(row.get("ID")) is int}
+
+#Функция сохранения таблицы (полная перезапись через временный файл)
+def save_table_data(
+    table_name: str,
+    data: Iterable[dict[str, Any]],
+    header: dict[str, Any] | None = None,
+) -> None:
+    os.makedirs(DATA_DIR, exist_ok=True)
+    filepath = table_filepath(table_name)
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        if header is not None:
+            f.write(_encode_row({HEADER_KEY: header}))
+        f.writelines(_encode_row(row) for row in data)
+        _sync(f)
+        METRICS.add_file_size("bytes_written", "table", f)
+    os.replace(tmp_path, filepath)
+
+#Дозапись изменений в журнал таблицы вместо перезаписи: новые версии строк, надгробие удаленных ID
+#и заголовок с текущим next_id. Возвращает число дописанных строк
+def append_table_versions(
+    table_name: str,
+    rows: list[dict[str, Any]],
+    deleted_ids: list[int],
+    header: dict[str, Any],
+) -> int:
+    lines = rows + ([{TOMBSTONE_KEY: deleted_ids}] if deleted_ids else []) + [{HEADER_KEY: header}]
+    with table_appender(table_name, sync=True) as write:
+        write(lines)
+    return len(lines)
+
+#Смещение, выровненное для секции: от страницы и больше - по странице, меньше - по 8 байт
+def _align(offset: int, size: int) -> int:
+    step = BINARY_PAGE_SIZE if size >= BINARY_PAGE_SIZE else 8
+    return -(-offset // step) * step
+
+#Двоичная таблица: префикс фиксированной длины, JSON-заголовок (схема, смещения секций),
+#затем секции. Смещения секций считаются от начала данных
+def save_binary_table(table_name: str, header: dict[str, Any], sections: dict[str, Any]) -> None:
+    os.makedirs(DATA_DIR, exist_ok=True)
+    save_binary_file(table_filepath(table_name, "binary"), header, sections)
+
+#Двоичная таблица по пути к файлу (отдельной таблицей пишется и каждая часть формата segments)
+def save_binary_file(
+    filepath: str,
+    header: dict[str, Any],
+    sections: dict[str, Any],
+    kind: str = "binary_table",
+) -> None:
+    layout: dict[str, list[int]] = {}
+    offset = 0
+    for name, buf in sections.items():
+        size = memoryview(buf).nbytes
+        offset = _align(offset, size)
+        layout[name] = [offset, size]
+        offset += size
+
+    header_bytes = json.dumps({**header, "sections": layout}, ensure_ascii=False).encode("utf-8")
+    data_start = _align(_BINARY_PREFIX.size + len(header_bytes), offset)
+
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(
+            _BINARY_PREFIX.pack(
+                BINARY_MAGIC, BINARY_VERSION, 0, header["rows"], len(header_bytes), data_start
+            )
+        )
+        f.write(header_bytes)
+        for name, buf in sections.items():
+            f.seek(data_start + layout[name][0])
+            f.write(buf)
+        _sync(f)
+        METRICS.add_file_size("bytes_written", kind, f)
+    os.replace(tmp_path, filepath)
+
+#Открывает двоичную таблицу через mmap: заголовок и секции как memoryview без копирования.
+#Страницы читаются с диска только при обращении к ним. Отображение копируемое (ACCESS_COPY):
+#изменения в памяти не попадают в файл
+def open_binary_table(table_name: str) -> tuple[dict[str, Any], dict[str, memoryview]]:
+    return open_binary_file(table_filepath(table_name, "binary"), table_name)
+
+#То же по пути к файлу (процессы параллельного прохода открывают файл сами)
+def open_binary_file(filepath: str, table_name: str) -> tuple[dict[str, Any], dict[str, memoryview]]:
+    with open(filepath, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    METRICS.add("bytes_mapped", "binary_table", len(mapped)) #с диска читаются только затронутые страницы
+
+    view = memoryview(mapped)
+    if len(view) < _BINARY_PREFIX.size:
+        raise ValueError(f'Файл таблицы "{table_name}" поврежден.')
+    magic, version, _, _, header_len, data_start = _BINARY_PREFIX.unpack_from(view)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError(f'Файл таблицы "{table_name}" имеет неизвестный формат.')
+
+    header = json.loads(bytes(view[_BINARY_PREFIX.size : _BINARY_PREFIX.size + header_len]))
+    sections = {
+        name: view[data_start + offset : data_start + offset + size]
+        for name, (offset, size) in header.pop("sections").items()
+    }
+    return header, sections
+
+#Манифест таблицы в формате segments (None - таблица еще не записана в этом формате)
+def load_segments_manifest(table_name: str) -> dict[str, Any] | None:
+    try:
+        with open(table_filepath(table_name, "segments"), encoding="utf-8") as f:
+            METRICS.add_file_size("bytes_read", "segments", f)
             return json.load(f)
     except FileNotFoundError:
-        return []
+        return None
+
+#Манифест заменяется целиком через временный файл: части, на которые он ссылается, уже на диске
+def save_segments_manifest(table_name: str, manifest: dict[str, Any]) -> None:
+    filepath = table_filepath(table_name, "segments")
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"))
+        _sync(f)
+        METRICS.add_file_size("bytes_written", "segments", f)
+    os.replace(tmp_path, filepath)
+
+#Путь к файлу части таблицы в формате segments
+def segment_filepath(table_name: str, filename: str) -> str:
+    return os.path.join(segments_dirpath(table_name), filename)
 
-#Функция сохранения таблицы
-def save_table_data(table_name: str, data: list[dict[str, Any]]) -> None:
+#Удаление частей, на которые манифест больше не ссылается (и недописанных временных файлов)
+def remove_segment_files(table_name: str, keep: set[str]) -> None:
+    keep = keep | {SEGMENTS_MANIFEST}
+    with os.scandir(segments_dirpath(table_name)) as entries:
+        stale = [entry.path for entry in entries if entry.name not in keep]
+    for path in stale:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+#Открывает журнал таблицы на дозапись и отдает функцию записи пачки строк.
+#sync=True - в конце fsync (массовая загрузка: одна надежная запись на весь файл)
+@contextmanager
+def table_appender(
+    table_name: str,
+    sync: bool = False,
+) -> Iterator[Callable[[list[dict[str, Any]]], None]]:
+    _migrate_legacy_table(table_name)
     os.makedirs(DATA_DIR, exist_ok=True)
-    filepath = os.path.join(DATA_DIR, f"{table_name}.json")
+    with open(table_filepath(table_name), "a+b") as f:
+        if f.seek(0, os.SEEK_END) > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n") #закрываем оборванную строку, чтобы не склеить записи
+
+        def write(rows: list[dict[str, Any]]) -> None:
+            chunk = "".join(map(_encode_row, rows)).encode("utf-8")
+            f.write(chunk)
+            METRICS.add("bytes_written", "table", len(chunk))
+
+        yield write
+        f.flush()
+        if sync:
+            os.fsync(f.fileno())
+
+#Построчное чтение файла для загрузки: (номер строки, запись).
+#Для jsonl битая строка отдается как есть (str), чтобы ее можно было отклонить
+def iter_import_file(filepath: str, file_format: str) -> Iterator[tuple[int, Any]]:
+    with open(filepath, encoding="utf-8", newline="") as f:
+        METRICS.add_file_size("bytes_read", "import", f)
+        if file_format == "csv":
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+            return
+
+        for num, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield num, json.loads(line)
+            except json.JSONDecodeError:
+                yield num, line
+
+#Файл для отклоненных строк загрузки (JSON Lines: номер строки, причина, исходная запись)
+def save_rejected_rows(filepath: str, rejected: list[tuple[int, Any, str]]) -> None:
     with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+        for num, record, reason in rejected:
+            f.write(_encode_row({"line": num, "error": reason, "row": record}))
+
+#Путь к файлу индекса (лежит рядом с таблицей)
+def index_filepath(table_name: str, column: str) -> str:
+    return os.path.join(DATA_DIR, f"{table_name}.{column}.idx.json")
+
+#Функция загрузки индекса
+def load_index_data(table_name: str, column: str) -> dict[str, Any] | None:
+    try:
+        with open(index_filepath(table_name, column), encoding="utf-8") as f:
+            METRICS.add_file_size("bytes_read", "index", f)
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+#Функция сохранения индекса
+def save_index_data(table_name: str, column: str, data: dict[str, Any]) -> None:
+    os.makedirs(DATA_DIR, exist_ok=True)
+    filepath = index_filepath(table_name, column)
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        METRICS.add_file_size("bytes_written", "index", f)
+    os.replace(tmp_path, filepath)
+
+#Удаление файла индекса
+def remove_index_data(table_name: str, column: str) -> None:
+    try:
+        os.remove(index_filepath(table_name, column))
+    except FileNotFoundError:
+        pass
+
+#Путь к файлу статистики таблицы (лежит рядом с таблицей)
+def stats_filepath(table_name: str) -> str:
+    return os.path.join(DATA_DIR, f"{table_name}.stats.json")
+
+#Функция загрузки статистики таблицы
+def load_stats_data(table_name: str) -> dict[str, Any] | None:
+    try:
+        with open(stats_filepath(table_name), encoding="utf-8") as f:
+            METRICS.add_file_size("bytes_read", "stats", f)
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+#Функция сохранения статистики таблицы
+def save_stats_data(table_name: str, data: dict[str, Any]) -> None:
+    os.makedirs(DATA_DIR, exist_ok=True)
+    filepath = stats_filepath(table_name)
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        METRICS.add_file_size("bytes_written", "stats", f)
+    os.replace(tmp_path, filepath)
+
+#Удаление файла статистики таблицы
+def remove_stats_data(table_name: str) -> None:
+    try:
+        os.remove(stats_filepath(table_name))
+    except FileNotFoundError:
+        pass
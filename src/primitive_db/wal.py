@@ -0,0 +1,124 @@
+"""
+Журнал упреждающей записи (WAL): изменения дописываются в data/wal.jsonl раньше, чем попадают в файлы таблиц
+"""
+
+import json
+import os
+import time
+from typing import Any, BinaryIO, Iterator
+
+from .metrics import METRICS
+from .utils import DATA_DIR
+
+WAL_FILENAME = "wal.jsonl"
+WAL_GROUP_COMMIT = 32 #сколько коммитов копится до одного fsync (в интерактивном режиме - fsync на каждую команду)
+WAL_CHECKPOINT_BYTES = 16 * 1024 * 1024 #журнал больше этого размера сбрасывается контрольной точкой
+
+COMMIT_OP = "commit"
+FLUSH_OP = "flush" #таблицу записали в файл: ее записи выше уже в файле
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+_COMMIT_LINE = _ENCODER.encode({"op": COMMIT_OP}) + "\n"
+
+
+class WriteAheadLog:
+    """Журнал изменений: записи команды и метка commit дописываются в конец одним куском,
+    fsync - один на группу коммитов"""
+
+    def __init__(self, filepath: str | None = None, group_size: int = WAL_GROUP_COMMIT):
+        self.filepath = filepath or os.path.join(DATA_DIR, WAL_FILENAME)
+        self.group_size = group_size
+        self._records: list[str] = [] #записи текущей, еще не закоммиченной команды
+        self._file: BinaryIO | None = None
+        self._unsynced = 0 #коммитов после последнего fsync
+        self.commits = 0
+        self.syncs = 0
+
+    def log(self, record: dict[str, Any]) -> None:
+        self._records.append(_ENCODER.encode(record) + "\n")
+
+    #Записи команды и метка commit уходят в файл; при восстановлении без метки они не применяются
+    def commit(self) -> None:
+        if not self._records:
+            return
+        self._records.append(_COMMIT_LINE)
+        chunk = "".join(self._records).encode("utf-8")
+        self._open().write(chunk)
+        self._records.clear()
+        METRICS.add("bytes_written", "wal", len(chunk))
+        self._unsynced += 1
+        self.commits += 1
+        if self._unsynced >= self.group_size:
+            self.sync()
+
+    #Служебная запись (отметка flush) сразу в файл отдельной группой с меткой commit: не смешивается
+    #с записями текущей команды или транзакции и не пропадает, если их отбросят
+    def mark(self, record: dict[str, Any]) -> None:
+        chunk = (_ENCODER.encode(record) + "\n" + _COMMIT_LINE).encode("utf-8")
+        self._open().write(chunk)
+        METRICS.add("bytes_written", "wal", len(chunk))
+        self._unsynced += 1
+
+    #Отбросить записи незакоммиченной команды
+    def discard(self) -> None:
+        self._records.clear()
+
+    def sync(self) -> None:
+        if self._file is None or not self._unsynced:
+            return
+        start = time.perf_counter_ns()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        METRICS.observe("io", "wal_fsync", time.perf_counter_ns() - start)
+        self._unsynced = 0
+        self.syncs += 1
+
+    @property
+    def size(self) -> int:
+        if self._file is not None:
+            return self._file.tell()
+        try:
+            return os.path.getsize(self.filepath)
+        except FileNotFoundError:
+            return 0
+
+    #Закоммиченные команды по порядку (для восстановления). Хвост без commit и оборванная строка пропускаются
+    def transactions(self) -> Iterator[list[dict[str, Any]]]:
+        try:
+            f = open(self.filepath, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            METRICS.add_file_size("bytes_read", "wal", f)
+            records: list[dict[str, Any]] = []
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if record.get("op") == COMMIT_OP:
+                    yield records
+                    records = []
+                else:
+                    records.append(record)
+
+    #Очистка после контрольной точки: все изменения уже в файлах таблиц
+    def truncate(self) -> None:
+        f = self._open()
+        f.seek(0)
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+        self._unsynced = 0
+
+    def close(self) -> None:
+        self.sync()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self) -> BinaryIO:
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+            self._file = open(self.filepath, "ab")
+        return self._file
@@ -0,0 +1,78 @@
+"""
+Восстановление по журналу после сбоя: записи, уже попавшие в файл таблицы, не дописываются в него снова
+"""
+
+import contextlib
+import io
+import os
+import unittest
+
+from src.primitive_db import engine
+from src.primitive_db.storage import TableManager
+
+from .util import use_temp_database
+
+
+def _file_lines(table_name: str) -> list[str]:
+    with open(os.path.join("data", f"{table_name}.jsonl"), encoding="utf-8") as f:
+        return f.readlines()
+
+
+class RecoveryTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tables = use_temp_database(self)
+
+    def run_commands(self, *commands: str) -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for command in commands:
+                engine.execute(command)
+                self.tables.commit()
+
+    #Сбой: журнал на диске, но процесс завершился без контрольной точки. Новый менеджер восстанавливается
+    def recover(self) -> list[str]:
+        self.tables.wal.close()
+        TableManager(engine.META_FILEPATH).metadata()
+        return _file_lines("t")
+
+    def test_crash_after_create_index(self) -> None:
+        self.run_commands(
+            "create_table t name:str age:int",
+            'insert into t values ("a", 1)',
+            'update t set age = 10 where name = "a"',
+            "create_index t age",
+        )
+        flushed = _file_lines("t")
+        self.assertEqual(self.recover(), flushed)
+
+    #Контрольная точка дописала версии в файлы, но журнал очистить не успела
+    def test_crash_between_checkpoint_flush_and_truncate(self) -> None:
+        self.run_commands("create_table t name:str age:int", 'insert into t values ("a", 1)')
+        self.tables.checkpoint()
+        self.run_commands('update t set age = 2 where name = "a"', 'insert into t values ("b", 3)')
+        self.tables.wal.commit()
+        self.tables.flush()
+        self.tables.wal.sync()
+        flushed = _file_lines("t")
+        self.assertEqual(self.recover(), flushed)
+
+    #Вытеснение записывает таблицу вне транзакции, а транзакцию потом отменяют: отметка flush остается
+    def test_eviction_flush_survives_rollback(self) -> None:
+        self.run_commands(
+            "create_table t name:str age:int",
+            "create_table u x:int",
+            "create_table v x:int",
+            'insert into t values ("a", 1)',
+            "insert into u values (1)",
+        )
+        self.tables.checkpoint()
+        self.run_commands('update t set age = 5 where name = "a"')
+        self.tables.memory_limit = 1 #любая загрузка вытесняет остальные таблицы
+        #загрузка v в транзакции вытесняет t (u занята транзакцией)
+        self.run_commands("begin", "insert into u values (2)", "select from v", "rollback")
+        flushed = _file_lines("t")
+        self.assertIn('{"ID":1,"name":"a","age":5}\n', flushed)
+        self.assertEqual(self.recover(), flushed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+"""
+Сетевой режим: подтверждение записей и fsync журнала
+"""
+
+import asyncio
+import unittest
+from unittest import mock
+
+from src.primitive_db.server import DatabaseServer
+
+from .util import use_temp_database
+
+
+class WriteAcknowledgementTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.tables = use_temp_database(self)
+        self.server = DatabaseServer()
+        self.addCleanup(self.server.close)
+        await self.server.run_command(object(), "create_table users name:str age:int")
+
+    #Другое подключение открывает транзакцию между записью и ее fsync: запись все равно дожидается fsync
+    async def test_write_is_synced_when_transaction_begins_before_ack(self) -> None:
+        writer, other = object(), object()
+        syncs = self.tables.wal.syncs
+
+        async def write() -> tuple[str, int]:
+            output = await self.server.run_command(writer, 'insert into users values ("Ann", 30)')
+            return output, self.tables.wal.syncs
+
+        (output, synced), _ = await asyncio.gather(write(), self.server.run_command(other, "begin"))
+        self.assertIn("успешно добавлена", output)
+        self.assertTrue(self.tables.in_transaction)
+        self.assertGreater(synced, syncs)
+        await self.server.run_command(other, "rollback")
+
+    async def test_failed_fsync_is_reported_to_client(self) -> None:
+        with mock.patch.object(self.tables, "sync", side_effect=OSError("нет места на диске")):
+            output = await self.server.run_command(object(), 'insert into users values ("Bob", 40)')
+        self.assertIn("fsync журнала не удался: нет места на диске", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
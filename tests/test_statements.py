@@ -0,0 +1,52 @@
+"""
+Разбор команд: кавычки и экранирование в литералах и в пакетах команд
+"""
+
+import contextlib
+import io
+import json
+import unittest
+
+from src.primitive_db.engine import run_batch, split_statements
+
+from .util import use_temp_database
+
+
+class SplitStatementsTest(unittest.TestCase):
+    def test_escaped_quote_does_not_end_string(self) -> None:
+        text = 'insert into t values ("a\\"b; c", 1); select from t; select from t where name = \'x\\\'y;\''
+        self.assertEqual(
+            split_statements(text),
+            ['insert into t values ("a\\"b; c", 1)', "select from t", "select from t where name = 'x\\'y;'"],
+        )
+
+    def test_escaped_backslash_ends_before_quote(self) -> None:
+        self.assertEqual(
+            split_statements('select from t where name = "a\\\\"; list_tables'),
+            ['select from t where name = "a\\\\"', "list_tables"],
+        )
+
+
+class EscapedLiteralBatchTest(unittest.TestCase):
+    def setUp(self) -> None:
+        use_temp_database(self)
+
+    #Пакет с экранированной кавычкой: все команды выполняются, в значении нет обратной косой черты
+    def test_batch_with_escaped_quote(self) -> None:
+        script = (
+            "create_table t name:str n:int; "
+            'insert into t values ("a\\"b; c", 1); '
+            "insert into t values ('back\\\\slash', 2); "
+            'select from t where name = "a\\"b; c" format jsonl; '
+            "select from t where n = 2 format jsonl"
+        )
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            executed = run_batch(split_statements(script))
+        self.assertEqual(executed, 5)
+        rows = [json.loads(line) for line in output.getvalue().splitlines() if line.startswith("{")]
+        self.assertEqual(rows, [{"ID": 1, "name": 'a"b; c', "n": 1}, {"ID": 2, "name": "back\\slash", "n": 2}])
+
+
+if __name__ == "__main__":
+    unittest.main()
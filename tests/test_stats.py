@@ -0,0 +1,55 @@
+"""
+Статистика таблиц: min/max после удаления и изменения крайних значений
+"""
+
+import contextlib
+import io
+import unittest
+
+from src.decorators import set_confirm_policy
+from src.primitive_db.columnar import ColumnarTable
+from src.primitive_db.engine import run_batch
+from src.primitive_db.schema import Schema
+from src.primitive_db.stats import TableStats
+
+from .util import use_temp_database
+
+
+class ColumnRangeTest(unittest.TestCase):
+    def test_removing_bound_marks_range_widened(self) -> None:
+        table = ColumnarTable.from_rows(Schema(["ID:int", "age:int"]), [{"ID": 1, "age": 1}, {"ID": 2, "age": 5}])
+        stats = TableStats.build(table, 3)
+        self.assertFalse(stats.widened)
+        stats.change("age", 3, 4) #не крайнее значение - границы точные
+        self.assertFalse(stats.widened)
+        stats.change("age", 1, 2)
+        self.assertTrue(stats.columns["age"].widened)
+
+
+class InfoRangeTest(unittest.TestCase):
+    def setUp(self) -> None:
+        use_temp_database(self)
+        set_confirm_policy(True) #delete без вопроса, как с --yes
+        self.addCleanup(set_confirm_policy, None)
+
+    #info показывает min/max, которые есть в таблице, а не прежние границы
+    def test_info_after_update_and_delete(self) -> None:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_batch([
+                "create_table t name:str age:int",
+                'insert into t values ("A", 1)',
+                'insert into t values ("B", 5)',
+                'insert into t values ("C", 9)',
+                'update t set name = "Z" where name = "A"',
+                "delete from t where age = 9",
+                "info t",
+            ])
+        rows = {line.split("|")[1].strip(): line.split("|")[2:4] for line in output.getvalue().splitlines()
+                if line.startswith("|")}
+        self.assertEqual([cell.strip() for cell in rows["name"]], ["B", "Z"])
+        self.assertEqual([cell.strip() for cell in rows["age"]], ["1", "5"])
+
+
+if __name__ == "__main__":
+    unittest.main()
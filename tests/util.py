@@ -0,0 +1,25 @@
+"""
+Общее для тестов: база во временной папке вместо data/ текущего каталога
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src.primitive_db import engine
+from src.primitive_db.storage import TableManager
+
+
+#Движок теста работает с пустой базой во временной папке; все возвращается при очистке теста
+def use_temp_database(test: unittest.TestCase) -> TableManager:
+    tmp = tempfile.TemporaryDirectory()
+    test.addCleanup(tmp.cleanup)
+    test.addCleanup(os.chdir, os.getcwd())
+    os.chdir(tmp.name)
+    tables = TableManager(engine.META_FILEPATH)
+    patcher = mock.patch.object(engine, "_TABLES", tables)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    test.addCleanup(tables.wal.close)
+    return tables